@@ -52,6 +52,18 @@ hiddenimports = [
     'gsm_instance',
     'controller',
     'export_excel',
+    'model_manager',
+    'stt_process_pool',
+    'model_backends',
+    'keyword_spotter',
+    'stt_cache',
+    'keyword_rules',
+    'serial_capture',
+    'call_trace',
+    'metrics',
+    'result_store',
+    'http.server',
+    'multiprocessing.shared_memory',
     # Concurrent processing
     'concurrent.futures',
     'concurrent.futures.thread',
@@ -0,0 +1,87 @@
+"""
+Benchmark KeywordMatcher (Aho–Corasick) so với vòng lặp substring cũ
+Đo với bảng từ khóa hiện tại và với bảng từ khóa được mở rộng (thêm cụm từ giả lập)
+
+Usage:
+    python benchmark_keyword_matcher.py --texts 20000 --extra-keywords 0 200 1000
+"""
+
+import argparse
+import random
+import time
+
+from string_detection import KeywordMatcher, keyword_labels, labels, MAX_WAITING_TONE
+
+
+def make_loop_classifier(label_keywords):
+    """
+    Bản tham chiếu: vòng lặp substring lồng nhau (cách keyword_in_text tìm trước khi có KeywordMatcher),
+    với bảng từ khóa tùy ý. Kết quả của KeywordMatcher phải trùng với hàm này
+    """
+    mute = labels.index("mute")
+    waiting_tone = labels.index("waiting_tone")
+    ringback_tone = labels.index("ringback_tone")
+
+    def classify(input_text):
+        input_text = input_text.lower()
+        if input_text.strip() == "":
+            return mute
+        if len(input_text) <= MAX_WAITING_TONE:
+            return waiting_tone
+        for i, kws in enumerate(label_keywords):
+            for kw in kws:
+                if kw in input_text:
+                    return i
+        return ringback_tone
+
+    return classify
+
+
+def expand_keywords(extra: int, vocabulary: list, rng: random.Random) -> list:
+    """Thêm `extra` cụm từ giả lập (3-6 từ) chia đều vào các nhãn"""
+    expanded = [list(kws) for kws in keyword_labels]
+    for i in range(extra):
+        phrase = " ".join(rng.choice(vocabulary) for _ in range(rng.randint(3, 6)))
+        expanded[i % len(expanded)].append(phrase)
+    return expanded
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark KeywordMatcher vs vòng lặp substring")
+    parser.add_argument("--texts", type=int, default=20000, help="Số transcript giả lập")
+    parser.add_argument("--extra-keywords", type=int, nargs="+", default=[0, 200, 1000])
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    vocabulary = " ".join(kw for kws in keyword_labels for kw in kws).split()
+    vocabulary += ["xin", "chào", "tút", "nhạc", "chờ", "alo", "tải", "lại", "tàu", "tích", "hợp"]
+    texts = [" ".join(rng.choice(vocabulary) for _ in range(rng.randint(0, 25))) for _ in range(args.texts)]
+
+    print(f"{'Extra kw':>9}{'Phrases':>9}{'Loop (s)':>11}{'AC (s)':>9}{'Speedup':>9}{'Build (ms)':>12}")
+    for extra in args.extra_keywords:
+        label_keywords = expand_keywords(extra, vocabulary, rng)
+        num_phrases = sum(len(kws) for kws in label_keywords)
+
+        loop_classify = make_loop_classifier(label_keywords)
+        start = time.perf_counter()
+        loop_results = [loop_classify(t) for t in texts]
+        loop_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        matcher = KeywordMatcher(labels, label_keywords)
+        build_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        ac_results = matcher.classify_many(texts)
+        ac_time = time.perf_counter() - start
+
+        if ac_results != loop_results:
+            mismatches = sum(a != b for a, b in zip(ac_results, loop_results))
+            print(f"❌ {mismatches} kết quả khác nhau với {extra} extra keywords")
+
+        print(f"{extra:>9}{num_phrases:>9}{loop_time:>11.3f}{ac_time:>9.3f}{loop_time / ac_time:>8.1f}x{build_time * 1000:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,370 @@
+"""
+Benchmark end-to-end decode → STT → phân loại trên bộ AMR mẫu (audio_to_test_speak_to_text/)
+Đo cho từng cấu hình backend: thời gian decode, RTF của STT, độ trễ phân loại, throughput, RAM,
+tỷ lệ nhãn khớp với manifest ground-truth; ghi báo cáo JSON để so sánh giữa các lần build
+
+Mỗi cấu hình chạy trong 1 process riêng (cấu hình qua biến môi trường GSM_* như khi chạy thật),
+nên model_manager được khởi tạo lại từ đầu và RAM đo được không lẫn giữa các cấu hình.
+
+Usage:
+    python benchmark_pipeline.py --limit 200 --formats fp32 int8 --pool-sizes 2 4 --output bench.json
+    python benchmark_pipeline.py --manifest ground_truth.csv --cache 0 1 --passes 2
+    python benchmark_pipeline.py --baseline bench_prev.json --output bench.json   # exit 1 nếu bị chậm/sai hơn
+    python benchmark_pipeline.py --limit 0 --write-manifest ground_truth.csv      # tạo manifest để sửa tay
+
+Manifest ground-truth: CSV 2 cột file,label (vd: 0321456786_20250929_082736.amr,leave_message)
+"""
+
+import argparse
+import csv
+import itertools
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+DEFAULT_AUDIO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "audio_to_test_speak_to_text")
+
+# Ngưỡng mặc định để coi là regression so với báo cáo baseline
+DEFAULT_MAX_SLOWDOWN = 0.10  # RTF / throughput kém hơn quá 10%
+DEFAULT_MAX_ACCURACY_DROP = 0.01  # Tỷ lệ nhãn khớp giảm quá 1 điểm %
+
+
+def config_name(config: Dict) -> str:
+    return (f"{config['backend']}-{config['model_format']}-p{config['pool_size']}-t{config['threads'] or 'auto'}"
+            f"-b{config['batch_size']}-cache{int(config['cache'])}-stream{int(config['streaming'])}")
+
+
+def config_env(config: Dict, cache_path: str) -> Dict[str, str]:
+    """Biến môi trường cho process chạy 1 cấu hình"""
+    env = dict(os.environ)
+    env.update({
+        "GSM_STT_BACKEND": config["backend"],
+        "GSM_STT_MODEL_FORMAT": config["model_format"],
+        "GSM_POOL_SIZE": str(config["pool_size"]),
+        "GSM_POOL_AUTOSCALE": "0",  # Giữ nguyên pool size / số thread để kết quả so sánh được
+        "GSM_STT_CACHE": "1" if config["cache"] else "0",
+        "GSM_STT_CACHE_PATH": cache_path,
+        "GSM_STREAMING_STT": "1" if config["streaming"] else "0",
+        "PYTHONIOENCODING": "utf-8",
+    })
+    if config["threads"]:
+        threads = str(config["threads"])
+        env.update({"OMP_NUM_THREADS": threads, "MKL_NUM_THREADS": threads, "GSM_ONNX_INTRA_OP_THREADS": threads})
+    return env
+
+
+def build_configs(args) -> List[Dict]:
+    """Tích Descartes của các tham số CLI, hoặc danh sách cấu hình từ file --configs"""
+    if args.configs:
+        with open(args.configs, "r", encoding="utf-8") as f:
+            configs = json.load(f)
+        defaults = {"backend": "batch", "model_format": "fp32", "pool_size": 4, "threads": 0,
+                    "batch_size": 8, "cache": False, "streaming": False}
+        return [{**defaults, **config} for config in configs]
+
+    return [
+        {"backend": backend, "model_format": model_format, "pool_size": pool_size, "threads": threads,
+         "batch_size": batch_size, "cache": bool(cache), "streaming": bool(streaming)}
+        for backend, model_format, pool_size, threads, batch_size, cache, streaming in itertools.product(
+            args.backends, args.formats, args.pool_sizes, args.threads, args.batch_sizes, args.cache, args.streaming)
+        # batch_size chỉ có ý nghĩa với backend "batch"
+        if backend == "batch" or batch_size == args.batch_sizes[0]
+    ]
+
+
+def load_manifest(path: Optional[str]) -> Dict[str, str]:
+    """Đọc manifest ground-truth (CSV file,label; bỏ qua dòng header nếu có)"""
+    if not path:
+        return {}
+    manifest = {}
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        for row in csv.reader(f):
+            if len(row) < 2 or row[0].strip().lower() == "file":
+                continue
+            manifest[os.path.basename(row[0].strip())] = row[1].strip()
+    return manifest
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, int(round(q / 100 * (len(values) - 1)))))
+    return values[index]
+
+
+def summarize(values: List[float]) -> Dict:
+    return {
+        "mean": sum(values) / len(values) if values else None,
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "max": max(values) if values else None,
+    }
+
+
+def peak_memory_mb() -> Dict:
+    """RAM đỉnh của process hiện tại (và các process con, vd: backend "process" / decode workers)"""
+    try:
+        import resource
+        scale = 1024 * 1024 if sys.platform == "darwin" else 1024  # ru_maxrss: bytes trên macOS, KB trên Linux
+        return {
+            "self": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale,
+            "children": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale,
+        }
+    except ImportError:
+        # Windows: không có resource → dùng psutil (peak working set)
+        import psutil
+        info = psutil.Process().memory_info()
+        return {"self": getattr(info, "peak_wset", info.rss) / 1024 / 1024, "children": None}
+
+
+def run_config_in_process(config: Dict, files: List[str], manifest: Dict[str, str], args) -> Dict:
+    """Chạy 1 cấu hình (được gọi trong process con với --run-config)"""
+    from bulk_reclassify import BulkReclassifier
+    from model_manager import model_manager
+
+    if config["backend"] == "batch":
+        model_manager.set_backend("batch", max_batch_size=config["batch_size"], max_wait_ms=5.0)
+
+    warm_up_time = model_manager.warm_up()
+
+    passes = []
+    all_labels = {}
+    with tempfile.TemporaryDirectory(prefix="gsm_bench_") as tmp_dir:
+        for pass_index in range(args.passes):
+            output_path = os.path.join(tmp_dir, f"pass{pass_index}.jsonl")
+            reclassifier = BulkReclassifier(output_path, args.decode_workers or None, args.concurrency,
+                                            use_streaming=config["streaming"])
+            start = time.perf_counter()
+            reclassifier.run(files, finished=set())
+            wall_time = time.perf_counter() - start
+
+            with open(output_path, "r", encoding="utf-8") as f:
+                records = [json.loads(line) for line in f]
+            ok = [r for r in records if "error" not in r]
+            audio_seconds = sum(r["audio_seconds"] for r in ok)
+            processed_seconds = sum(r.get("processed_seconds", r["audio_seconds"]) for r in ok)
+            labels = {r["file"]: r["result"] for r in records}
+            all_labels = labels
+
+            pass_result = {
+                "pass": pass_index + 1,
+                "files": len(records),
+                "errors": len(records) - len(ok),
+                "wall_time": wall_time,
+                "throughput_files_per_s": len(records) / wall_time if wall_time > 0 else 0,
+                "audio_seconds": audio_seconds,
+                "processed_seconds": processed_seconds,
+                "end_to_end_rtf": wall_time / audio_seconds if audio_seconds > 0 else None,
+                # Tổng thời gian STT của từng request / audio (tính cả thời gian đợi batch/pool)
+                "stt_rtf": sum(r["stt_time"] for r in ok) / audio_seconds if audio_seconds > 0 else None,
+                "decode_time": summarize([r["decode_time"] for r in ok]),
+                "stt_latency": summarize([r["stt_time"] for r in ok]),
+                "classify_latency": summarize([r["classify_time"] for r in ok]),
+                "cache_hits": sum(1 for r in ok if r.get("cache_hit")),
+                "label_counts": {},
+            }
+            for label in labels.values():
+                pass_result["label_counts"][label] = pass_result["label_counts"].get(label, 0) + 1
+
+            if manifest:
+                scored = [name for name in labels if name in manifest]
+                correct = sum(1 for name in scored if labels[name] == manifest[name])
+                pass_result["manifest_files"] = len(scored)
+                pass_result["label_agreement"] = correct / len(scored) if scored else None
+                pass_result["mismatches"] = [
+                    {"file": name, "expected": manifest[name], "got": labels[name]}
+                    for name in scored if labels[name] != manifest[name]
+                ][:50]
+            passes.append(pass_result)
+
+    return {
+        "name": config_name(config),
+        "config": config,
+        "warm_up_time": warm_up_time,
+        "passes": passes,
+        "peak_memory_mb": peak_memory_mb(),
+        "statistics": model_manager.get_statistics(),
+        "labels": all_labels,
+    }
+
+
+def run_config(config: Dict, args) -> Dict:
+    """Chạy 1 cấu hình trong process con, trả về kết quả (hoặc lỗi)"""
+    with tempfile.TemporaryDirectory(prefix="gsm_bench_cfg_") as tmp_dir:
+        config_path = os.path.join(tmp_dir, "config.json")
+        result_path = os.path.join(tmp_dir, "result.json")
+        with open(config_path, "w", encoding="utf-8") as f:
+            json.dump(config, f)
+
+        cmd = [sys.executable, os.path.abspath(__file__), "--run-config", config_path, "--result-file", result_path,
+               "--audio-dir", args.audio_dir, "--limit", str(args.limit), "--passes", str(args.passes),
+               "--concurrency", str(args.concurrency), "--decode-workers", str(args.decode_workers)]
+        if args.manifest:
+            cmd += ["--manifest", args.manifest]
+
+        start = time.perf_counter()
+        completed = subprocess.run(cmd, env=config_env(config, os.path.join(tmp_dir, "stt_cache.sqlite3")),
+                                   cwd=os.path.dirname(os.path.abspath(__file__)),
+                                   capture_output=True, text=True, encoding="utf-8", errors="replace")
+        if completed.returncode != 0 or not os.path.exists(result_path):
+            return {"name": config_name(config), "config": config, "error": completed.stderr[-2000:],
+                    "elapsed": time.perf_counter() - start}
+        with open(result_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+
+def list_corpus(audio_dir: str, limit: int) -> List[str]:
+    files = sorted(os.path.join(audio_dir, name) for name in os.listdir(audio_dir) if name.lower().endswith(".amr"))
+    return files[:limit] if limit > 0 else files
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def find_regressions(report: Dict, baseline: Dict, max_slowdown: float, max_accuracy_drop: float) -> List[str]:
+    """So sánh pass cuối của từng cấu hình trùng tên với baseline"""
+    previous = {r["name"]: r for r in baseline.get("results", []) if "passes" in r}
+    regressions = []
+    for result in report["results"]:
+        old = previous.get(result["name"])
+        if old is None or "passes" not in result:
+            continue
+        new_pass, old_pass = result["passes"][-1], old["passes"][-1]
+
+        if old_pass.get("stt_rtf") and new_pass.get("stt_rtf") and \
+                new_pass["stt_rtf"] > old_pass["stt_rtf"] * (1 + max_slowdown):
+            regressions.append(f"{result['name']}: STT RTF {old_pass['stt_rtf']:.3f} → {new_pass['stt_rtf']:.3f}")
+        if old_pass.get("throughput_files_per_s") and \
+                new_pass["throughput_files_per_s"] < old_pass["throughput_files_per_s"] * (1 - max_slowdown):
+            regressions.append(f"{result['name']}: throughput {old_pass['throughput_files_per_s']:.2f} → "
+                               f"{new_pass['throughput_files_per_s']:.2f} file/s")
+        if old_pass.get("label_agreement") is not None and new_pass.get("label_agreement") is not None and \
+                new_pass["label_agreement"] < old_pass["label_agreement"] - max_accuracy_drop:
+            regressions.append(f"{result['name']}: label agreement {old_pass['label_agreement']*100:.1f}% → "
+                               f"{new_pass['label_agreement']*100:.1f}%")
+    return regressions
+
+
+def print_report(report: Dict):
+    print(f"\n{'='*112}")
+    print(f"{'Config':<42}{'Pass':>5}{'File/s':>8}{'STT RTF':>9}{'E2E RTF':>9}{'Decode p95':>11}"
+          f"{'Classify p95':>13}{'Cache':>7}{'RAM(MB)':>9}{'Agree':>8}")
+    for result in report["results"]:
+        if "error" in result:
+            print(f"{result['name']:<42} ❌ {result['error'].strip().splitlines()[-1] if result['error'].strip() else 'failed'}")
+            continue
+        memory = result["peak_memory_mb"]["self"] + (result["peak_memory_mb"]["children"] or 0)
+        for p in result["passes"]:
+            agreement = f"{p['label_agreement']*100:.1f}%" if p.get("label_agreement") is not None else "-"
+            print(f"{result['name']:<42}{p['pass']:>5}{p['throughput_files_per_s']:>8.2f}{p['stt_rtf'] or 0:>9.3f}"
+                  f"{p['end_to_end_rtf'] or 0:>9.3f}{(p['decode_time']['p95'] or 0)*1000:>9.0f}ms"
+                  f"{(p['classify_latency']['p95'] or 0)*1000:>11.1f}ms{p['cache_hits']:>7}{memory:>9.0f}{agreement:>8}")
+    print(f"{'='*112}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark decode → STT → phân loại theo từng cấu hình backend")
+    parser.add_argument("--audio-dir", default=DEFAULT_AUDIO_DIR, help="Thư mục chứa file .amr")
+    parser.add_argument("--limit", type=int, default=200, help="Chỉ chạy N file đầu tiên (0 = tất cả)")
+    parser.add_argument("--manifest", help="CSV ground-truth file,label")
+    parser.add_argument("--output", default="benchmark_report.json", help="File báo cáo JSON")
+    parser.add_argument("--configs", help="File JSON danh sách cấu hình (thay cho tích các tham số bên dưới)")
+    parser.add_argument("--backends", nargs="+", default=["batch"], choices=["direct", "batch", "process"])
+    parser.add_argument("--formats", nargs="+", default=["fp32"], choices=["fp32", "int8", "onnx"])
+    parser.add_argument("--pool-sizes", nargs="+", type=int, default=[4])
+    parser.add_argument("--threads", nargs="+", type=int, default=[0], help="Số thread torch/ONNX (0 = mặc định)")
+    parser.add_argument("--batch-sizes", nargs="+", type=int, default=[8])
+    parser.add_argument("--cache", nargs="+", type=int, default=[0], choices=[0, 1])
+    parser.add_argument("--streaming", nargs="+", type=int, default=[0], choices=[0, 1])
+    parser.add_argument("--passes", type=int, default=1, help="Số lượt chạy lại corpus (>= 2 để đo cache)")
+    parser.add_argument("--concurrency", type=int, default=16, help="Số file xử lý song song")
+    parser.add_argument("--decode-workers", type=int, default=0, help="Số process decode (0 = số CPU - 1)")
+    parser.add_argument("--baseline", help="Báo cáo cũ để phát hiện regression")
+    parser.add_argument("--max-slowdown", type=float, default=DEFAULT_MAX_SLOWDOWN)
+    parser.add_argument("--max-accuracy-drop", type=float, default=DEFAULT_MAX_ACCURACY_DROP)
+    parser.add_argument("--write-manifest", help="Ghi nhãn của cấu hình đầu tiên ra CSV để làm manifest (sửa tay)")
+    parser.add_argument("--run-config", help=argparse.SUPPRESS)
+    parser.add_argument("--result-file", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    files = list_corpus(args.audio_dir, args.limit)
+    manifest = load_manifest(args.manifest)
+
+    # Process con: chạy đúng 1 cấu hình rồi ghi kết quả
+    if args.run_config:
+        with open(args.run_config, "r", encoding="utf-8") as f:
+            config = json.load(f)
+        result = run_config_in_process(config, files, manifest, args)
+        with open(args.result_file, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False)
+        return
+
+    if not files:
+        print(f"❌ Không tìm thấy file .amr trong {args.audio_dir}")
+        sys.exit(2)
+
+    configs = build_configs(args)
+    print(f"🎵 {len(files)} file, {len(configs)} cấu hình, {args.passes} lượt/cấu hình"
+          f"{f', manifest {len(manifest)} nhãn' if manifest else ''}")
+
+    results = []
+    for i, config in enumerate(configs, 1):
+        print(f"\n[{i}/{len(configs)}] {config_name(config)}...")
+        result = run_config(config, args)
+        if "error" in result:
+            print(f"❌ Lỗi: {result['error'].strip().splitlines()[-1] if result['error'].strip() else 'failed'}")
+        results.append(result)
+
+    report = {
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "git_revision": git_revision(),
+        "host": {"platform": platform.platform(), "python": platform.python_version(), "cpu_count": os.cpu_count()},
+        "corpus": {"audio_dir": os.path.abspath(args.audio_dir), "files": len(files), "manifest": args.manifest},
+        "results": results,
+    }
+    print_report(report)
+
+    if args.write_manifest:
+        first = next((r for r in results if "labels" in r), None)
+        if first is not None:
+            with open(args.write_manifest, "w", encoding="utf-8", newline="") as f:
+                writer = csv.writer(f)
+                writer.writerow(["file", "label"])
+                for name, label in sorted(first["labels"].items()):
+                    writer.writerow([name, label])
+            print(f"📝 Đã ghi manifest ({first['name']}) ra {args.write_manifest} - kiểm tra và sửa tay trước khi dùng")
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = find_regressions(report, baseline, args.max_slowdown, args.max_accuracy_drop)
+        report["regressions"] = regressions
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"💾 Đã ghi báo cáo ra {args.output}")
+
+    if regressions:
+        print("❌ Regression so với baseline:")
+        for line in regressions:
+            print(f"   - {line}")
+        sys.exit(1)
+    if any("error" in r for r in results):
+        sys.exit(2)
+
+
+if __name__ == "__main__":
+    main()
@@ -98,6 +98,18 @@ hiddenimports = [
     'gsm_instance',
     'controller',
     'export_excel',
+    'model_manager',
+    'stt_process_pool',
+    'model_backends',
+    'keyword_spotter',
+    'stt_cache',
+    'keyword_rules',
+    'serial_capture',
+    'call_trace',
+    'metrics',
+    'result_store',
+    'http.server',
+    'multiprocessing.shared_memory',
     # Concurrent processing
     'concurrent.futures',
     'concurrent.futures.thread',
@@ -208,6 +220,16 @@ def build_executable():
             "--hidden-import", "gsm_instance",
             "--hidden-import", "controller",
             "--hidden-import", "export_excel",
+            "--hidden-import", "model_manager",
+            "--hidden-import", "stt_process_pool",
+            "--hidden-import", "model_backends",
+            "--hidden-import", "keyword_spotter",
+            "--hidden-import", "stt_cache",
+            "--hidden-import", "keyword_rules",
+            "--hidden-import", "serial_capture",
+            "--hidden-import", "call_trace",
+            "--hidden-import", "metrics",
+            "--hidden-import", "result_store",
             "main_gui.py"
         ]
         
@@ -267,6 +289,12 @@ def create_portable_package():
             shutil.copy2(readme_src, readme_dst)
             print(f"[OK] Da copy README")
         
+        # Copy file từ khóa (sửa được khi đang chạy, không cần build lại exe)
+        rules_src = Path("keyword_rules.json")
+        if rules_src.exists():
+            shutil.copy2(rules_src, portable_dir / "keyword_rules.json")
+            print("[OK] Da copy keyword_rules.json")
+        
         # Tạo file mẫu danh sách số điện thoại
         sample_file = portable_dir / "sample_phone_list.txt"
         with open(sample_file, 'w', encoding='utf-8') as f:
@@ -0,0 +1,341 @@
+"""
+Bulk reclassify - Chạy lại decode → STT → phân loại cho các file ghi âm đã lưu (không cần gọi lại số)
+Dùng khi sửa từ khóa hoặc đổi model: đầu vào là thư mục hoặc file nén (.zip/.tar/.tar.gz)
+chứa các file <phone>_<date>_<time>.amr (vd: audio_to_test_speak_to_text/)
+
+- Decode AMR chạy trong process pool (ffmpeg/pydub không bị GIL chặn)
+- STT đi qua model_manager → BatchInferenceServer gom audio từ nhiều thread thành batch
+- Kết quả ghi ra JSONL ngay sau mỗi file; chạy lại cùng --output sẽ bỏ qua các file đã xong (resume)
+
+Usage:
+    python bulk_reclassify.py ../audio_to_test_speak_to_text --output bulk_results.jsonl --excel bulk_results.xlsx
+    python bulk_reclassify.py recordings.zip --rules keyword_rules.json
+    python bulk_reclassify.py --reclassify --output bulk_results.jsonl   # chỉ phân loại lại transcript đã có
+"""
+
+import argparse
+import json
+import logging
+import multiprocessing as mp
+import os
+import re
+import shutil
+import tarfile
+import tempfile
+import threading
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from datetime import datetime
+from typing import Dict, List, Optional, Set
+
+import numpy as np
+from pydub import AudioSegment
+
+from string_detection import classify_text, get_keyword_rules, match_confidence, relabel_result
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_RATE = 16000
+AUDIO_EXTENSIONS = (".amr", ".wav")
+RECORDING_NAME_PATTERN = re.compile(r"^(?P<phone>\d+)_(?P<date>\d{8})_(?P<time>\d{6})$")
+
+
+def parse_recording_name(path: str) -> Dict:
+    """Tách số điện thoại và thời điểm ghi âm từ tên file <phone>_<YYYYMMDD>_<HHMMSS>.amr"""
+    stem = os.path.splitext(os.path.basename(path))[0]
+    match = RECORDING_NAME_PATTERN.match(stem)
+    if not match:
+        return {"phone_number": stem, "recorded_at": None}
+    try:
+        recorded_at = datetime.strptime(match["date"] + match["time"], "%Y%m%d%H%M%S").isoformat()
+    except ValueError:
+        recorded_at = None
+    return {"phone_number": match["phone"], "recorded_at": recorded_at}
+
+
+def decode_audio_file(path: str) -> np.ndarray:
+    """
+    Decode 1 file ra PCM float32 16kHz mono (chạy trong worker process)
+    Giống spk_to_text_wav2.load_audio_pcm nhưng không import torch/transformers vào worker
+    """
+    audio = AudioSegment.from_file(path)
+    audio = audio.set_frame_rate(SAMPLE_RATE).set_channels(1).set_sample_width(2)
+    samples = np.array(audio.get_array_of_samples(), dtype=np.float32)
+    return samples / 32768.0
+
+
+def list_recordings(source: str, extract_dir: str) -> List[str]:
+    """Danh sách file audio trong thư mục hoặc file nén (giải nén vào extract_dir), sắp xếp theo tên"""
+    if os.path.isdir(source):
+        root = source
+    elif zipfile.is_zipfile(source):
+        with zipfile.ZipFile(source) as archive:
+            archive.extractall(extract_dir)
+        root = extract_dir
+    elif tarfile.is_tarfile(source):
+        with tarfile.open(source) as archive:
+            # Chỉ lấy file audio, bỏ qua đường dẫn tuyệt đối / "../" (không ghi ra ngoài extract_dir)
+            members = [
+                m for m in archive.getmembers()
+                if m.isfile() and m.name.lower().endswith(AUDIO_EXTENSIONS)
+                and not os.path.isabs(m.name) and ".." not in m.name.replace("\\", "/").split("/")
+            ]
+            archive.extractall(extract_dir, members=members)
+        root = extract_dir
+    else:
+        raise ValueError(f"{source} không phải thư mục hoặc file .zip/.tar")
+
+    files = []
+    for directory, _, names in os.walk(root):
+        files.extend(os.path.join(directory, name) for name in names if name.lower().endswith(AUDIO_EXTENSIONS))
+    return sorted(files, key=os.path.basename)
+
+
+def load_finished(output_path: str) -> Dict[str, Dict]:
+    """Đọc các kết quả đã ghi (theo tên file). Dòng cuối bị ghi dở (crash giữa chừng) được bỏ qua"""
+    finished = {}
+    if not os.path.exists(output_path):
+        return finished
+    with open(output_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            finished[record["file"]] = record
+    return finished
+
+
+class BulkReclassifier:
+    """
+    Pipeline offline: decode (process pool) → STT (model_manager, batch) → phân loại → JSONL
+
+    Mỗi file được xử lý bởi 1 thread trong ThreadPoolExecutor; các thread cùng đợi STT nên
+    BatchInferenceServer gom được đủ batch, còn decode được đẩy sang process pool.
+    """
+
+    def __init__(self, output_path: str, decode_workers: Optional[int] = None, concurrency: int = 16,
+                 use_streaming: bool = False):
+        self.output_path = output_path
+        self.decode_workers = decode_workers or max(1, (os.cpu_count() or 2) - 1)
+        self.concurrency = concurrency
+        self.use_streaming = use_streaming  # Dừng sớm như lúc gọi thật (transcript có thể bị cắt)
+        self._write_lock = threading.Lock()
+
+        # Imports nặng (torch, transformers) chỉ ở process chính, không vào các decode worker (spawn)
+        from keyword_spotter import USE_KEYWORD_SPOTTER
+        from model_manager import model_manager
+        from stt_cache import cache_namespace, transcription_cache
+        self._model_manager = model_manager
+        self._use_spotter = USE_KEYWORD_SPOTTER
+        self._cache = transcription_cache
+        self._cache_namespace = cache_namespace
+
+    def _process_file(self, path: str, decode_pool: ProcessPoolExecutor) -> Dict:
+        record = {"file": os.path.basename(path), **parse_recording_name(path)}
+        try:
+            start = time.perf_counter()
+            speech = decode_pool.submit(decode_audio_file, path).result()
+            record["decode_time"] = time.perf_counter() - start
+            record["audio_seconds"] = len(speech) / SAMPLE_RATE
+
+            start = time.perf_counter()
+            streaming = self.use_streaming and self._use_spotter
+            namespace = self._cache_namespace(self._model_manager.get_model_id(), self._model_manager.get_model_format(),
+                                        "stream" if streaming else "full")
+            cached = self._cache.get(speech, namespace) if self._cache is not None else None
+            processed_seconds = record["audio_seconds"]
+            early_exit = False
+            if cached is not None:
+                text, logits = cached
+            else:
+                if streaming:
+                    stream = self._model_manager.transcribe_streaming(speech)
+                    text, logits = stream["text"], stream["logits"]
+                    processed_seconds = stream["processed_seconds"]
+                    early_exit = stream["early_exit"]
+                else:
+                    text, logits = self._model_manager.transcribe(speech, return_logits=True)
+                if self._cache is not None and text and not early_exit:
+                    self._cache.put(speech, text, logits, namespace)
+            record["stt_time"] = time.perf_counter() - start
+            record["processed_seconds"] = processed_seconds
+            record["cache_hit"] = cached is not None
+            record["transcribed_text"] = text
+
+            # Cùng chính sách với GSMInstance._classify_result: spotter trước, không khớp cụm nào thì tìm trong text
+            start = time.perf_counter()
+            spotted = None
+            if self._use_spotter and logits is not None and len(logits):
+                spotter = self._model_manager.get_keyword_spotter()
+                label_index, confidence, phrase = spotter.spot(logits)
+                spotted = (spotter.labels[label_index], confidence, phrase)
+            if spotted is not None and spotted[0] != "ringback_tone":
+                record["result"], record["confidence"], record["matched"] = spotted
+                record["label_source"] = "spotter"
+            else:
+                label, span, distance = classify_text(text)
+                if spotted is not None and label == "ringback_tone":
+                    record["result"], record["confidence"], record["matched"] = spotted
+                    record["label_source"] = "spotter"
+                else:
+                    record["result"] = label
+                    record["confidence"] = match_confidence(span, distance)
+                    record["matched"] = text[span[0]:span[1]] if span else None
+                    record["label_source"] = "text"
+            record["classify_time"] = time.perf_counter() - start
+        except Exception as e:
+            record["result"] = "lỗi"
+            record["error"] = str(e)
+        return record
+
+    def _write(self, handle, record: Dict):
+        with self._write_lock:
+            handle.write(json.dumps(record, ensure_ascii=False) + "\n")
+            handle.flush()
+
+    def run(self, files: List[str], finished: Set[str]) -> Dict:
+        """Xử lý các file chưa có trong finished, ghi nối tiếp vào output. Trả về thống kê"""
+        pending = [f for f in files if os.path.basename(f) not in finished]
+        print(f"🎵 {len(files)} file, {len(files) - len(pending)} đã xong trước đó, còn {len(pending)} file")
+        stats = {"processed": 0, "errors": 0, "cache_hits": 0, "audio_seconds": 0.0, "labels": {}}
+        if not pending:
+            return stats
+
+        start = time.perf_counter()
+        # spawn: worker không kế thừa torch/model từ process chính (giống hành vi trên Windows)
+        with ProcessPoolExecutor(self.decode_workers, mp_context=mp.get_context("spawn")) as decode_pool, \
+                ThreadPoolExecutor(self.concurrency, thread_name_prefix="BulkSTT") as threads, \
+                open(self.output_path, "a", encoding="utf-8") as handle:
+            futures = [threads.submit(self._process_file, path, decode_pool) for path in pending]
+            try:
+                for future in as_completed(futures):
+                    record = future.result()
+                    self._write(handle, record)
+                    self._update_stats(stats, record, len(pending), start)
+            except KeyboardInterrupt:
+                # Các file chưa chạy bị hủy; file đã ghi vẫn còn trong output → chạy lại để resume
+                for future in futures:
+                    future.cancel()
+                print(f"⏹️ Đã dừng sau {stats['processed']} file - chạy lại cùng --output để tiếp tục")
+                raise
+
+        stats["elapsed"] = time.perf_counter() - start
+        return stats
+
+    @staticmethod
+    def _update_stats(stats: Dict, record: Dict, total: int, start: float):
+        stats["processed"] += 1
+        stats["errors"] += int("error" in record)
+        stats["cache_hits"] += int(bool(record.get("cache_hit")))
+        stats["audio_seconds"] += record.get("audio_seconds", 0.0)
+        stats["labels"][record["result"]] = stats["labels"].get(record["result"], 0) + 1
+
+        if stats["processed"] % 50 == 0 or stats["processed"] == total:
+            elapsed = time.perf_counter() - start
+            print(f"   [{stats['processed']}/{total}] {elapsed:.1f}s, "
+                  f"{stats['processed'] / elapsed:.1f} file/s, {stats['errors']} lỗi")
+
+
+def reclassify_results(output_path: str) -> int:
+    """
+    Phân loại lại các transcript đã có trong output theo bộ từ khóa hiện tại (không chạy STT)
+
+    Cùng chính sách với GSMController.reclassify_results (relabel_result): mọi nhãn, kể cả nhãn do spotter gán
+    """
+    records = list(load_finished(output_path).values())
+    rules = get_keyword_rules()
+    changed = sum(1 for record in records if relabel_result(record, rules))
+
+    tmp_path = f"{output_path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        for record in records:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    os.replace(tmp_path, output_path)
+    print(f"🔁 Đã phân loại lại {len(records)} kết quả: {changed} đổi nhãn")
+    return changed
+
+
+def export_to_excel(output_path: str, excel_path: str) -> bool:
+    """Xuất toàn bộ JSONL ra Excel, mỗi nhãn 1 sheet (cùng định dạng với GUI)"""
+    from export_excel import export_results_to_excel
+
+    results: Dict[str, List[Dict]] = {}
+    for record in load_finished(output_path).values():
+        row = dict(record)
+        row["reason"] = row.get("error") or f"File: {row['file']}"
+        results.setdefault(row["result"], []).append(row)
+    return export_results_to_excel(results, excel_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Chạy lại STT + phân loại cho các file ghi âm đã lưu")
+    parser.add_argument("source", nargs="?", help="Thư mục hoặc file .zip/.tar chứa <phone>_<date>_<time>.amr")
+    parser.add_argument("--output", default="bulk_results.jsonl", help="File JSONL kết quả (dùng để resume)")
+    parser.add_argument("--excel", help="Xuất kết quả ra file Excel sau khi chạy xong")
+    parser.add_argument("--rules", help="File từ khóa JSON/YAML dùng thay bộ từ khóa built-in")
+    parser.add_argument("--reclassify", action="store_true", help="Chỉ phân loại lại transcript đã có trong --output")
+    parser.add_argument("--restart", action="store_true", help="Bỏ kết quả cũ, chạy lại từ đầu")
+    parser.add_argument("--limit", type=int, default=0, help="Chỉ chạy N file đầu tiên (0 = tất cả)")
+    parser.add_argument("--decode-workers", type=int, default=0, help="Số process decode (0 = số CPU - 1)")
+    parser.add_argument("--concurrency", type=int, default=16, help="Số file xử lý song song")
+    parser.add_argument("--batch-size", type=int, default=16, help="max_batch_size của BatchInferenceServer")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+
+    if args.rules:
+        from keyword_rules import load_rules_file
+        from string_detection import set_keyword_rules
+        set_keyword_rules(load_rules_file(args.rules))
+    rules = get_keyword_rules()
+    print(f"📚 Bộ từ khóa: {len(rules.labels)} nhãn ({rules.source or 'built-in'})")
+
+    if args.reclassify:
+        reclassify_results(args.output)
+    else:
+        if not args.source:
+            parser.error("cần chỉ định thư mục/file nén nguồn (hoặc dùng --reclassify)")
+        if args.restart and os.path.exists(args.output):
+            os.remove(args.output)
+
+        extract_dir = tempfile.mkdtemp(prefix="gsm_bulk_")
+        try:
+            files = list_recordings(args.source, extract_dir)
+            if args.limit > 0:
+                files = files[:args.limit]
+            if not files:
+                print(f"❌ Không tìm thấy file audio trong {args.source}")
+                return
+
+            finished = {name for name, record in load_finished(args.output).items() if "error" not in record}
+            reclassifier = BulkReclassifier(args.output, args.decode_workers or None, args.concurrency)
+            # Offline không cần độ trễ thấp → đợi lâu hơn để gom batch đầy
+            from model_manager import model_manager
+            if model_manager.get_backend() == "batch":
+                model_manager.set_backend("batch", max_batch_size=args.batch_size, max_wait_ms=50.0)
+            model_manager.warm_up()
+
+            stats = reclassifier.run(files, finished)
+        finally:
+            shutil.rmtree(extract_dir, ignore_errors=True)
+
+        if stats["processed"]:
+            audio = stats["audio_seconds"]
+            print(f"\n{'='*60}")
+            print(f"✅ Xong {stats['processed']} file trong {stats['elapsed']:.1f}s "
+                  f"({audio:.0f}s audio, RTF {stats['elapsed'] / audio if audio else 0:.3f}), "
+                  f"{stats['cache_hits']} cache hit, {stats['errors']} lỗi")
+            for label, count in sorted(stats["labels"].items(), key=lambda item: -item[1]):
+                print(f"   {label}: {count}")
+            print(f"{'='*60}")
+
+    if args.excel:
+        if export_to_excel(args.output, args.excel):
+            print(f"💾 Đã xuất Excel: {args.excel}")
+
+
+if __name__ == "__main__":
+    mp.freeze_support()
+    main()
@@ -0,0 +1,265 @@
+"""
+Call trace - Đo thời gian từng giai đoạn của mỗi cuộc gọi và ghi ra file JSONL (xoay vòng theo dung lượng)
+Làm cơ sở để biết thời gian của 1 cuộc gọi nằm ở đâu (capacity planning)
+
+Các giai đoạn (giây):
+    queue_wait   - cổng rảnh trước cuộc gọi này: từ lúc cuộc gọi trước kết thúc (hoặc cổng bắt đầu nhận số)
+                   đến lúc gọi (nghỉ giữa 2 cuộc gọi, reset module, chờ số mới)
+    dial         - ATD + chờ sau khi gọi
+    recording    - bắt đầu ghi âm → dừng ghi âm (gồm vòng poll AT+CLCC)
+    hang_up      - ATH (và xóa file nếu người nghe nhấc máy)
+    download     - tải file ghi âm qua QFREAD (kèm download_bytes)
+    decode       - AMR → WAV + load PCM
+    model_wait   - chờ slot ModelPool / batch
+    inference    - chạy STT
+    classify     - phân loại
+    cleanup      - xóa file tạm + file trên module
+Thêm các mốc: time_to_colp / time_to_release (tính từ lúc gọi)
+
+Usage:
+    python call_trace.py                                   # tóm tắt logs/call_trace.jsonl (kèm file đã xoay)
+    python call_trace.py logs/call_trace.jsonl --by port operator result
+"""
+
+import argparse
+import glob
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from logging.handlers import RotatingFileHandler
+from typing import Callable, Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Cấu hình (override bằng biến môi trường)
+CALL_TRACE_ENABLED = os.environ.get("GSM_CALL_TRACE", "1") == "1"
+CALL_TRACE_PATH = os.environ.get("GSM_CALL_TRACE_PATH", os.path.join("logs", "call_trace.jsonl"))
+CALL_TRACE_MAX_MB = float(os.environ.get("GSM_CALL_TRACE_MAX_MB", "20"))
+CALL_TRACE_BACKUPS = int(os.environ.get("GSM_CALL_TRACE_BACKUPS", "5"))
+
+STAGES = ["queue_wait", "dial", "recording", "hang_up", "download", "decode",
+          "model_wait", "inference", "classify", "cleanup"]
+PERCENTILES = (50, 95, 99)
+
+
+class CallTrace:
+    """
+    Thời gian các giai đoạn của 1 cuộc gọi
+
+    begin(stage) tự kết thúc giai đoạn trước → chỉ cần gọi begin() ở đầu mỗi đoạn code,
+    giai đoạn lặp lại được cộng dồn
+    """
+
+    def __init__(self, port: str, phone_number: str, operator: str = "", queue_wait: float = 0.0):
+        self.port = port
+        self.phone_number = phone_number
+        self.operator = operator
+        self.started_at = datetime.now()
+        self.stages: Dict[str, float] = {"queue_wait": max(0.0, queue_wait)}
+        self.fields: Dict[str, object] = {}
+        self._start = time.perf_counter()
+        self._current: Optional[str] = None
+        self._current_start = 0.0
+
+    def begin(self, stage: str):
+        self.end()
+        self._current = stage
+        self._current_start = time.perf_counter()
+
+    def end(self):
+        if self._current is not None:
+            self.add(self._current, time.perf_counter() - self._current_start)
+            self._current = None
+
+    def add(self, stage: str, seconds: Optional[float]):
+        if seconds:
+            self.stages[stage] = self.stages.get(stage, 0.0) + max(0.0, seconds)
+
+    def mark(self, name: str):
+        """Ghi mốc thời gian (giây từ lúc bắt đầu cuộc gọi), chỉ lần đầu"""
+        self.fields.setdefault(name, round(time.perf_counter() - self._start, 3))
+
+    def set(self, **fields):
+        self.fields.update(fields)
+
+    def finish(self, result: Dict) -> Dict:
+        """Kết thúc giai đoạn cuối, trả về record để ghi JSONL"""
+        self.end()
+        record = {
+            "ts": self.started_at.isoformat(timespec="milliseconds"),
+            "port": self.port,
+            "operator": self.operator,
+            "phone_number": self.phone_number,
+            "result": result.get("result"),
+            "total": round(time.perf_counter() - self._start, 3),  # Thời gian cuộc gọi (không gồm queue_wait)
+            "stages": {stage: round(seconds, 4) for stage, seconds in self.stages.items()},
+        }
+        record.update(self.fields)
+        return record
+
+
+class CallTracer:
+    """Ghi trace ra JSONL qua RotatingFileHandler (thread-safe) và báo cho các listener (vd: metrics)"""
+
+    def __init__(self, path: str = CALL_TRACE_PATH, enabled: bool = CALL_TRACE_ENABLED,
+                 max_mb: float = CALL_TRACE_MAX_MB, backups: int = CALL_TRACE_BACKUPS):
+        self.path = path
+        self.enabled = enabled
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.backups = backups
+        self._writer: Optional[logging.Logger] = None
+        self._lock = threading.Lock()
+        self._listeners: List[Callable[[Dict], None]] = []
+        self._recorded = 0
+
+    def _get_writer(self) -> logging.Logger:
+        if self._writer is None:
+            with self._lock:
+                if self._writer is None:
+                    os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                    handler = RotatingFileHandler(self.path, maxBytes=self.max_bytes,
+                                                  backupCount=self.backups, encoding="utf-8")
+                    handler.setFormatter(logging.Formatter("%(message)s"))
+                    writer = logging.getLogger(f"{__name__}.writer")
+                    writer.handlers = [handler]
+                    writer.setLevel(logging.INFO)
+                    writer.propagate = False
+                    self._writer = writer
+        return self._writer
+
+    def record(self, trace: Dict):
+        """Ghi 1 trace (lỗi ghi file không được làm hỏng cuộc gọi)"""
+        if self.enabled:
+            try:
+                self._get_writer().info(json.dumps(trace, ensure_ascii=False))
+            except Exception as e:
+                logger.warning(f"⚠️ Không ghi được call trace: {e}")
+        self._recorded += 1
+        for listener in list(self._listeners):
+            try:
+                listener(trace)
+            except Exception as e:
+                logger.error(f"❌ Lỗi listener call trace: {e}")
+
+    def add_listener(self, listener: Callable[[Dict], None]):
+        if listener not in self._listeners:
+            self._listeners.append(listener)
+
+    def remove_listener(self, listener: Callable[[Dict], None]):
+        if listener in self._listeners:
+            self._listeners.remove(listener)
+
+    def get_statistics(self) -> dict:
+        return {"enabled": self.enabled, "path": self.path, "recorded": self._recorded}
+
+
+# Singleton instance
+call_tracer = CallTracer()
+
+
+# ==================== Summarizer ====================
+
+def load_traces(paths: Iterable[str]) -> List[Dict]:
+    """Đọc các file JSONL (bỏ qua dòng hỏng, vd: dòng cuối ghi dở)"""
+    traces = []
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    traces.append(json.loads(line))
+                except json.JSONDecodeError:
+                    continue
+    return traces
+
+
+def percentile(values: List[float], p: float) -> float:
+    """Percentile nội suy tuyến tính (values đã sort)"""
+    if not values:
+        return 0.0
+    k = (len(values) - 1) * p / 100
+    lower = int(k)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (k - lower)
+
+
+def summarize_traces(traces: List[Dict], group_by: Optional[str] = None) -> Dict[str, Dict[str, dict]]:
+    """
+    Tính p50/p95/p99 từng giai đoạn (và tổng) theo nhóm
+
+    Returns:
+        {group: {stage: {"count", "mean", "p50", "p95", "p99"}}}
+    """
+    samples: Dict[str, Dict[str, List[float]]] = {}
+    for trace in traces:
+        group = str(trace.get(group_by, "")) if group_by else "all"
+        stages = samples.setdefault(group, {})
+        for stage, seconds in trace.get("stages", {}).items():
+            stages.setdefault(stage, []).append(seconds)
+        stages.setdefault("total", []).append(trace.get("total", 0.0))
+        for mark in ("time_to_colp", "time_to_release"):
+            if mark in trace:
+                stages.setdefault(mark, []).append(trace[mark])
+
+    summary: Dict[str, Dict[str, dict]] = {}
+    for group, stages in samples.items():
+        summary[group] = {}
+        for stage, values in stages.items():
+            values.sort()
+            stats = {"count": len(values), "mean": sum(values) / len(values)}
+            for p in PERCENTILES:
+                stats[f"p{p}"] = percentile(values, p)
+            summary[group][stage] = stats
+    return summary
+
+
+def _stage_order(stage: str) -> int:
+    order = STAGES + ["time_to_colp", "time_to_release", "total"]
+    return order.index(stage) if stage in order else len(order)
+
+
+def print_summary(summary: Dict[str, Dict[str, dict]], title: str):
+    print(f"\n📊 {title}")
+    for group in sorted(summary):
+        if group != "all":
+            print(f"  [{group}]")
+        print(f"    {'Stage':<16}{'Count':>7}{'Mean':>9}{'p50':>9}{'p95':>9}{'p99':>9}")
+        for stage in sorted(summary[group], key=_stage_order):
+            stats = summary[group][stage]
+            print(f"    {stage:<16}{stats['count']:>7}{stats['mean']:>9.2f}"
+                  + "".join(f"{stats[f'p{p}']:>9.2f}" for p in PERCENTILES))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tóm tắt thời gian các giai đoạn cuộc gọi (p50/p95/p99)")
+    parser.add_argument("paths", nargs="*", help="File JSONL (mặc định: file trace hiện tại + các file đã xoay)")
+    parser.add_argument("--by", nargs="+", default=["port", "operator"], choices=["port", "operator", "result"],
+                        help="Nhóm thêm theo các trường này")
+    parser.add_argument("--json", metavar="PATH", help="Ghi kết quả tóm tắt ra file JSON")
+    args = parser.parse_args()
+
+    paths = args.paths or sorted(glob.glob(f"{CALL_TRACE_PATH}*"))
+    traces = load_traces(paths)
+    if not traces:
+        print(f"⚠️ Không có trace nào trong {paths or CALL_TRACE_PATH}")
+        raise SystemExit(1)
+
+    report = {"all": summarize_traces(traces)}
+    print_summary(report["all"], f"Tất cả ({len(traces)} cuộc gọi)")
+    for field in args.by:
+        report[field] = summarize_traces(traces, group_by=field)
+        print_summary(report[field], f"Theo {field}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n💾 Đã ghi {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,618 @@
+"""
+Cluster - Chia danh sách số cho nhiều máy (mỗi máy 1 bank modem) qua TCP
+
+- Coordinator: giữ hàng đợi toàn cục, loại số trùng, lưu kết quả (JSONL, chạy lại được từ chỗ dừng),
+  cho worker "thuê" (lease) từng lô số; lease hết hạn (worker chết / mất mạng) → số chưa có kết quả
+  được trả lại hàng đợi cho worker khác
+- Worker: chạy GSMController trên các cổng của máy mình, mỗi cổng lấy số từ lô đã thuê,
+  gửi kết quả về coordinator ngay sau mỗi cuộc gọi, heartbeat để gia hạn lease
+
+Giao thức: mỗi dòng 1 object JSON (request → response) trên 1 kết nối TCP;
+mọi request đều mang "token" (GSM_CLUSTER_TOKEN) nếu coordinator có đặt token
+    {"op": "hello", "worker": id, "ports": n, "token": ...}  → {"ok": true, "lease_seconds": ...}
+    {"op": "lease", "worker": id, "count": n}               → {"lease_id": ..., "phones": [...], "done": false}
+    {"op": "result", "worker": id, "result": {...}}         → {"ok": true, "accepted": bool}
+    {"op": "heartbeat", "worker": id}                       → {"ok": true}
+    {"op": "release", "worker": id, "phones": [...]}        → {"ok": true}   (số chưa gọi khi worker dừng)
+    {"op": "status"}                                         → tiến độ
+
+Usage (thử trên 1 máy Linux với simulator):
+    python gsm_simulator.py --ports 8 --ports-file sim_a.txt --write-phone-list sim_phones.txt
+    python gsm_simulator.py --ports 8 --ports-file sim_b.txt
+    python cluster.py coordinator --phones sim_phones.txt --output cluster_results.xlsx
+    GSM_EXTRA_PORTS_FILE=sim_a.txt python cluster.py worker --coordinator 127.0.0.1:8770 --name a
+    GSM_EXTRA_PORTS_FILE=sim_b.txt python cluster.py worker --coordinator 127.0.0.1:8770 --name b
+
+Nhiều máy: coordinator phải nghe trên địa chỉ LAN (--host 0.0.0.0) và bắt buộc có token:
+    GSM_CLUSTER_TOKEN=... python cluster.py coordinator --host 0.0.0.0 --phones list_sdt.txt
+    GSM_CLUSTER_TOKEN=... python cluster.py worker --coordinator 192.168.1.10:8770
+"""
+
+import argparse
+import hmac
+import ipaddress
+import json
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import socketserver
+import threading
+import time
+import uuid
+from collections import deque
+from typing import Deque, Dict, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+# Cấu hình (override bằng biến môi trường)
+CLUSTER_HOST = os.environ.get("GSM_CLUSTER_HOST", "127.0.0.1")
+CLUSTER_PORT = int(os.environ.get("GSM_CLUSTER_PORT", "8770"))
+CLUSTER_TOKEN = os.environ.get("GSM_CLUSTER_TOKEN", "")  # Nếu đặt: mọi request phải mang đúng token (bắt buộc khi nghe ngoài localhost)
+LEASE_SECONDS = float(os.environ.get("GSM_CLUSTER_LEASE_SECONDS", "180"))  # Hết hạn nếu không heartbeat / kết quả
+LEASE_BATCH_PER_PORT = int(os.environ.get("GSM_CLUSTER_BATCH_PER_PORT", "2"))  # Lô thuê = số cổng x N
+RESULTS_PATH = os.environ.get("GSM_CLUSTER_RESULTS", "cluster_results.jsonl")
+CALL_GAP_SECONDS = float(os.environ.get("GSM_CALL_GAP", "2.0"))
+RECONNECT_SECONDS = 5.0
+
+
+class Lease:
+    """1 lô số đang được 1 worker gọi"""
+
+    def __init__(self, worker: str, phones: List[str], lease_seconds: float):
+        self.id = uuid.uuid4().hex[:12]
+        self.worker = worker
+        self.remaining: Set[str] = set(phones)
+        self.expires_at = time.time() + lease_seconds
+
+
+class Coordinator:
+    """Hàng đợi toàn cục + lease + kho kết quả (thread-safe)"""
+
+    def __init__(self, phones: List[str], results_path: str = RESULTS_PATH, lease_seconds: float = LEASE_SECONDS,
+                 token: str = CLUSTER_TOKEN):
+        self.results_path = results_path
+        self.lease_seconds = lease_seconds
+        self.token = token
+        self.results: Dict[str, Dict] = self._load_results(results_path)
+        self.queue: Deque[str] = deque(phone for phone in dict.fromkeys(phones) if phone not in self.results)
+        # Số thực sự còn trong hàng đợi; số có kết quả trước khi được thuê chỉ bị bỏ khỏi set,
+        # mục cũ trong deque được bỏ qua khi thuê (tránh deque.remove O(n) cho mỗi kết quả)
+        self.queued: Set[str] = set(self.queue)
+        self.total = len(self.queued) + len(self.results)
+        self.leases: Dict[str, Lease] = {}
+        self.workers: Dict[str, Dict] = {}
+        self.reassigned = 0
+        self.finished = threading.Event()
+        self._lock = threading.Lock()
+        self._results_file = open(results_path, "a", encoding="utf-8")
+        if self.results:
+            logger.info(f"♻️ Đã có {len(self.results)} kết quả trong {results_path}, còn {len(self.queued)} số")
+        self._check_finished()
+
+    @staticmethod
+    def _load_results(path: str) -> Dict[str, Dict]:
+        results = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        result = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # Dòng cuối ghi dở
+                    results[result["phone_number"]] = result
+        return results
+
+    def _check_finished(self):
+        if not self.queued and not self.leases:
+            self.finished.set()
+
+    def _touch(self, worker: str):
+        """Worker còn sống → gia hạn mọi lease của nó"""
+        now = time.time()
+        self.workers.setdefault(worker, {"ports": 0, "calls": 0})["last_seen"] = now
+        for lease in self.leases.values():
+            if lease.worker == worker:
+                lease.expires_at = now + self.lease_seconds
+
+    def check_token(self, token) -> bool:
+        return not self.token or hmac.compare_digest(str(token or ""), self.token)
+
+    def hello(self, worker: str, ports: int) -> Dict:
+        with self._lock:
+            self.workers.setdefault(worker, {"calls": 0})["ports"] = ports
+            self._touch(worker)
+        logger.info(f"🤝 Worker {worker} kết nối ({ports} cổng)")
+        return {"ok": True, "lease_seconds": self.lease_seconds}
+
+    def lease(self, worker: str, count: int) -> Dict:
+        with self._lock:
+            self._touch(worker)
+            phones = []
+            while self.queue and len(phones) < max(1, count):
+                phone = self.queue.popleft()
+                if phone in self.queued:
+                    self.queued.discard(phone)
+                    phones.append(phone)
+            if not phones:
+                return {"lease_id": None, "phones": [], "done": self.finished.is_set()}
+            lease = Lease(worker, phones, self.lease_seconds)
+            self.leases[lease.id] = lease
+        logger.info(f"📤 Lease {lease.id} → {worker}: {len(phones)} số (còn {len(self.queued)} trong hàng đợi)")
+        return {"lease_id": lease.id, "phones": phones, "done": False}
+
+    def add_result(self, worker: str, result: Dict) -> Dict:
+        """Nhận kết quả (số đã có kết quả → bỏ qua, vd: worker cũ gửi muộn sau khi lease bị chia lại)"""
+        phone = result.get("phone_number")
+        with self._lock:
+            self._touch(worker)
+            for lease_id, lease in list(self.leases.items()):
+                lease.remaining.discard(phone)
+                if not lease.remaining:
+                    del self.leases[lease_id]
+            self.queued.discard(phone)
+            accepted = phone is not None and phone not in self.results
+            if accepted:
+                result["worker"] = worker
+                self.results[phone] = result
+                self.workers[worker]["calls"] = self.workers[worker].get("calls", 0) + 1
+                self._results_file.write(json.dumps(result, ensure_ascii=False) + "\n")
+                self._results_file.flush()
+            self._check_finished()
+        return {"ok": True, "accepted": accepted}
+
+    def heartbeat(self, worker: str) -> Dict:
+        with self._lock:
+            self._touch(worker)
+        return {"ok": True}
+
+    def release(self, worker: str, phones: List[str]) -> Dict:
+        """Worker dừng giữa chừng → trả số chưa gọi về đầu hàng đợi"""
+        with self._lock:
+            self._requeue(phones)
+        logger.info(f"↩️ Worker {worker} trả lại {len(phones)} số")
+        return {"ok": True}
+
+    def _requeue(self, phones):
+        for lease_id, lease in list(self.leases.items()):
+            lease.remaining.difference_update(phones)
+            if not lease.remaining:
+                del self.leases[lease_id]
+        fresh = [phone for phone in dict.fromkeys(phones) if phone not in self.results and phone not in self.queued]
+        self.queue.extendleft(fresh)
+        self.queued.update(fresh)
+
+    def reap_expired(self) -> int:
+        """Lease hết hạn → trả số chưa có kết quả về hàng đợi. Returns: số lượng số được chia lại"""
+        now = time.time()
+        with self._lock:
+            expired = [lease for lease in self.leases.values() if lease.expires_at < now]
+            phones = [phone for lease in expired for phone in lease.remaining]
+            for lease in expired:
+                del self.leases[lease.id]
+            self._requeue(phones)
+            self.reassigned += len(phones)
+        for lease in expired:
+            logger.warning(f"⏰ Lease {lease.id} của {lease.worker} hết hạn, chia lại {len(lease.remaining)} số")
+        return len(phones)
+
+    def get_status(self) -> Dict:
+        with self._lock:
+            return {
+                "total": self.total,
+                "done": len(self.results),
+                "queued": len(self.queued),
+                "leased": sum(len(lease.remaining) for lease in self.leases.values()),
+                "reassigned": self.reassigned,
+                "workers": {name: dict(info) for name, info in self.workers.items()},
+                "finished": self.finished.is_set(),
+            }
+
+    def handle(self, request: Dict) -> Dict:
+        if not self.check_token(request.get("token")):
+            return {"ok": False, "error": "sai token"}
+        op = request.get("op")
+        worker = str(request.get("worker", ""))
+        if op == "status":
+            return self.get_status()
+        if not worker:
+            return {"ok": False, "error": "thiếu worker"}
+        if op == "hello":
+            return self.hello(worker, int(request.get("ports", 0)))
+        if worker not in self.workers:
+            return {"ok": False, "error": "chưa hello"}
+        if op == "lease":
+            return self.lease(worker, int(request.get("count", 1)))
+        if op == "result":
+            return self.add_result(worker, request.get("result") or {})
+        if op == "heartbeat":
+            return self.heartbeat(worker)
+        if op == "release":
+            return self.release(worker, list(request.get("phones", [])))
+        return {"ok": False, "error": f"op không hỗ trợ: {op}"}
+
+    def export(self, output_path: str) -> bool:
+        from controller import categorize_results
+        from export_excel import export_results_to_excel
+
+        with self._lock:
+            results = list(self.results.values())
+        return export_results_to_excel(categorize_results(results), output_path)
+
+    def close(self):
+        self._results_file.close()
+
+
+def _is_loopback(host: str) -> bool:
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+class CoordinatorServer:
+    """TCP server (1 thread / kết nối worker) + thread chia lại lease hết hạn"""
+
+    def __init__(self, coordinator: Coordinator, host: str = CLUSTER_HOST, port: int = CLUSTER_PORT):
+        self.coordinator = coordinator
+        self.host = host
+        self.port = port
+        self._server: Optional[socketserver.ThreadingTCPServer] = None
+        self._stop_event = threading.Event()
+
+    def _make_handler(self):
+        coordinator = self.coordinator
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                for line in self.rfile:
+                    try:
+                        response = coordinator.handle(json.loads(line))
+                    except (ValueError, TypeError, KeyError) as e:
+                        response = {"ok": False, "error": str(e)}
+                    self.wfile.write((json.dumps(response, ensure_ascii=False) + "\n").encode("utf-8"))
+
+        return Handler
+
+    def _reaper_loop(self):
+        while not self._stop_event.wait(min(5.0, self.coordinator.lease_seconds / 3)):
+            self.coordinator.reap_expired()
+
+    def start(self):
+        if not self.coordinator.token and not _is_loopback(self.host):
+            raise ValueError(f"Nghe trên {self.host} (ngoài localhost) cần đặt GSM_CLUSTER_TOKEN")
+        socketserver.ThreadingTCPServer.allow_reuse_address = True
+        self._server = socketserver.ThreadingTCPServer((self.host, self.port), self._make_handler())
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        threading.Thread(target=self._server.serve_forever, name="ClusterCoordinator", daemon=True).start()
+        threading.Thread(target=self._reaper_loop, name="LeaseReaper", daemon=True).start()
+        logger.info(f"🌐 Coordinator lắng nghe {self.host}:{self.port}")
+
+    def stop(self):
+        self._stop_event.set()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+
+class CoordinatorClient:
+    """Kết nối của worker tới coordinator (tự kết nối lại, 1 request tại 1 thời điểm)"""
+
+    def __init__(self, address: str, worker: str, ports: int, token: str = CLUSTER_TOKEN, timeout: float = 30.0):
+        host, _, port = address.rpartition(":")
+        self.address = (host or "127.0.0.1", int(port))
+        self.worker = worker
+        self.ports = ports
+        self.token = token
+        self.timeout = timeout
+        self.lease_seconds = LEASE_SECONDS
+        self._sock: Optional[socket.socket] = None
+        self._file = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        self._sock = socket.create_connection(self.address, timeout=self.timeout)
+        self._file = self._sock.makefile("rwb")
+        response = self._send({"op": "hello", "ports": self.ports})
+        if not response.get("ok"):
+            raise ConnectionError(response.get("error", "hello thất bại"))
+        self.lease_seconds = response.get("lease_seconds", self.lease_seconds)
+
+    def _send(self, request: Dict) -> Dict:
+        request["worker"] = self.worker
+        request["token"] = self.token
+        self._file.write((json.dumps(request, ensure_ascii=False) + "\n").encode("utf-8"))
+        self._file.flush()
+        line = self._file.readline()
+        if not line:
+            raise ConnectionError("coordinator đóng kết nối")
+        return json.loads(line)
+
+    def request(self, request: Dict) -> Dict:
+        """Gửi request, lỗi mạng → kết nối lại và thử lại 1 lần. Lỗi tiếp → OSError"""
+        with self._lock:
+            for attempt in range(2):
+                try:
+                    if self._sock is None:
+                        self._connect()
+                    response = self._send(dict(request))
+                    if response.get("error") == "chưa hello":
+                        # Coordinator vừa khởi động lại → đăng ký lại rồi gửi lại
+                        self._close()
+                        self._connect()
+                        response = self._send(dict(request))
+                    return response
+                except (OSError, ValueError) as e:
+                    self._close()
+                    if attempt == 1:
+                        raise ConnectionError(f"mất kết nối coordinator {self.address}: {e}")
+
+    def _close(self):
+        if self._sock is not None:
+            try:
+                self._sock.close()
+            except OSError:
+                pass
+        self._sock = None
+        self._file = None
+
+    def close(self):
+        with self._lock:
+            self._close()
+
+
+class ClusterWorker:
+    """
+    Chạy các GSM instance của máy này trên số thuê từ coordinator
+
+    Thread của cổng không gọi mạng: số được thuê bởi _lease_loop, kết quả được gửi bởi _sender_loop
+    → coordinator chậm / mất kết nối không làm các cổng đứng chờ sau mỗi cuộc gọi
+    """
+
+    def __init__(self, controller, client: CoordinatorClient, batch_per_port: int = LEASE_BATCH_PER_PORT,
+                 call_gap: float = CALL_GAP_SECONDS):
+        self.controller = controller
+        self.client = client
+        self.num_ports = max(1, len(controller.gsm_instances))
+        self.batch_size = max(1, batch_per_port * self.num_ports)
+        self.call_gap = call_gap
+        self.buffer: Deque[str] = deque()
+        self.outbox: Deque[Dict] = deque()  # Kết quả chưa gửi (đang chờ sender / mất mạng → gửi lại khi kết nối lại)
+        self.done = False
+        self._cond = threading.Condition()
+        self._outbox_lock = threading.Lock()
+        self._outbox_event = threading.Event()
+        self._stop_event = threading.Event()
+        self._sender_stop = threading.Event()
+
+    def _flush_outbox(self):
+        """Gửi các kết quả đang chờ (gọi khi đang giữ _outbox_lock)"""
+        while self.outbox:
+            self.client.request({"op": "result", "result": self.outbox[0]})
+            self.outbox.popleft()
+
+    def _lease_loop(self):
+        """Thuê lô số mới khi buffer còn ít hơn số cổng (các cổng không phải chờ thuê xong mới gọi tiếp)"""
+        while not self._stop_event.is_set() and not self.done:
+            with self._cond:
+                while len(self.buffer) >= self.num_ports and not self._stop_event.is_set():
+                    self._cond.wait(timeout=1.0)
+            if self._stop_event.is_set():
+                break
+            try:
+                response = self.client.request({"op": "lease", "count": self.batch_size})
+            except ConnectionError as e:
+                self.controller.log(f"⚠️ {e} - thử lại sau {RECONNECT_SECONDS:.0f}s")
+                self._stop_event.wait(RECONNECT_SECONDS)
+                continue
+            phones = response.get("phones", [])
+            with self._cond:
+                self.buffer.extend(phones)
+                if not phones and response.get("done"):
+                    self.done = True
+                self._cond.notify_all()
+            if not phones and not self.done:
+                # Số còn lại đang được worker khác gọi → chờ xem lease có bị chia lại không
+                self._stop_event.wait(RECONNECT_SECONDS)
+
+    def _next_phone(self) -> Optional[str]:
+        """Số tiếp theo cho 1 cổng (chờ _lease_loop nếu buffer rỗng)"""
+        with self._cond:
+            while not self._stop_event.is_set():
+                if self.buffer:
+                    phone = self.buffer.popleft()
+                    self._cond.notify_all()  # Báo _lease_loop buffer vừa giảm
+                    return phone
+                if self.done:
+                    return None
+                self._cond.wait(timeout=1.0)
+            return None
+
+    def _send_result(self, result: Dict):
+        """Chỉ đưa kết quả vào outbox, _sender_loop gửi đi"""
+        self.outbox.append(result)
+        self._outbox_event.set()
+
+    def _sender_loop(self):
+        while not self._sender_stop.is_set():
+            self._outbox_event.wait(timeout=1.0)
+            self._outbox_event.clear()
+            if not self.outbox:
+                continue
+            try:
+                with self._outbox_lock:
+                    self._flush_outbox()
+            except ConnectionError as e:
+                self.controller.log(f"⚠️ Chưa gửi được kết quả ({len(self.outbox)} đang chờ): {e}")
+                self._sender_stop.wait(RECONNECT_SECONDS)
+
+    def _port_loop(self, instance):
+        instance.ready_since = time.time()
+        while not self._stop_event.is_set():
+            phone = self._next_phone()
+            if phone is None:
+                break
+            result = instance.make_call_and_classify(phone)
+            if instance.result_callback:
+                instance.result_callback(result, instance.port)
+            instance.call_count += 1
+            self._send_result(result)
+            instance.log(f"📊 {phone}: {result['result']}")
+
+            if instance.call_count % instance.max_calls_before_reset == 0:
+                instance.log(f"🔄 Đã gọi {instance.call_count} số, đang reset...")
+                instance._reset_and_continue()
+            self._stop_event.wait(self.call_gap)
+
+    def _heartbeat_loop(self):
+        while not self._stop_event.wait(max(1.0, self.client.lease_seconds / 3)):
+            try:
+                self.client.request({"op": "heartbeat"})
+            except ConnectionError as e:
+                self.controller.log(f"⚠️ Heartbeat thất bại: {e}")
+
+    def run(self):
+        """Chạy đến khi coordinator hết số hoặc stop(). Trả lại số chưa gọi khi dừng"""
+        self.controller.open_result_store()  # Bản sao kết quả tại máy worker (kể cả khi mất kết nối coordinator)
+        threading.Thread(target=self._heartbeat_loop, name="ClusterHeartbeat", daemon=True).start()
+        sender = threading.Thread(target=self._sender_loop, name="ClusterSender", daemon=True)
+        sender.start()
+        leaser = threading.Thread(target=self._lease_loop, name="ClusterLease", daemon=True)
+        leaser.start()
+        threads = [threading.Thread(target=self._port_loop, args=(instance,), name=f"ClusterPort-{port}", daemon=True)
+                   for port, instance in self.controller.gsm_instances.items()]
+        self.controller.is_running = True
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.controller.is_running = False
+
+        # Không thuê thêm; chờ lần thuê đang dở để số vừa thuê cũng được trả lại
+        self._stop_event.set()
+        with self._cond:
+            self._cond.notify_all()
+        leaser.join()
+        self._sender_stop.set()
+        sender.join()
+
+        try:
+            with self._outbox_lock:
+                self._flush_outbox()
+            with self._cond:
+                if self.buffer:
+                    self.client.request({"op": "release", "phones": list(self.buffer)})
+                    self.buffer.clear()
+        except ConnectionError as e:
+            self.controller.log(f"⚠️ Không trả được số chưa gọi / kết quả chưa gửi "
+                                f"(coordinator sẽ chia lại khi lease hết hạn): {e}")
+        self.client.close()
+
+    def stop(self):
+        """Không lấy số mới; các cuộc gọi đang dở vẫn chạy xong"""
+        self._stop_event.set()
+        with self._cond:
+            self._cond.notify_all()
+
+
+def _install_stop_handler(callback):
+    for name in ("SIGINT", "SIGTERM", "SIGBREAK"):
+        signum = getattr(signal, name, None)
+        if signum is not None:
+            signal.signal(signum, lambda *_: callback())
+
+
+def run_coordinator(args) -> int:
+    from controller import is_valid_phone_number
+
+    with open(args.phones, "r", encoding="utf-8") as f:
+        phones = [line.strip() for line in f if is_valid_phone_number(line.strip())]
+    if not phones:
+        logger.error(f"❌ Không có số hợp lệ trong {args.phones}")
+        return 1
+
+    coordinator = Coordinator(phones, results_path=args.results, lease_seconds=args.lease_seconds)
+    server = CoordinatorServer(coordinator, host=args.host, port=args.port)
+    try:
+        server.start()
+    except ValueError as e:
+        logger.error(f"❌ {e}")
+        coordinator.close()
+        return 1
+    stop_event = threading.Event()
+    _install_stop_handler(stop_event.set)
+
+    last_report = 0.0
+    while not coordinator.finished.is_set() and not stop_event.wait(1.0):
+        if time.time() - last_report >= 30:
+            status = coordinator.get_status()
+            logger.info(f"📊 {status['done']}/{status['total']} số, {status['leased']} đang gọi, "
+                        f"{len(status['workers'])} worker")
+            last_report = time.time()
+
+    if coordinator.finished.is_set():
+        # Chờ các worker đang đợi lease nhận được "done" trước khi đóng server
+        stop_event.wait(2 * RECONNECT_SECONDS)
+    server.stop()
+    coordinator.close()
+    logger.info(f"💾 Kết quả thô: {args.results}")
+    if args.output and not coordinator.export(args.output):
+        return 4
+    return 0 if coordinator.finished.is_set() else 5
+
+
+def run_worker(args) -> int:
+    # Cần cho STT worker processes (spawn) khi chạy từ exe PyInstaller
+    multiprocessing.freeze_support()
+    from controller import GSMController
+
+    controller = GSMController(max_ports=args.max_ports)
+    controller.start_keyword_rules_watcher()
+    model_thread = threading.Thread(target=controller.warm_up_models, name="ModelWarmUp", daemon=True)
+    model_thread.start()
+    if not controller.scan_gsm_ports():
+        logger.error("❌ Không tìm thấy cổng GSM nào")
+        return 2
+    model_thread.join()
+
+    client = CoordinatorClient(args.coordinator, args.name or socket.gethostname(), len(controller.gsm_instances))
+    worker = ClusterWorker(controller, client)
+    _install_stop_handler(worker.stop)
+    try:
+        worker.run()
+    finally:
+        controller.final_reset_all_instances()
+    return 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Chia danh sách số cho nhiều máy / bank modem")
+    sub = parser.add_subparsers(dest="role", required=True)
+
+    coord = sub.add_parser("coordinator", help="Giữ hàng đợi toàn cục và kho kết quả")
+    coord.add_argument("--phones", required=True, help="File danh sách số")
+    coord.add_argument("--results", default=RESULTS_PATH, help="File JSONL kết quả (chạy lại → tiếp tục từ đây)")
+    coord.add_argument("--output", help="Xuất Excel khi xong")
+    coord.add_argument("--host", default=CLUSTER_HOST)
+    coord.add_argument("--port", type=int, default=CLUSTER_PORT)
+    coord.add_argument("--lease-seconds", type=float, default=LEASE_SECONDS)
+
+    work = sub.add_parser("worker", help="Gọi số trên các cổng GSM của máy này")
+    work.add_argument("--coordinator", required=True, help="host:port của coordinator")
+    work.add_argument("--name", help="Tên worker (mặc định: hostname)")
+    work.add_argument("--max-ports", type=int, default=32)
+
+    args = parser.parse_args()
+    if args.role == "coordinator":
+        logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+        return run_coordinator(args)
+    return run_worker(args)
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
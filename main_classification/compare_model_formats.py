@@ -0,0 +1,137 @@
+"""
+So sánh độ chính xác và tốc độ giữa các model format (fp32 vs int8, ...) trên bộ AMR mẫu
+Baseline là fp32: đo tỷ lệ nhãn trùng khớp, CER giữa 2 transcript, thời gian inference, RAM weights
+
+Usage:
+    python compare_model_formats.py --formats fp32 int8 --limit 200 --output compare_int8.json
+"""
+
+import argparse
+import glob
+import json
+import os
+import time
+
+import torch
+from transformers import Wav2Vec2Processor
+
+from model_backends import MODEL_FORMATS, load_stt_model, model_device, model_size_bytes
+from spk_to_text_wav2 import load_audio_pcm
+from string_detection import keyword_in_text, labels
+
+MODEL_ID = "nguyenvulebinh/wav2vec2-base-vietnamese-250h"
+DEFAULT_AUDIO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "audio_to_test_speak_to_text")
+
+
+def edit_distance(a: str, b: str) -> int:
+    """Levenshtein distance giữa 2 chuỗi"""
+    if len(a) < len(b):
+        a, b = b, a
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        previous = current
+    return previous[-1]
+
+
+def run_format(model_format: str, processor, corpus: list, device: str) -> dict:
+    """Chạy STT cho toàn bộ corpus với 1 model format"""
+    load_start = time.time()
+    model = load_stt_model(MODEL_ID, device, model_format)
+    run_device = model_device(model_format, device)
+    load_time = time.time() - load_start
+
+    texts = []
+    inference_time = 0.0
+    audio_seconds = 0.0
+    with torch.no_grad():
+        # Warm-up để không tính chi phí khởi tạo vào kết quả
+        if corpus:
+            warmup = processor(corpus[0][1][:16000], return_tensors="pt", sampling_rate=16000).input_values.to(run_device)
+            model(warmup)
+
+        for _, speech in corpus:
+            input_values = processor(speech, return_tensors="pt", sampling_rate=16000).input_values.to(run_device)
+            start = time.time()
+            logits = model(input_values).logits
+            inference_time += time.time() - start
+            audio_seconds += len(speech) / 16000
+            texts.append(processor.batch_decode(torch.argmax(logits, dim=-1))[0])
+
+    return {
+        "format": model_format,
+        "device": run_device,
+        "load_time": load_time,
+        "weights_bytes": model_size_bytes(model),
+        "inference_time": inference_time,
+        "real_time_factor": inference_time / audio_seconds if audio_seconds > 0 else 0,
+        "texts": texts,
+        "labels": [labels[keyword_in_text(text)] for text in texts],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="So sánh model formats trên bộ AMR mẫu")
+    parser.add_argument("--audio-dir", default=DEFAULT_AUDIO_DIR, help="Thư mục chứa file .amr")
+    parser.add_argument("--formats", nargs="+", default=["fp32", "int8"], choices=MODEL_FORMATS)
+    parser.add_argument("--limit", type=int, default=0, help="Chỉ chạy N file đầu tiên (0 = tất cả)")
+    parser.add_argument("--device", default="cpu")
+    parser.add_argument("--output", help="Ghi kết quả chi tiết ra file JSON")
+    args = parser.parse_args()
+
+    files = sorted(glob.glob(os.path.join(args.audio_dir, "*.amr")))
+    if args.limit > 0:
+        files = files[:args.limit]
+    if not files:
+        print(f"❌ Không tìm thấy file .amr trong {args.audio_dir}")
+        return
+
+    print(f"🎵 Đang decode {len(files)} file...")
+    corpus = [(os.path.basename(f), load_audio_pcm(f)) for f in files]
+    processor = Wav2Vec2Processor.from_pretrained(MODEL_ID)
+
+    formats = list(dict.fromkeys(["fp32"] + args.formats))  # fp32 luôn là baseline
+    results = {}
+    for model_format in formats:
+        print(f"\n[Running {model_format}]...")
+        results[model_format] = run_format(model_format, processor, corpus, args.device)
+
+    baseline = results["fp32"]
+    summary = []
+    print(f"\n{'='*80}")
+    print(f"{'Format':<8}{'Load(s)':>10}{'Infer(s)':>10}{'RTF':>8}{'Speedup':>9}{'Weights(MB)':>13}{'Label agree':>13}{'CER':>8}")
+    for model_format, result in results.items():
+        agree = sum(a == b for a, b in zip(result["labels"], baseline["labels"]))
+        chars = sum(len(t) for t in baseline["texts"])
+        errors = sum(edit_distance(a, b) for a, b in zip(result["texts"], baseline["texts"]))
+        row = {
+            "format": model_format,
+            "device": result["device"],
+            "load_time": result["load_time"],
+            "inference_time": result["inference_time"],
+            "real_time_factor": result["real_time_factor"],
+            "speedup_vs_fp32": baseline["inference_time"] / result["inference_time"] if result["inference_time"] > 0 else 0,
+            "weights_mb": result["weights_bytes"] / 1024 / 1024,
+            "label_agreement": agree / len(corpus),
+            "cer_vs_fp32": errors / chars if chars > 0 else 0,
+        }
+        summary.append(row)
+        print(f"{model_format:<8}{row['load_time']:>10.2f}{row['inference_time']:>10.2f}{row['real_time_factor']:>8.3f}"
+              f"{row['speedup_vs_fp32']:>8.2f}x{row['weights_mb']:>13.1f}{row['label_agreement']*100:>12.1f}%{row['cer_vs_fp32']*100:>7.2f}%")
+    print(f"{'='*80}")
+
+    if args.output:
+        details = [
+            {"file": name, **{f"{fmt}_text": results[fmt]["texts"][i] for fmt in results},
+             **{f"{fmt}_label": results[fmt]["labels"][i] for fmt in results}}
+            for i, (name, _) in enumerate(corpus)
+        ]
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"summary": summary, "files": details}, f, ensure_ascii=False, indent=2)
+        print(f"💾 Đã ghi kết quả ra {args.output}")
+
+
+if __name__ == "__main__":
+    main()
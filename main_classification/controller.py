@@ -6,17 +6,21 @@ Quản lý nhiều GSM instances, phân phối số điện thoại, và tổng
 import threading
 import time
 import logging
-from typing import List, Dict, Optional
+from typing import Callable, List, Dict, Optional, Tuple
 from pathlib import Path
 import os
 from datetime import datetime
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
 from gsm_instance import GSMInstance
+from model_manager import model_manager
 from detect_gsm_port import scan_gsm_ports_parallel
-from string_detection import keyword_in_text, labels
+from string_detection import add_rules_listener, get_keyword_rules, relabel_result
+from keyword_rules import keyword_rules_watcher
+from metrics import METRICS_ENABLED, MetricsServer
+from result_store import RESULT_STORE_ENABLED, ResultStore
 from spk_to_text_wav2 import convert_to_wav, transcribe_wav2vec2
-from export_excel import export_results_to_excel
+from export_excel import ExportTask
 
 # Cấu hình logging - ghi ra file
 log_dir = "logs"
@@ -33,6 +37,46 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Các cột kết quả mặc định (thứ tự cột trong file Excel)
+RESULT_CATEGORIES = [
+    "hoạt động",
+    "leave_message",
+    "be_blocked",
+    "can_not_connect",
+    "incorrect",
+    "ringback_tone",
+    "waiting_tone",
+    "mute",
+    "lỗi",  # Thêm cột cho các số bị lỗi
+]
+
+
+def is_valid_phone_number(phone: str) -> bool:
+    """Số hợp lệ: bắt đầu bằng 0 và có 10-11 chữ số"""
+    return bool(phone) and phone.startswith('0') and phone.isdigit() and len(phone) in [10, 11]
+
+
+def result_category(categories, result: Dict) -> str:
+    """Cột của 1 kết quả: nhãn đã có cột hoặc nhãn trong file từ khóa, còn lại vào cột lỗi"""
+    category = result.get("result", "incorrect")
+    if category in categories or category in get_keyword_rules().labels:
+        return category
+    return "lỗi"
+
+
+def add_to_category(categories: Dict[str, List[Dict]], result: Dict):
+    """Xếp 1 kết quả vào đúng cột (nhãn mới từ file từ khóa được tạo cột riêng)"""
+    categories.setdefault(result_category(categories, result), []).append(result)
+
+
+def categorize_results(results: List[Dict]) -> Dict[str, List[Dict]]:
+    """Chia danh sách kết quả theo cột (định dạng của export_results_to_excel)"""
+    categories = {category: [] for category in RESULT_CATEGORIES}
+    for result in results:
+        add_to_category(categories, result)
+    return categories
+
+
 class GSMController:
     """Controller chính điều phối toàn bộ hệ thống GSM"""
     
@@ -41,20 +85,16 @@ class GSMController:
         self.gsm_instances: Dict[str, GSMInstance] = {}
         self.gsm_ports_list: List[str] = []  # Lưu danh sách cổng GSM
         self.phone_list: List[str] = []  # Danh sách số điện thoại
-        self.results: Dict[str, List[Dict]] = {
-            "hoạt động": [],
-            "leave_message": [],
-            "be_blocked": [],
-            "can_not_connect": [],
-            "incorrect": [],
-            "ringback_tone": [],
-            "waiting_tone": [],
-            "mute": [],
-            "lỗi": []  # Thêm cột cho các số bị lỗi
-        }
+        self.results: Dict[str, List[Dict]] = {category: [] for category in RESULT_CATEGORIES}
         self.is_running = False
         self.is_stopping = False
         self.log_callback = None
+        self.metrics_server: Optional[MetricsServer] = None
+        self.result_store: Optional[ResultStore] = None  # Kết quả của lần chạy hiện tại (SQLite + CSV/Parquet)
+        self.export_task: Optional[ExportTask] = None
+
+        # Khi file từ khóa được reload → phân loại lại các transcript đã có
+        add_rules_listener(self.reclassify_results)
         
     def set_log_callback(self, callback):
         """Thiết lập callback để gửi log lên GUI"""
@@ -151,6 +191,20 @@ class GSMController:
         self.log(f"🎯 Tạo thành công {len(gsm_ports)} GSM instances")
         return gsm_ports
     
+    def warm_up_models(self, progress_callback=None) -> bool:
+        """
+        Load STT model + warm-up (chạy song song với scan_gsm_ports lúc khởi động)
+
+        Returns:
+            True nếu thành công, False nếu thất bại
+        """
+        try:
+            model_manager.warm_up(progress_callback)
+            return True
+        except Exception as e:
+            self.log(f"❌ Lỗi khi load STT model: {e}")
+            return False
+
     def load_phone_list(self, file_path: str) -> bool:
         """Tải danh sách số điện thoại từ file"""
         try:
@@ -165,7 +219,7 @@ class GSMController:
             for line in lines:
                 phone = line.strip()
                 # Validate số điện thoại: phải bắt đầu bằng 0 và có 10-11 chữ số
-                if phone and phone.startswith('0') and phone.isdigit() and len(phone) in [10, 11]:
+                if is_valid_phone_number(phone):
                     # Lấy nguyên số từ danh sách, không chuyển đổi
                     self.phone_list.append(phone)
                 elif phone:
@@ -229,6 +283,9 @@ class GSMController:
         
         # Xóa kết quả cũ
         self.clear_results()
+
+        # Mỗi lần chạy ghi kết quả ra 1 bộ file mới ngay khi từng cuộc gọi xong
+        self.open_result_store()
         
         # Bắt đầu xử lý trên tất cả instances
         self.is_running = True
@@ -243,6 +300,13 @@ class GSMController:
         
         return True
     
+    def is_processing_finished(self) -> bool:
+        """True khi không còn instance nào đang chạy thread xử lý danh sách"""
+        return not any(
+            instance.processing_thread is not None and instance.processing_thread.is_alive()
+            for instance in self.gsm_instances.values()
+        )
+
     def stop_processing(self):
         """Dừng xử lý trên tất cả GSM instances"""
         if not self.is_running:
@@ -262,8 +326,9 @@ class GSMController:
         """Thu thập kết quả từ tất cả GSM instances"""
         self.log("📊 Đang thu thập kết quả...")
         
-        # Xóa kết quả cũ
-        self.clear_results()
+        # Xóa kết quả đã gom lần trước (giữ nguyên kết quả trong instances để gom lại)
+        for category in self.results:
+            self.results[category] = []
         
         # Thu thập kết quả từ tất cả instances
         total_results = 0
@@ -279,21 +344,12 @@ class GSMController:
                 phone_number = result.get("phone_number", "")
                 processed_phones.add(phone_number)
                 
-                if category in self.results:
-                    self.results[category].append(result)
-                else:
-                    self.results["lỗi"].append(result)
+                self._add_to_category(result)
         
         # Thêm các số chưa được xử lý vào cột lỗi
-        if self.phone_list:
-            for phone in self.phone_list:
-                if phone not in processed_phones:
-                    self.results["lỗi"].append({
-                        "phone_number": phone,
-                        "result": "lỗi",
-                        "reason": "Chưa được xử lý"
-                    })
-                    self.log(f"⚠️ Số {phone} chưa được xử lý")
+        for unprocessed in self._unprocessed_results(processed_phones):
+            self.results["lỗi"].append(unprocessed)
+            self.log(f"⚠️ Số {unprocessed['phone_number']} chưa được xử lý")
         
         total_with_unprocessed = total_results + len(self.results["lỗi"])
         self.log(f"📊 Đã thu thập {total_results} kết quả + {len(self.results['lỗi'])} số chưa xử lý = {total_with_unprocessed} tổng cộng")
@@ -303,6 +359,117 @@ class GSMController:
             if results:
                 self.log(f"📈 {category}: {len(results)} kết quả")
     
+    def _unprocessed_results(self, processed_phones) -> List[Dict]:
+        """Các số trong danh sách chưa có kết quả (xếp vào cột lỗi khi xuất)"""
+        return [{"phone_number": phone, "result": "lỗi", "reason": "Chưa được xử lý"}
+                for phone in self.phone_list if phone not in processed_phones]
+
+    def _snapshot_categories(self) -> Tuple[Dict[str, object], int, Optional[Callable[[], None]]]:
+        """
+        Chụp kết quả hiện có để xuất (các cuộc gọi vẫn tiếp tục, không đụng tới self.results)
+
+        - Có result store: 1 read transaction SQLite, mỗi cột là 1 truy vấn lọc theo các nhãn của cột đó
+        - Không có: copy các dict kết quả trong instances rồi chia cột
+
+        Returns:
+            (các cột, tổng số dòng, hàm dọn dẹp sau khi xuất xong)
+        """
+        store = self.result_store  # Chạy trên thread xuất: store có thể bị đóng (= None) giữa chừng
+        if store is None:
+            snapshot = [dict(result) for instance in list(self.gsm_instances.values())
+                        for result in list(instance.results)]
+            unprocessed = self._unprocessed_results({result.get("phone_number") for result in snapshot})
+            if unprocessed:
+                self.log(f"⚠️ {len(unprocessed)} số chưa được xử lý")
+            categories = categorize_results(snapshot + unprocessed)
+            return categories, len(snapshot) + len(unprocessed), None
+
+        snapshot = store.snapshot()
+        # Nhãn → cột chỉ tính 1 lần (nhãn lạ / NULL vào cột lỗi), mỗi cột chỉ đọc các dòng có nhãn của nó
+        category_labels: Dict[str, List[Optional[str]]] = {category: [] for category in RESULT_CATEGORIES}
+        for label in snapshot.labels():
+            category_labels.setdefault(result_category(category_labels, {"result": label}), []).append(label)
+        unprocessed = self._unprocessed_results(snapshot.phone_numbers())
+        if unprocessed:
+            self.log(f"⚠️ {len(unprocessed)} số chưa được xử lý")
+
+        def rows(category):
+            if category_labels[category]:
+                yield from snapshot.iter_results(category_labels[category])
+            if category == "lỗi":
+                yield from unprocessed
+
+        return ({category: rows(category) for category in category_labels}, snapshot.count + len(unprocessed),
+                snapshot.close)
+
+    def has_results(self) -> bool:
+        """Đã có kết quả nào để xuất chưa"""
+        if self.result_store is not None and len(self.result_store):
+            return True
+        return any(self.results.values()) or any(instance.results for instance in self.gsm_instances.values())
+
+    def _add_to_category(self, result: Dict):
+        """Xếp 1 kết quả vào đúng cột của self.results"""
+        add_to_category(self.results, result)
+
+    def start_keyword_rules_watcher(self):
+        """Load file từ khóa (nếu có) và theo dõi thay đổi trong lúc chạy"""
+        keyword_rules_watcher.start()
+        stats = keyword_rules_watcher.get_statistics()
+        self.log(f"📚 Bộ từ khóa: {stats['labels']} nhãn, {stats['phrases']} cụm từ ({stats['active_source']})")
+
+    def start_metrics_server(self) -> bool:
+        """Mở endpoint /metrics (Prometheus) nếu GSM_METRICS=1"""
+        if not METRICS_ENABLED or self.metrics_server is not None:
+            return False
+        server = MetricsServer(self)
+        if not server.start():
+            return False
+        self.metrics_server = server
+        self.log(f"📈 Metrics: http://{server.host}:{server.port}/metrics")
+        return True
+
+    def reclassify_results(self, rules=None) -> int:
+        """
+        Phân loại lại các kết quả đã có transcript theo bộ từ khóa hiện tại (không cần gọi lại)
+
+        Cả kết quả do CTC keyword spotter gán nhãn cũng được phân loại lại theo transcript (xem relabel_result);
+        nhãn cũ giữ trong previous_result / previous_label_source
+
+        Returns:
+            Số kết quả bị đổi nhãn
+        """
+        rules = rules or get_keyword_rules()
+
+        # Kết quả trong instances và trong self.results là cùng các dict → gom theo id để không xử lý 2 lần
+        pending = {}
+        for instance in list(self.gsm_instances.values()):
+            for result in list(instance.results):
+                pending[id(result)] = result
+        for category_results in self.results.values():
+            for result in list(category_results):
+                pending[id(result)] = result
+
+        checked = sum(1 for result in pending.values() if result.get("transcribed_text"))
+        relabeled = [result for result in pending.values() if relabel_result(result, rules)]
+        changed = len(relabeled)
+
+        # Ghi nhãn mới vào result store (bản ghi của CSV/Parquet giữ nguyên nhãn lúc gọi)
+        if self.result_store is not None:
+            for result in relabeled:
+                self.result_store.update(result)
+
+        # Xếp lại các cột đã thu thập theo nhãn mới
+        if changed:
+            collected = [result for category_results in self.results.values() for result in category_results]
+            for category in self.results:
+                self.results[category] = []
+            for result in collected:
+                self._add_to_category(result)
+
+        self.log(f"🔁 Đã phân loại lại {checked} transcript theo bộ từ khóa mới: {changed} kết quả đổi nhãn")
+        return changed
+
     def get_processing_status(self) -> Dict:
         """Lấy trạng thái xử lý của tất cả instances"""
         status = {
@@ -335,30 +502,58 @@ class GSMController:
         for instance in self.gsm_instances.values():
             instance.results = []
     
-    def export_results(self, output_path: str = None) -> bool:
-        """Xuất kết quả ra file Excel"""
-        try:
-            # Thu thập kết quả trước khi xuất
-            self.collect_results()
-
-            if output_path is None:
-                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                output_path = f"gsm_results_{timestamp}.xlsx"
-
-            # Xuất ra Excel với định dạng dict đúng
-            success = export_results_to_excel(self.results, output_path)
-
-            if success:
-                self.log(f"✅ Đã xuất kết quả ra file: {output_path}")
-                return True
+    def _create_export_task(self, output_path: Optional[str], progress_callback=None,
+                            done_callback=None) -> ExportTask:
+        if output_path is None:
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            output_path = f"gsm_results_{timestamp}.xlsx"
+
+        def on_done(task: ExportTask):
+            if task.status == "completed":
+                self.log(f"✅ Đã xuất kết quả ra file: {task.output_path}")
+            elif task.status == "cancelled":
+                self.log("🚫 Đã hủy xuất kết quả")
             else:
                 self.log("❌ Không thể xuất kết quả")
-                return False
+            if done_callback:
+                done_callback(task)
 
+        def snapshot():
+            categories, total, on_finish = self._snapshot_categories()
+            self.log(f"📤 Đang xuất {total} kết quả...")
+            return categories, total, on_finish
+
+        # Snapshot được chụp trong run() → với export_results_async là trên thread xuất, không phải thread GUI
+        return ExportTask(None, output_path, progress_callback=progress_callback, done_callback=on_done,
+                          snapshot=snapshot)
+
+    def export_results(self, output_path: str = None) -> bool:
+        """Xuất kết quả ra file Excel (chạy trên thread hiện tại)"""
+        try:
+            return self._create_export_task(output_path).run()
         except Exception as e:
             self.log(f"❌ Lỗi khi xuất kết quả: {e}")
             return False
-    
+
+    def export_results_async(self, output_path: str = None, progress_callback=None,
+                             done_callback=None) -> Optional[ExportTask]:
+        """
+        Xuất kết quả trong thread nền từ snapshot (GUI không bị treo, các cổng vẫn gọi tiếp)
+
+        Returns:
+            ExportTask (cancel() để hủy), None nếu đang có 1 lần xuất khác chạy hoặc lỗi
+        """
+        if self.export_task is not None and self.export_task.is_running():
+            self.log("⚠️ Đang xuất kết quả rồi")
+            return None
+        try:
+            self.export_task = self._create_export_task(output_path, progress_callback, done_callback)
+        except Exception as e:
+            self.log(f"❌ Lỗi khi xuất kết quả: {e}")
+            return None
+        self.export_task.start()
+        return self.export_task
+
     def reset_all_gsm_instances(self):
         """Reset tất cả GSM instances về baudrate mặc định"""
         if not self.gsm_instances:
@@ -434,7 +629,35 @@ class GSMController:
                     self.log(f"❌ Exception khi reset {port}: {e}")
 
         self.log(f"🎯 Đã reset cuối cùng thành công {reset_count}/{num_instances} instances")
+        self.close_result_store()
     
+    def open_result_store(self) -> bool:
+        """
+        Mở 1 bộ file kết quả mới và gắn vào result_callback của mọi instance
+        (start_processing, JobManager, ClusterWorker đều đẩy kết quả qua result_callback)
+        """
+        if not RESULT_STORE_ENABLED:
+            return False
+        self.close_result_store()
+        self.result_store = ResultStore()
+        for instance in self.gsm_instances.values():
+            instance.result_callback = self.result_store.append
+        self.log(f"💾 Kết quả được ghi dần vào: {', '.join(self.result_store.paths)}")
+        return True
+
+    def close_result_store(self):
+        """Ghi nốt kết quả đang đệm và đóng các file kết quả (Parquet chỉ đọc được sau khi đóng)"""
+        store = self.result_store
+        if store is None:
+            return
+        # Gỡ callback trước khi đóng để cuộc gọi nào kết thúc muộn không ghi vào store đã đóng
+        for instance in self.gsm_instances.values():
+            if instance.result_callback == store.append:
+                instance.result_callback = None
+        self.result_store = None
+        store.close()
+        self.log(f"💾 Đã đóng file kết quả: {store.base_path}.*")
+
     def disconnect_all(self):
         """Ngắt kết nối tất cả GSM instances"""
         for port, instance in self.gsm_instances.items():
@@ -105,8 +105,17 @@ LONG_WAIT = 5.0     # wait for USSD reply (USSD có thể mất vài giây)
 # Danh sách mã USSD thử (thông dụng ở VN nhưng không chắc chắn với mọi nhà mạng)
 USSD_CODES = ["*101#", "*101*1#", "*123#", "*100#"]
 
+# Cổng bổ sung không có trong list_ports.comports() (vd: pty của gsm_simulator.py)
+EXTRA_PORTS = [p.strip() for p in os.environ.get("GSM_EXTRA_PORTS", "").split(",") if p.strip()]
+EXTRA_PORTS_FILE = os.environ.get("GSM_EXTRA_PORTS_FILE", "")
+
 def list_com_ports():
-    return [p.device for p in list_ports.comports()]
+    ports = [p.device for p in list_ports.comports()]
+    extra = list(EXTRA_PORTS)
+    if EXTRA_PORTS_FILE and os.path.exists(EXTRA_PORTS_FILE):
+        with open(EXTRA_PORTS_FILE, "r", encoding="utf-8") as f:
+            extra += [line.strip() for line in f if line.strip()]
+    return ports + [p for p in extra if p not in ports]
 
 def read_all(ser, wait_time):
     """Đọc dữ liệu trong wait_time giây (polling)"""
@@ -1,10 +1,13 @@
 import pandas as pd
 from openpyxl import Workbook
-from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font, PatternFill, Alignment, Border, Side, NamedStyle
 from openpyxl.utils.dataframe import dataframe_to_rows
 from datetime import datetime
+import itertools
 import logging
 import os
+import threading
 
 # Cấu hình logging
 log_dir = "logs"
@@ -21,200 +24,320 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-def export_results_to_excel(results: dict, output_path: str) -> bool:
+# Màu sắc cho từng loại
+CATEGORY_COLORS = {
+    "hoạt động": "00FF00",      # Xanh lá
+    "leave_message": "FFFF00",   # Vàng
+    "be_blocked": "FF0000",     # Đỏ
+    "can_not_connect": "FFA500", # Cam
+    "incorrect": "800080",      # Tím
+    "ringback_tone": "00FFFF",   # Cyan
+    "waiting_tone": "FFC0CB",   # Hồng
+    "mute": "808080"            # Xám
+}
+
+DETAIL_HEADERS = ["STT", "Số Điện Thoại", "Kết Quả", "Lý Do", "Nội Dung STT", "Ghi Chú"]
+DETAIL_COLUMN_WIDTHS = {
+    'A': 8,   # STT
+    'B': 18,  # Số điện thoại
+    'C': 20,  # Kết quả
+    'D': 30,  # Lý do
+    'E': 50,  # Nội dung STT
+    'F': 25   # Ghi chú
+}
+SUMMARY_COLUMN_WIDTHS = {'A': 8, 'B': 25, 'C': 12, 'D': 12}
+
+PROGRESS_EVERY = 500  # Báo tiến độ / kiểm tra hủy mỗi N dòng
+
+HEADER_COLOR = "366092"
+ALT_ROW_COLOR = "F2F2F2"
+TOTAL_COLOR = "D9D9D9"
+
+
+def _solid_fill(color: str) -> PatternFill:
+    return PatternFill(start_color=color, end_color=color, fill_type="solid")
+
+
+def _register_styles(wb: Workbook, categories) -> None:
+    """
+    Đăng ký named style dùng chung cho cả file
+
+    Mỗi ô chỉ tham chiếu tới tên style → không tạo Font/Fill/Alignment cho từng ô
+    """
+    center = Alignment(horizontal='center')
+    wrap = Alignment(wrap_text=True, vertical='top')
+    styles = [
+        NamedStyle(name="gsm_report_title", font=Font(size=16, bold=True, color="000000"), alignment=center),
+        NamedStyle(name="gsm_report_time", font=Font(size=10, italic=True)),
+        NamedStyle(name="gsm_header", font=Font(bold=True, color="FFFFFF"), fill=_solid_fill(HEADER_COLOR),
+                   alignment=Alignment(horizontal='center', vertical='center')),
+        NamedStyle(name="gsm_center", alignment=center),
+        NamedStyle(name="gsm_total", font=Font(bold=True), fill=_solid_fill(TOTAL_COLOR), alignment=center),
+        NamedStyle(name="gsm_row_alt", fill=_solid_fill(ALT_ROW_COLOR)),
+        NamedStyle(name="gsm_wrap", alignment=wrap),
+        NamedStyle(name="gsm_wrap_alt", alignment=wrap, fill=_solid_fill(ALT_ROW_COLOR)),
+    ]
+    for category in categories:
+        color = CATEGORY_COLORS.get(category, "FFFFFF")
+        styles.append(NamedStyle(name=f"gsm_title_{category}", font=Font(size=14, bold=True, color="FFFFFF"),
+                                 fill=_solid_fill(color), alignment=center))
+        if category in CATEGORY_COLORS:
+            styles.append(NamedStyle(name=f"gsm_category_{category}", fill=_solid_fill(color)))
+    for style in styles:
+        wb.add_named_style(style)
+
+
+class ExportCancelled(Exception):
+    """Xuất file bị hủy giữa chừng"""
+
+
+class _Progress:
+    """Đếm số dòng đã ghi, gọi callback(done, total) và kiểm tra hủy mỗi PROGRESS_EVERY dòng"""
+
+    def __init__(self, total, callback=None, cancel_event=None):
+        self.total = total
+        self.done = 0
+        self.callback = callback
+        self.cancel_event = cancel_event
+
+    def step(self):
+        self.done += 1
+        if self.done % PROGRESS_EVERY == 0:
+            self.report()
+
+    def report(self):
+        if self.cancel_event is not None and self.cancel_event.is_set():
+            raise ExportCancelled()
+        if self.callback:
+            self.callback(self.done, self.total)
+
+
+def _styled(sheet, value, style: str) -> WriteOnlyCell:
+    cell = WriteOnlyCell(sheet, value=value)
+    cell.style = style
+    return cell
+
+
+def export_results_to_excel(results: dict, output_path: str, progress_callback=None, cancel_event=None,
+                            total: int = None) -> bool:
     """
     Xuất kết quả phân loại ra file Excel
-    
+
+    Ghi ở chế độ write-only (stream từng dòng ra file tạm, style dùng chung) → thời gian và RAM
+    tăng tuyến tính theo số kết quả, xuất được 100k+ dòng
+
     Args:
-        results: Dictionary chứa kết quả phân loại
+        results: Dictionary {loại: danh sách (hoặc iterator) kết quả}
         output_path: Đường dẫn file Excel đầu ra
-    
+        progress_callback: callback(số dòng đã ghi, tổng) gọi mỗi PROGRESS_EVERY dòng (từ thread đang xuất)
+        cancel_event: threading.Event, được set → dừng, không ghi file
+        total: Tổng số kết quả (mặc định: tổng len() nếu các cột là list)
+
     Returns:
         bool: True nếu thành công, False nếu thất bại
     """
+    wb = None
     try:
-        # Tạo workbook mới
-        wb = Workbook()
-        
-        # Xóa sheet mặc định
-        wb.remove(wb.active)
-        
-        # Định nghĩa màu sắc cho từng loại
-        colors = {
-            "hoạt động": "00FF00",      # Xanh lá
-            "leave_message": "FFFF00",   # Vàng
-            "be_blocked": "FF0000",     # Đỏ
-            "can_not_connect": "FFA500", # Cam
-            "incorrect": "800080",      # Tím
-            "ringback_tone": "00FFFF",   # Cyan
-            "waiting_tone": "FFC0CB",   # Hồng
-            "mute": "808080"            # Xám
-        }
-        
-        # Tạo sheet tổng hợp
+        if total is None and all(hasattr(data_list, "__len__") for data_list in results.values()):
+            total = sum(len(data_list) for data_list in results.values())
+        progress = _Progress(total, progress_callback, cancel_event)
+
+        wb = Workbook(write_only=True)
+        _register_styles(wb, results.keys())
+
+        # Sheet tổng hợp tạo trước (để đứng đầu) nhưng ghi sau cùng, khi đã đếm xong từng loại
         summary_sheet = wb.create_sheet("Tổng Hợp")
-        _create_summary_sheet(summary_sheet, results, colors)
-        
+
         # Tạo sheet chi tiết cho từng loại
+        counts = {}
         for category, data_list in results.items():
-            if data_list:  # Chỉ tạo sheet nếu có dữ liệu
-                sheet = wb.create_sheet(category.title())
-                _create_detail_sheet(sheet, category, data_list, colors.get(category, "FFFFFF"))
-        
+            rows = iter(data_list)
+            first = next(rows, None)
+            if first is None:  # Chỉ tạo sheet nếu có dữ liệu
+                counts[category] = 0
+                continue
+            sheet = wb.create_sheet(category.title())
+            counts[category] = _create_detail_sheet(sheet, category, itertools.chain([first], rows), progress)
+
+        _create_summary_sheet(summary_sheet, counts)
+        progress.report()  # Kiểm tra hủy lần cuối trước khi ghi file
+
         # Lưu file
         wb.save(output_path)
-        logger.info(f"✅ Đã xuất kết quả ra file: {output_path}")
+        logger.info(f"✅ Đã xuất kết quả ra file: {output_path} ({sum(counts.values())} kết quả)")
         return True
-        
+
+    except ExportCancelled:
+        logger.info(f"🚫 Đã hủy xuất file: {output_path}")
+        _discard_workbook(wb)
+        return False
     except Exception as e:
         logger.error(f"❌ Lỗi khi xuất Excel: {e}")
+        _discard_workbook(wb)
         return False
 
-def _create_summary_sheet(sheet, results: dict, colors: dict):
+def _discard_workbook(wb):
+    """Đóng các sheet write-only đang ghi dở (file tạm) khi hủy / lỗi"""
+    if wb is None:
+        return
+    for sheet in wb.worksheets:
+        try:
+            sheet.close()
+        except Exception:
+            pass
+
+def _create_summary_sheet(sheet, counts: dict):
     """Tạo sheet tổng hợp"""
-    
-    # Tiêu đề
-    sheet['A1'] = "BÁO CÁO TỔNG HỢP PHÂN LOẠI SỐ ĐIỆN THOẠI"
-    sheet['A1'].font = Font(size=16, bold=True, color="000000")
-    sheet['A1'].alignment = Alignment(horizontal='center')
-    sheet.merge_cells('A1:C1')
-    
-    # Thời gian tạo báo cáo
-    sheet['A2'] = f"Thời gian tạo: {datetime.now().strftime('%d/%m/%Y %H:%M:%S')}"
-    sheet['A2'].font = Font(size=10, italic=True)
-    sheet.merge_cells('A2:C2')
-    
+
+    for col, width in SUMMARY_COLUMN_WIDTHS.items():
+        sheet.column_dimensions[col].width = width
+
+    # Tiêu đề + thời gian tạo báo cáo
+    sheet.append([_styled(sheet, "BÁO CÁO TỔNG HỢP PHÂN LOẠI SỐ ĐIỆN THOẠI", "gsm_report_title")])
+    sheet.append([_styled(sheet, f"Thời gian tạo: {datetime.now().strftime('%d/%m/%Y %H:%M:%S')}", "gsm_report_time")])
+    sheet.merged_cells.add('A1:C1')
+    sheet.merged_cells.add('A2:C2')
+
     # Khoảng trống
-    sheet['A4'] = ""
-    
+    sheet.append([])
+    sheet.append([])
+
     # Bảng thống kê
-    sheet['A5'] = "STT"
-    sheet['B5'] = "Loại"
-    sheet['C5'] = "Số lượng"
-    sheet['D5'] = "Tỷ lệ (%)"
-    
-    # Style cho header
-    header_font = Font(bold=True, color="FFFFFF")
-    header_fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
-    header_alignment = Alignment(horizontal='center', vertical='center')
-    
-    for col in ['A5', 'B5', 'C5', 'D5']:
-        sheet[col].font = header_font
-        sheet[col].fill = header_fill
-        sheet[col].alignment = header_alignment
-    
+    sheet.append([_styled(sheet, header, "gsm_header") for header in ["STT", "Loại", "Số lượng", "Tỷ lệ (%)"]])
+
     # Tính tổng số lượng
-    total_count = sum(len(data_list) for data_list in results.values())
-    
+    total_count = sum(counts.values())
+
     # Dữ liệu thống kê
-    row = 6
-    for i, (category, data_list) in enumerate(results.items(), 1):
-        count = len(data_list)
+    for i, (category, count) in enumerate(counts.items(), 1):
         percentage = (count / total_count * 100) if total_count > 0 else 0
-        
-        sheet[f'A{row}'] = i
-        sheet[f'B{row}'] = category.replace('_', ' ').title()
-        sheet[f'C{row}'] = count
-        sheet[f'D{row}'] = f"{percentage:.1f}%"
-        
-        # Màu nền cho từng loại
-        if category in colors:
-            fill_color = colors[category]
-            sheet[f'B{row}'].fill = PatternFill(start_color=fill_color, end_color=fill_color, fill_type="solid")
-        
-        # Alignment
-        sheet[f'A{row}'].alignment = Alignment(horizontal='center')
-        sheet[f'C{row}'].alignment = Alignment(horizontal='center')
-        sheet[f'D{row}'].alignment = Alignment(horizontal='center')
-        
-        row += 1
-    
+        name = category.replace('_', ' ').title()
+        sheet.append([
+            _styled(sheet, i, "gsm_center"),
+            # Màu nền cho từng loại
+            _styled(sheet, name, f"gsm_category_{category}") if category in CATEGORY_COLORS else name,
+            _styled(sheet, count, "gsm_center"),
+            _styled(sheet, f"{percentage:.1f}%", "gsm_center"),
+        ])
+
     # Tổng cộng
-    sheet[f'A{row}'] = "TỔNG CỘNG"
-    sheet[f'B{row}'] = ""
-    sheet[f'C{row}'] = total_count
-    sheet[f'D{row}'] = "100.0%"
-    
-    # Style cho tổng cộng
-    total_font = Font(bold=True)
-    total_fill = PatternFill(start_color="D9D9D9", end_color="D9D9D9", fill_type="solid")
-    
-    for col in ['A', 'C', 'D']:
-        sheet[f'{col}{row}'].font = total_font
-        sheet[f'{col}{row}'].fill = total_fill
-        sheet[f'{col}{row}'].alignment = Alignment(horizontal='center')
-    
-    # Điều chỉnh độ rộng cột
-    sheet.column_dimensions['A'].width = 8
-    sheet.column_dimensions['B'].width = 25
-    sheet.column_dimensions['C'].width = 12
-    sheet.column_dimensions['D'].width = 12
+    sheet.append([
+        _styled(sheet, "TỔNG CỘNG", "gsm_total"),
+        "",
+        _styled(sheet, total_count, "gsm_total"),
+        _styled(sheet, "100.0%", "gsm_total"),
+    ])
 
-def _create_detail_sheet(sheet, category: str, data_list: list, color: str):
-    """Tạo sheet chi tiết cho một loại"""
+def _note_for(data: dict) -> str:
+    """Ghi chú đặc biệt"""
+    if data.get('result') == 'hoạt động':
+        return "Người nghe đã nhấc máy"
+    if data.get('result') == 'lỗi':
+        return "Có lỗi xảy ra"
+    if not data.get('transcribed_text'):
+        return "Không có nội dung audio"
+    return ""
+
+def _create_detail_sheet(sheet, category: str, data_iter, progress: _Progress = None) -> int:
+    """Tạo sheet chi tiết cho một loại (stream từng dòng). Returns: số dòng đã ghi"""
+
+    for col, width in DETAIL_COLUMN_WIDTHS.items():
+        sheet.column_dimensions[col].width = width
 
     # Tiêu đề
-    sheet['A1'] = f"CHI TIẾT - {category.replace('_', ' ').upper()}"
-    sheet['A1'].font = Font(size=14, bold=True, color="FFFFFF")
-    sheet['A1'].fill = PatternFill(start_color=color, end_color=color, fill_type="solid")
-    sheet['A1'].alignment = Alignment(horizontal='center')
-    sheet.merge_cells('A1:F1')
+    sheet.append([_styled(sheet, f"CHI TIẾT - {category.replace('_', ' ').upper()}", f"gsm_title_{category}")])
+    sheet.merged_cells.add('A1:F1')
+    sheet.append([])
 
     # Header bảng
-    headers = ["STT", "Số Điện Thoại", "Kết Quả", "Lý Do", "Nội Dung STT", "Ghi Chú"]
-
-    for col, header in enumerate(headers, 1):
-        cell = sheet.cell(row=3, column=col, value=header)
-        cell.font = Font(bold=True, color="FFFFFF")
-        cell.fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
-        cell.alignment = Alignment(horizontal='center', vertical='center')
-
-    # Dữ liệu
-    for i, data in enumerate(data_list, 1):
-        row = i + 3
-
-        sheet[f'A{row}'] = i
-        sheet[f'B{row}'] = data.get('phone_number', 'N/A')
-        sheet[f'C{row}'] = data.get('result', 'N/A')
-        sheet[f'D{row}'] = data.get('reason', 'N/A')
-        sheet[f'E{row}'] = data.get('transcribed_text', 'N/A')
-
-        # Ghi chú đặc biệt
-        note = ""
-        if data.get('result') == 'hoạt động':
-            note = "Người nghe đã nhấc máy"
-        elif data.get('result') == 'lỗi':
-            note = "Có lỗi xảy ra"
-        elif not data.get('transcribed_text'):
-            note = "Không có nội dung audio"
-
-        sheet[f'F{row}'] = note
-
-        # Màu xen kẽ cho các hàng
-        if i % 2 == 0:
-            for col in range(1, 7):
-                sheet.cell(row=row, column=col).fill = PatternFill(
-                    start_color="F2F2F2", end_color="F2F2F2", fill_type="solid"
-                )
-    
-    # Điều chỉnh độ rộng cột
-    column_widths = {
-        'A': 8,   # STT
-        'B': 18,  # Số điện thoại
-        'C': 20,  # Kết quả
-        'D': 30,  # Lý do
-        'E': 50,  # Nội dung STT
-        'F': 25   # Ghi chú
-    }
+    sheet.append([_styled(sheet, header, "gsm_header") for header in DETAIL_HEADERS])
 
-    for col, width in column_widths.items():
-        sheet.column_dimensions[col].width = width
+    # Dữ liệu: màu xen kẽ cho các hàng, wrap text cho cột lý do, nội dung và ghi chú
+    count = 0
+    for count, data in enumerate(data_iter, 1):
+        values = [
+            count,
+            data.get('phone_number', 'N/A'),
+            data.get('result', 'N/A'),
+            data.get('reason', 'N/A'),
+            data.get('transcribed_text', 'N/A'),
+            _note_for(data),
+        ]
+        if count % 2 == 0:
+            row = [_styled(sheet, value, "gsm_row_alt") for value in values[:3]]
+            row += [_styled(sheet, value, "gsm_wrap_alt") for value in values[3:]]
+        else:
+            row = values[:3] + [_styled(sheet, value, "gsm_wrap") for value in values[3:]]
+        sheet.append(row)
+        if progress is not None:
+            progress.step()
+    return count
+
+
+class ExportTask:
+    """
+    Xuất Excel trong thread riêng từ 1 snapshot kết quả: báo tiến độ, hủy được
+
+    progress_callback(done, total) và done_callback(task) được gọi từ thread xuất
+    (GUI cần tự chuyển về main thread, vd: root.after)
+
+    snapshot: hàm trả về (results, total, on_finish), được gọi ở đầu run() thay cho results/total/on_finish
+    → việc chụp kết quả (vd: mở read transaction SQLite) cũng chạy trên thread xuất, không chặn GUI
+    """
+
+    def __init__(self, results: dict, output_path: str, total: int = None, progress_callback=None,
+                 done_callback=None, on_finish=None, snapshot=None):
+        self.results = results
+        self.snapshot = snapshot
+        self.output_path = output_path
+        self.total = total
+        self.progress_callback = progress_callback
+        self.done_callback = done_callback
+        self.on_finish = on_finish  # Dọn dẹp snapshot (vd: đóng kết nối đọc SQLite)
+        self.status = "pending"  # pending, running, completed, failed, cancelled
+        self.cancel_event = threading.Event()
+        self._thread = None
+
+    def run(self) -> bool:
+        """Xuất ngay trên thread hiện tại"""
+        self.status = "running"
+        if self.snapshot is not None:
+            try:
+                self.results, self.total, self.on_finish = self.snapshot()
+            except Exception as e:
+                logger.error(f"❌ Lỗi khi chụp kết quả để xuất: {e}")
+                self.status = "failed"
+                if self.done_callback:
+                    self.done_callback(self)
+                return False
+        try:
+            success = export_results_to_excel(self.results, self.output_path, self.progress_callback,
+                                              self.cancel_event, self.total)
+        finally:
+            if self.on_finish:
+                self.on_finish()
+        if success:
+            self.status = "completed"
+        else:
+            self.status = "cancelled" if self.cancel_event.is_set() else "failed"
+        if self.done_callback:
+            self.done_callback(self)
+        return success
+
+    def start(self):
+        self._thread = threading.Thread(target=self.run, name="ExcelExport", daemon=True)
+        self._thread.start()
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def is_running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
 
-    # Wrap text cho cột lý do, nội dung và ghi chú
-    for row in range(4, len(data_list) + 4):
-        sheet[f'D{row}'].alignment = Alignment(wrap_text=True, vertical='top')
-        sheet[f'E{row}'].alignment = Alignment(wrap_text=True, vertical='top')
-        sheet[f'F{row}'].alignment = Alignment(wrap_text=True, vertical='top')
+    def wait(self, timeout: float = None) -> bool:
+        if self._thread is not None:
+            self._thread.join(timeout)
+        return not self.is_running()
 
 def create_sample_results():
     """Tạo dữ liệu mẫu để test"""
@@ -15,13 +15,16 @@ from pathlib import Path
 from datetime import datetime
 
 # Import cho STT và phân loại
-import torch
 import librosa
 import soundfile as sf
 from pydub import AudioSegment
 
-from string_detection import keyword_in_text, labels
-from model_manager import model_manager
+from string_detection import classify_text, match_confidence
+from model_manager import model_manager, USE_STREAMING_STT
+from keyword_spotter import USE_KEYWORD_SPOTTER
+from stt_cache import cache_namespace, transcription_cache
+from serial_capture import wrap_serial
+from call_trace import CallTrace, call_tracer
 
 # Cấu hình logging - ghi ra file
 log_dir = "logs"
@@ -53,6 +56,12 @@ class GSMInstance:
         self.max_calls_before_reset = 100
         self.status = "idle"  # idle, calling, resetting, error
         self.results = []
+        self.result_callback = None  # callback(result, port) sau mỗi cuộc gọi (vd: ResultStore.append)
+        self.ready_since = None  # Lúc cổng sẵn sàng gọi số tiếp theo (cuộc trước xong / bắt đầu danh sách), tính queue_wait
+
+        # Bộ đếm byte serial (chỉ thread của cổng này ghi → không cần lock, metrics đọc lúc scrape)
+        self.bytes_sent = 0
+        self.bytes_received = 0
 
         # Threading
         self.processing_thread = None
@@ -92,6 +101,7 @@ class GSMInstance:
                 parity=serial.PARITY_NONE,
                 stopbits=serial.STOPBITS_ONE
             )
+            self.serial_connection = wrap_serial(self.serial_connection, self.port)
             
             self.is_connected = True
             self.current_baudrate = baudrate
@@ -124,7 +134,9 @@ class GSMInstance:
             
             # Gửi lệnh
             if command:
-                self.serial_connection.write((command + '\r\n').encode())
+                data = (command + '\r\n').encode()
+                self.serial_connection.write(data)
+                self.bytes_sent += len(data)
                 time.sleep(wait_time)
             
             # Đọc phản hồi
@@ -134,10 +146,9 @@ class GSMInstance:
             
             while time.time() - start_time < timeout:
                 if self.serial_connection.in_waiting:
-                    chunk = self.serial_connection.read(
-                        self.serial_connection.in_waiting
-                    ).decode('utf-8', errors='ignore')
-                    response += chunk
+                    raw = self.serial_connection.read(self.serial_connection.in_waiting)
+                    self.bytes_received += len(raw)
+                    response += raw.decode('utf-8', errors='ignore')
                 time.sleep(0.1)
             
             return response.strip()
@@ -253,12 +264,21 @@ class GSMInstance:
             return False
     
     def make_call_and_classify(self, phone_number: str) -> Dict:
-        """Gọi số và phân loại kết quả"""
+        """Gọi số và phân loại kết quả (kèm ghi call trace thời gian từng giai đoạn)"""
+        queue_wait = time.time() - self.ready_since if self.ready_since else 0.0
+        trace = CallTrace(self.port, phone_number, self.network_operator, queue_wait)
+        result = self._make_call(phone_number, trace)
+        call_tracer.record(trace.finish(result))
+        self.ready_since = time.time()
+        return result
+
+    def _make_call(self, phone_number: str, trace: CallTrace) -> Dict:
         try:
             self.status = "calling"
             self.log(f"📞 Đang gọi {phone_number}...")
             
             # Thực hiện cuộc gọi
+            trace.begin("dial")
             call_response = self.send_command(f"ATD{phone_number};", wait_time=1.5)
             if "ERROR" in call_response:
                 self.log(f"❌ Không thể gọi {phone_number}")
@@ -272,6 +292,7 @@ class GSMInstance:
             time.sleep(1.5)
             
             # Bắt đầu ghi âm
+            trace.begin("recording")
             self.log(f"🎙️ Bắt đầu ghi âm {phone_number}...")
             record_filename = f"record_{self.port}_{int(time.time())}.amr"
             record_response = self.send_command(f'AT+QAUDRD=1,"{record_filename}",13,1', wait_time=1.0)
@@ -295,10 +316,16 @@ class GSMInstance:
                 # Check AT+CLCC
                 clcc_response = self.send_command("AT+CLCC", wait_time=0.3)
                 
+                # Cuộc gọi đã bị giải phóng (không còn dòng +CLCC)
+                if "OK" in clcc_response and "+CLCC" not in clcc_response:
+                    trace.mark("time_to_release")
+
                 # Kiểm tra có +COLP trong response
                 if "+COLP" in clcc_response:
                     self.log(f"✅ Phát hiện +COLP cho {phone_number} - Người nhấc máy!")
                     found_colp = True
+                    trace.mark("time_to_colp")
+                    trace.begin("hang_up")
                     
                     # Dừng ghi âm ngay
                     self.send_command(f'AT+QAUDRD=0,"{record_filename}",13,1', wait_time=1.0)
@@ -325,9 +352,11 @@ class GSMInstance:
             stop_response = self.send_command(f'AT+QAUDRD=0,"{record_filename}",13,1', wait_time=1.0)
             
             # Ngắt cuộc gọi
+            trace.begin("hang_up")
             self.send_command("ATH", wait_time=1.0)
             
             # Tải file ghi âm, STT và phân loại
+            trace.begin("download")
             self.log(f"📥 Đang tải file {record_filename} để phân tích...")
             
             # Tạo tên file local
@@ -354,6 +383,7 @@ class GSMInstance:
                 }
 
             file_size = os.path.getsize(local_amr)
+            trace.set(download_bytes=file_size)
             if file_size == 0:
                 self.log(f"❌ File {local_amr} có kích thước 0 bytes")
                 # Xóa file lỗi
@@ -370,6 +400,7 @@ class GSMInstance:
             self.log(f"✅ File AMR hợp lệ: {file_size} bytes")
 
             # Convert AMR sang WAV
+            trace.begin("decode")
             if not self._convert_to_wav(local_amr, local_wav):
                 self.log(f"❌ Không thể convert file âm thanh")
                 return {
@@ -379,7 +410,12 @@ class GSMInstance:
                 }
             
             # Speech-to-text
-            transcribed_text = self._transcribe_audio(local_wav)
+            trace.end()
+            transcribed_text, logits, stt_info = self._transcribe_audio(local_wav)
+            trace.add("decode", stt_info.get("load_time"))
+            trace.add("model_wait", stt_info.get("model_wait"))
+            trace.add("inference", stt_info.get("inference_time"))
+            trace.set(cache_hit=stt_info.get("cache_hit", False))
             if not transcribed_text:
                 self.log(f"❌ Không thể thực hiện STT")
                 return {
@@ -389,9 +425,11 @@ class GSMInstance:
                 }
             
             # Phân loại kết quả
-            classification_result = self._classify_result(transcribed_text)
+            trace.begin("classify")
+            classification_result, confidence, label_source = self._classify_result(transcribed_text, logits)
             
             # Dọn dẹp file tạm
+            trace.begin("cleanup")
             try:
                 if os.path.exists(local_amr):
                     os.remove(local_amr)
@@ -408,7 +446,12 @@ class GSMInstance:
                 "phone_number": phone_number,
                 "result": classification_result,
                 "reason": f"STT: {transcribed_text[:50]}..." if len(transcribed_text) > 50 else f"STT: {transcribed_text}",
-                "transcribed_text": transcribed_text
+                "transcribed_text": transcribed_text,
+                "confidence": confidence,
+                "label_source": label_source,
+                "audio_seconds": stt_info.get("audio_seconds"),
+                "processed_seconds": stt_info.get("processed_seconds"),
+                "partial_transcript": stt_info.get("partial", False)
             }
                 
         except Exception as e:
@@ -453,6 +496,7 @@ class GSMInstance:
         try:
             self.log(f"🚀 Bắt đầu xử lý {len(self.phone_queue)} số điện thoại")
             self.log(f"ℹ️ Đang sử dụng baudrate {self.current_baudrate} cho việc gọi")
+            self.ready_since = time.time()
             
             for phone_number in self.phone_queue:
                 if self.stop_flag:
@@ -462,6 +506,8 @@ class GSMInstance:
                 # Gọi và phân loại
                 result = self.make_call_and_classify(phone_number)
                 self.results.append(result)
+                if self.result_callback:
+                    self.result_callback(result, self.port)
                 self.call_count += 1
                 
                 self.log(f"📊 [{self.call_count}/{len(self.phone_queue)}] {phone_number}: {result['result']}")
@@ -625,14 +671,18 @@ class GSMInstance:
                             break
                         
                         # Gửi lệnh QFREAD
-                        self.serial_connection.write(f"AT+QFREAD={fd},{current_chunk}\r\n".encode())
+                        command = f"AT+QFREAD={fd},{current_chunk}\r\n".encode()
+                        self.serial_connection.write(command)
+                        self.bytes_sent += len(command)
                         
                         # Đọc response
                         response = b""
                         start_time = time.time()
                         while time.time() - start_time < 5:
                             if self.serial_connection.in_waiting > 0:
-                                response += self.serial_connection.read(self.serial_connection.in_waiting)
+                                raw = self.serial_connection.read(self.serial_connection.in_waiting)
+                                self.bytes_received += len(raw)
+                                response += raw
                                 if b"CONNECT" in response and b"\r\nOK\r\n" in response:
                                     break
                             else:
@@ -691,45 +741,94 @@ class GSMInstance:
             return False
     
     def _transcribe_audio(self, wav_file):
-        """Speech-to-text sử dụng Wav2Vec2 từ ModelPool (pool of models)"""
+        """
+        Speech-to-text sử dụng Wav2Vec2 từ ModelPool (direct, micro-batching hoặc process)
+
+        Returns:
+            Tuple[text, logits, info] với info chứa audio_seconds và processed_seconds
+            (streaming STT có thể dừng sớm trước khi chạy hết audio → partial=True), cùng thời gian
+            load_time / model_wait / inference_time cho call trace
+        """
         try:
             self.log("🎤 Đang thực hiện speech-to-text...")
 
-            # Lấy model từ ModelPool (blocking nếu pool đầy)
-            processor, model, device = model_manager.get_model()
+            # Load audio
+            load_start = time.time()
+            speech, rate = librosa.load(wav_file, sr=16000)
+            audio_seconds = len(speech) / 16000
+            load_time = time.time() - load_start
 
-            try:
-                # Load audio
-                speech, rate = librosa.load(wav_file, sr=16000)
-                input_values = processor(speech, return_tensors="pt", sampling_rate=16000).input_values.to(device)
+            # Tra cache theo hash nội dung audio (lời nhắc nhà mạng lặp lại)
+            streaming = USE_STREAMING_STT and USE_KEYWORD_SPOTTER
+            namespace = cache_namespace(model_manager.get_model_id(), model_manager.get_model_format(),
+                                        "stream" if streaming else "full")
+            cached = transcription_cache.get(speech, namespace) if transcription_cache is not None else None
+            if cached is not None:
+                result, logits = cached
+                self.log(f"📝 STT result (cache): {result}")
+                return result, logits, {"audio_seconds": audio_seconds, "processed_seconds": 0.0, "cache_hit": True,
+                                        "load_time": load_time}
 
-                # Transcribe
-                with torch.no_grad():
-                    logits = model(input_values).logits
+            # Transcribe (blocking đến khi có kết quả từ pool/batch server)
+            model_manager.pop_thread_wait()
+            stt_start = time.time()
+            early_exit = False
+            if streaming:
+                stream = model_manager.transcribe_streaming(speech)
+                result, logits = stream["text"], stream["logits"]
+                processed_seconds = stream["processed_seconds"]
+                early_exit = stream["early_exit"]
+                if early_exit:
+                    self.log(f"⚡ Dừng sớm sau {processed_seconds:.1f}/{audio_seconds:.1f}s audio")
+            else:
+                result, logits = model_manager.transcribe(speech, return_logits=True)
+                processed_seconds = audio_seconds
 
-                predicted_ids = torch.argmax(logits, dim=-1)
-                transcription = processor.batch_decode(predicted_ids)
+            stt_time = time.time() - stt_start
+            model_wait = min(model_manager.pop_thread_wait(), stt_time)
 
-                result = transcription[0]
-                self.log(f"📝 STT result: {result}")
-                return result
+            # Transcript dừng sớm chỉ là 1 phần audio → không cache (lần sau có thể cần nghe hết)
+            if transcription_cache is not None and result and not early_exit:
+                transcription_cache.put(speech, result, logits, namespace)
 
-            finally:
-                # QUAN TRỌNG: Trả model về pool sau khi dùng xong
-                model_manager.release_model(model)
+            self.log(f"📝 STT result: {result}")
+            return result, logits, {"audio_seconds": audio_seconds, "processed_seconds": processed_seconds,
+                                    "partial": early_exit, "load_time": load_time, "model_wait": model_wait,
+                                    "inference_time": stt_time - model_wait}
 
         except Exception as e:
             self.log(f"❌ Lỗi STT: {e}")
-            return ""
+            return "", None, {}
     
-    def _classify_result(self, text):
-        """Phân loại kết quả dựa trên text"""
+    def _classify_result(self, text, logits=None):
+        """
+        Phân loại kết quả: keyword spotting trên CTC logits nếu có, ngược lại (hoặc khi spotter không khớp cụm nào)
+        tìm từ khóa trong text (có fallback gần đúng / bỏ dấu)
+
+        Returns:
+            Tuple[label, confidence (None nếu khớp chính xác theo text), nguồn nhãn ("spotter" hoặc "text")]
+        """
         try:
             self.log("🔍 Đang phân loại kết quả...")
-            result_index = keyword_in_text(text)
-            result_label = labels[result_index]
+            spotted = None
+            if USE_KEYWORD_SPOTTER and logits is not None:
+                spotter = model_manager.get_keyword_spotter()
+                result_index, confidence, phrase = spotter.spot(logits)
+                spotted = (spotter.labels[result_index], confidence)
+                if spotted[0] != "ringback_tone":
+                    self.log(f"📊 Kết quả phân loại: {spotted[0]} (confidence {confidence:.2f}, khớp: {phrase})")
+                    return spotted[0], confidence, "spotter"
+
+            result_label, span, distance = classify_text(text)
+            if spotted is not None and result_label == "ringback_tone":
+                self.log(f"📊 Kết quả phân loại: ringback_tone (confidence {spotted[1]:.2f})")
+                return "ringback_tone", spotted[1], "spotter"
+            if distance:
+                confidence = match_confidence(span, distance)
+                self.log(f"📊 Kết quả phân loại: {result_label} (khớp gần đúng '{text[span[0]:span[1]]}', sai {distance} ký tự)")
+                return result_label, confidence, "text"
             self.log(f"📊 Kết quả phân loại: {result_label}")
-            return result_label
+            return result_label, None, "text"
         except Exception as e:
             self.log(f"❌ Lỗi phân loại: {e}")
-            return "incorrect"
+            return "incorrect", None, "text"
@@ -0,0 +1,559 @@
+"""
+GSM modem simulator - Giả lập N modem GSM qua pseudo-terminal (pty) để load test không cần bank SIM thật
+Chỉ chạy trên Linux/macOS (pty); trên Windows cần cặp cổng ảo kiểu com0com
+
+Hỗ trợ đúng các lệnh AT mà detect_gsm_port / GSMInstance dùng:
+    AT, ATE0/ATE1, AT+CSQ, AT+COPS?, AT+CNUM, AT+CUSD, AT+IPR, ATD, ATH, AT+CLCC (+COLP khi nhấc máy),
+    AT+QAUDRD, AT+QFLST, AT+QFOPEN, AT+QFREAD, AT+QFCLOSE, AT+QFDEL, AT+CFUN
+File ghi âm của mỗi cuộc gọi lấy từ bộ AMR mẫu (ưu tiên file trùng số điện thoại được gọi)
+
+Usage:
+    python gsm_simulator.py --ports 32 --answer-prob 0.2 --ports-file sim_ports.txt
+    GSM_EXTRA_PORTS_FILE=sim_ports.txt python main_gui.py      # GUI/controller sẽ thấy 32 cổng giả lập
+    python gsm_simulator.py --ports 256 --latency-ms 50 --fault-drop 0.01 --fault-garble 0.005 --write-phone-list sim_phones.txt
+"""
+
+import argparse
+import heapq
+import logging
+import os
+import random
+import re
+import selectors
+import signal
+import threading
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_AUDIO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "audio_to_test_speak_to_text")
+DEFAULT_BAUDRATE = 115200
+WRITE_CHUNK = 1024  # Số byte tối đa mỗi lần ghi ra pty (để pacing theo baudrate)
+RETRY_DELAY = 0.005  # Đợi khi buffer pty đầy (client chưa đọc)
+
+OPERATORS = ["Viettel", "Vinaphone", "Mobifone", "Vietnamobile"]
+
+
+class SimulatorConfig:
+    """Tham số giả lập (độ trễ, xác suất nhấc máy, lỗi...) dùng chung cho mọi modem"""
+
+    def __init__(self, latency_ms: float = 20.0, jitter_ms: float = 10.0, answer_prob: float = 0.2,
+                 answer_delay: Tuple[float, float] = (3.0, 12.0), ussd_delay: float = 1.5,
+                 reboot_delay: float = 2.0, baud_pacing: bool = True, strict_baud: bool = False,
+                 echo: bool = True, fault_drop: float = 0.0, fault_error: float = 0.0,
+                 fault_garble: float = 0.0, fault_stall: float = 0.0, stall_seconds: float = 3.0,
+                 dial_error_prob: float = 0.02):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.answer_prob = answer_prob
+        self.answer_delay = answer_delay
+        self.ussd_delay = ussd_delay
+        self.reboot_delay = reboot_delay
+        self.baud_pacing = baud_pacing
+        self.strict_baud = strict_baud  # Trả rác nếu client mở cổng sai baudrate so với AT+IPR
+        self.echo = echo
+        # Fault injection (xác suất trên mỗi lệnh)
+        self.fault_drop = fault_drop  # Không trả lời
+        self.fault_error = fault_error  # Trả ERROR
+        self.fault_garble = fault_garble  # Làm hỏng vài byte của phản hồi
+        self.fault_stall = fault_stall  # Trả lời chậm thêm stall_seconds
+        self.stall_seconds = stall_seconds
+        self.dial_error_prob = dial_error_prob  # ATD trả ERROR (không gọi được)
+
+
+class AudioCorpus:
+    """Bộ file AMR dùng làm nội dung ghi âm, tra theo số điện thoại trong tên file <phone>_<date>_<time>.amr"""
+
+    def __init__(self, audio_dir: str):
+        self.files: List[Tuple[str, bytes]] = []
+        self.by_phone: Dict[str, int] = {}
+        if os.path.isdir(audio_dir):
+            for name in sorted(os.listdir(audio_dir)):
+                if not name.lower().endswith(".amr"):
+                    continue
+                with open(os.path.join(audio_dir, name), "rb") as f:
+                    self.by_phone.setdefault(name.split("_")[0], len(self.files))
+                    self.files.append((name, f.read()))
+        if not self.files:
+            # Không có corpus: file AMR chỉ gồm header + 250 frame NO_DATA (~5s im lặng)
+            self.files.append(("silence.amr", b"#!AMR\n" + b"\x7c" * 250))
+
+    def pick(self, phone_number: str) -> Tuple[str, bytes]:
+        index = self.by_phone.get(phone_number)
+        if index is None:
+            index = int.from_bytes(phone_number.encode()[-8:].rjust(8, b"\0"), "big") % len(self.files)
+        return self.files[index]
+
+    def phone_numbers(self) -> List[str]:
+        return list(self.by_phone)
+
+
+class SimulatedModem:
+    """
+    Trạng thái 1 modem (baudrate, cuộc gọi, ghi âm, file system) + xử lý từng lệnh AT
+
+    handle_command() trả về danh sách (delay giây, bytes) để simulator lên lịch ghi ra pty
+    """
+
+    def __init__(self, index: int, config: SimulatorConfig, corpus: AudioCorpus, rng: random.Random):
+        self.index = index
+        self.config = config
+        self.corpus = corpus
+        self.rng = rng
+
+        self.baudrate = DEFAULT_BAUDRATE
+        self.echo = config.echo
+        self.rebooting_until = 0.0
+        self.operator = rng.choice(OPERATORS)
+        self.rssi = rng.randint(12, 31)
+        self.msisdn = f"+849{rng.randint(10000000, 99999999)}"
+        self.balance = rng.randint(0, 50000)
+
+        self.call: Optional[Dict] = None
+        self.recording: Optional[Dict] = None
+        self.files: Dict[str, bytes] = {}
+        self.open_files: Dict[int, List] = {}  # fd -> [name, offset]
+        self._next_fd = 1
+
+        # Statistics
+        self.stats = {"commands": 0, "calls": 0, "answered": 0, "recordings": 0, "bytes_served": 0,
+                      "faults": 0, "unknown": 0}
+
+    # ---------- helpers ----------
+    def _latency(self) -> float:
+        return max(0.0, self.rng.gauss(self.config.latency_ms, self.config.jitter_ms) / 1000)
+
+    @staticmethod
+    def _lines(*lines: str) -> bytes:
+        return "".join(f"\r\n{line}\r\n" for line in lines).encode()
+
+    def _ok(self, *lines: str) -> bytes:
+        return self._lines(*lines, "OK")
+
+    # ---------- command handling ----------
+    def handle_command(self, command: str, now: float) -> List[Tuple[float, bytes]]:
+        self.stats["commands"] += 1
+        if now < self.rebooting_until:
+            return []  # Đang khởi động lại: không phản hồi
+
+        echo = (command + "\r").encode() if self.echo else b""
+        latency = self._latency()
+
+        # Fault injection
+        roll = self.rng.random()
+        if roll < self.config.fault_drop:
+            self.stats["faults"] += 1
+            return []
+        roll -= self.config.fault_drop
+        if roll < self.config.fault_error:
+            self.stats["faults"] += 1
+            return [(latency, echo + self._lines("ERROR"))]
+        if self.rng.random() < self.config.fault_stall:
+            self.stats["faults"] += 1
+            latency += self.config.stall_seconds
+
+        responses = self._dispatch(command.strip(), now)
+        if responses is None:
+            self.stats["unknown"] += 1
+            responses = [(0.0, self._lines("ERROR"))]
+
+        if echo:
+            responses = [(0.0, echo)] + responses
+        responses = [(latency + delay, data) for delay, data in responses]
+
+        if self.config.fault_garble and self.rng.random() < self.config.fault_garble:
+            self.stats["faults"] += 1
+            responses = [(delay, self._garble(data)) for delay, data in responses]
+        return responses
+
+    def _garble(self, data: bytes) -> bytes:
+        corrupted = bytearray(data)
+        for _ in range(max(1, len(corrupted) // 50)):
+            if corrupted:
+                corrupted[self.rng.randrange(len(corrupted))] = self.rng.randrange(256)
+        return bytes(corrupted)
+
+    def _dispatch(self, command: str, now: float) -> Optional[List[Tuple[float, bytes]]]:
+        upper = command.upper()
+
+        if upper == "AT":
+            return [(0.0, self._ok())]
+        if upper in ("ATE0", "ATE1"):
+            self.echo = upper == "ATE1"
+            return [(0.0, self._ok())]
+        if upper == "AT+CSQ":
+            return [(0.0, self._ok(f"+CSQ: {self.rssi},0"))]
+        if upper == "AT+COPS?":
+            return [(0.0, self._ok(f'+COPS: 0,0,"{self.operator} {self.operator}",7'))]
+        if upper == "AT+CNUM":
+            return [(0.0, self._ok(f'+CNUM: "","{self.msisdn}",145'))]
+        if upper.startswith("AT+CUSD="):
+            text = (f"{self.msisdn}. TTGTEL. TKC {self.balance} d, TK no 0VND, HSD: 00:00 17-11-2025. "
+                    f"Quy khach se nhan duoc thong tin TK Khuyen mai qua SMS.")
+            return [(0.0, self._ok()), (self.config.ussd_delay, self._lines(f'+CUSD: 0,"{text}",15'))]
+        if upper.startswith("AT+IPR="):
+            return self._set_baudrate(command)
+        if upper.startswith("ATD"):
+            return self._dial(command, now)
+        if upper == "ATH":
+            self.call = None
+            return [(0.0, self._ok())]
+        if upper == "AT+CLCC":
+            return [(0.0, self._clcc(now))]
+        if upper.startswith("AT+QAUDRD="):
+            return self._record(command)
+        if upper.startswith("AT+QFLST="):
+            return self._file_list(command)
+        if upper.startswith("AT+QFOPEN="):
+            return self._file_open(command)
+        if upper.startswith("AT+QFREAD="):
+            return self._file_read(command)
+        if upper.startswith("AT+QFCLOSE="):
+            fd = int(re.sub(r"\D", "", command.split("=", 1)[1]) or 0)
+            self.open_files.pop(fd, None)
+            return [(0.0, self._ok())]
+        if upper.startswith("AT+QFDEL="):
+            name = self._quoted(command)
+            if name in self.files:
+                del self.files[name]
+                return [(0.0, self._ok())]
+            return [(0.0, self._lines("+CME ERROR: 405"))]
+        if upper.startswith("AT+CFUN="):
+            return self._reboot(command, now)
+        return None
+
+    @staticmethod
+    def _quoted(command: str) -> str:
+        match = re.search(r'"([^"]*)"', command)
+        return match.group(1) if match else ""
+
+    def _set_baudrate(self, command: str) -> List[Tuple[float, bytes]]:
+        try:
+            baudrate = int(command.split("=", 1)[1])
+        except ValueError:
+            return [(0.0, self._lines("ERROR"))]
+        # OK được gửi ở baudrate cũ, sau đó modem chuyển sang baudrate mới
+        response = [(0.0, self._ok())]
+        self.baudrate = baudrate
+        return response
+
+    def _dial(self, command: str, now: float) -> List[Tuple[float, bytes]]:
+        number = re.sub(r"[^\d+]", "", command[3:])
+        if not number or self.rng.random() < self.config.dial_error_prob:
+            return [(0.0, self._lines("ERROR"))]
+        answered = self.rng.random() < self.config.answer_prob
+        self.call = {
+            "number": number,
+            "started": now,
+            "answer_at": now + self.rng.uniform(*self.config.answer_delay) if answered else None,
+        }
+        self.stats["calls"] += 1
+        self.stats["answered"] += int(answered)
+        return [(0.0, self._ok())]
+
+    def _clcc(self, now: float) -> bytes:
+        if self.call is None:
+            return self._ok()
+        answer_at = self.call["answer_at"]
+        if answer_at is not None and now >= answer_at:
+            return self._ok(f'+CLCC: 1,0,0,0,0,"{self.call["number"]}",129',
+                            f'+COLP: "{self.call["number"]}",129,"",0')
+        state = 2 if now - self.call["started"] < 1.0 else 3  # dialing → alerting
+        return self._ok(f'+CLCC: 1,0,{state},0,0,"{self.call["number"]}",129')
+
+    def _record(self, command: str) -> List[Tuple[float, bytes]]:
+        args = command.split("=", 1)[1].split(",")
+        name = self._quoted(command)
+        if args[0].strip() == "1":
+            if self.call is None or not name:
+                return [(0.0, self._lines("ERROR"))]
+            self.recording = {"name": name, "number": self.call["number"]}
+            return [(0.0, self._ok())]
+
+        # Dừng ghi âm → "lưu" file vào file system của modem
+        if self.recording is not None and self.recording["name"] == name:
+            _, content = self.corpus.pick(self.recording["number"])
+            self.files[name] = content
+            self.stats["recordings"] += 1
+        self.recording = None
+        return [(0.0, self._ok())]
+
+    def _file_list(self, command: str) -> List[Tuple[float, bytes]]:
+        name = self._quoted(command)
+        if name not in self.files:
+            return [(0.0, self._lines("+CME ERROR: 405"))]
+        return [(0.0, self._ok(f'+QFLST: "{name}",{len(self.files[name])}'))]
+
+    def _file_open(self, command: str) -> List[Tuple[float, bytes]]:
+        name = self._quoted(command)
+        if name not in self.files:
+            return [(0.0, self._lines("+CME ERROR: 405"))]
+        fd = self._next_fd
+        self._next_fd += 1
+        self.open_files[fd] = [name, 0]
+        return [(0.0, self._ok(f"+QFOPEN: {fd}"))]
+
+    def _file_read(self, command: str) -> List[Tuple[float, bytes]]:
+        try:
+            fd, length = (int(x) for x in command.split("=", 1)[1].split(","))
+        except ValueError:
+            return [(0.0, self._lines("ERROR"))]
+        handle = self.open_files.get(fd)
+        if handle is None:
+            return [(0.0, self._lines("+CME ERROR: 405"))]
+        name, offset = handle
+        data = self.files.get(name, b"")[offset:offset + length]
+        handle[1] = offset + len(data)
+        self.stats["bytes_served"] += len(data)
+        return [(0.0, f"\r\nCONNECT {len(data)}\r\n".encode() + data + b"\r\nOK\r\n")]
+
+    def _reboot(self, command: str, now: float) -> List[Tuple[float, bytes]]:
+        args = command.split("=", 1)[1]
+        if args.replace(" ", "").startswith("1,1"):
+            # Reset: mất cuộc gọi, quay về baudrate mặc định, không phản hồi trong reboot_delay
+            response = [(0.0, self._ok())]
+            self.call = None
+            self.recording = None
+            self.open_files.clear()
+            self.baudrate = DEFAULT_BAUDRATE
+            self.rebooting_until = now + self.config.reboot_delay
+            return response
+        return [(0.0, self._ok())]
+
+
+class _Port:
+    """1 cặp pty master/slave + buffer vào/ra của 1 modem"""
+
+    def __init__(self, modem: SimulatedModem):
+        import pty
+        import tty
+
+        self.modem = modem
+        self.master_fd, self.slave_fd = pty.openpty()
+        tty.setraw(self.slave_fd)  # Không echo/xử lý dòng ở tầng tty (modem tự echo)
+        os.set_blocking(self.master_fd, False)
+        self.path = os.ttyname(self.slave_fd)
+        self.input = bytearray()
+        self.output: Deque[List] = deque()  # [due, bytes]
+        self.line_free_at = 0.0  # Thời điểm đường truyền hết bận (pacing theo baudrate)
+
+    def client_baudrate(self) -> Optional[int]:
+        """Baudrate mà client (pyserial) đã đặt cho slave"""
+        import termios
+
+        try:
+            speed = termios.tcgetattr(self.slave_fd)[5]
+        except termios.error:
+            return None
+        for name in dir(termios):
+            if name.startswith("B") and name[1:].isdigit() and getattr(termios, name) == speed:
+                return int(name[1:])
+        return None
+
+    def close(self):
+        for fd in (self.master_fd, self.slave_fd):
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+
+
+class ModemSimulator:
+    """
+    Chạy N modem giả lập trên 1 thread (selectors + hàng đợi theo thời gian)
+
+    - Đọc lệnh AT từ pty master, tách theo CR/LF
+    - Phản hồi được lên lịch theo độ trễ của modem và pacing theo baudrate (10 bit / byte)
+    """
+
+    def __init__(self, num_ports: int, config: SimulatorConfig, corpus: AudioCorpus, seed: Optional[int] = None):
+        self.config = config
+        rng = random.Random(seed)
+        self.ports = [_Port(SimulatedModem(i, config, corpus, random.Random(rng.random()))) for i in range(num_ports)]
+        self._selector = selectors.DefaultSelector()
+        for port in self.ports:
+            self._selector.register(port.master_fd, selectors.EVENT_READ, port)
+        self._wakeups: List[Tuple[float, int]] = []
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._links: List[str] = []
+
+    def port_paths(self) -> List[str]:
+        return [port.path for port in self.ports]
+
+    def create_links(self, link_dir: str) -> List[str]:
+        """Tạo symlink tên cố định (ttyGSM0, ttyGSM1, ...) trỏ tới các pty"""
+        os.makedirs(link_dir, exist_ok=True)
+        links = []
+        for i, port in enumerate(self.ports):
+            link = os.path.join(link_dir, f"ttyGSM{i}")
+            if os.path.islink(link):
+                os.remove(link)
+            os.symlink(port.path, link)
+            links.append(link)
+        self._links = links
+        return links
+
+    # ---------- scheduling ----------
+    def _schedule(self, port: _Port, index: int, delay: float, data: bytes, now: float):
+        due = now + delay
+        if self.config.baud_pacing:
+            seconds_per_byte = 10.0 / max(1, port.modem.baudrate)
+            start = max(due, port.line_free_at)
+            for offset in range(0, len(data), WRITE_CHUNK):
+                chunk = data[offset:offset + WRITE_CHUNK]
+                port.output.append([start, chunk])
+                start += len(chunk) * seconds_per_byte
+            port.line_free_at = start
+        else:
+            due = max(due, port.output[-1][0] if port.output else due)
+            port.output.append([due, data])
+        heapq.heappush(self._wakeups, (port.output[0][0], index))
+
+    def _flush(self, port: _Port, index: int, now: float):
+        while port.output and port.output[0][0] <= now:
+            due, data = port.output[0]
+            try:
+                written = os.write(port.master_fd, data)
+            except BlockingIOError:
+                written = 0
+            except OSError:
+                port.output.clear()
+                return
+            if written < len(data):
+                port.output[0] = [now + RETRY_DELAY, data[written:]]
+                break
+            port.output.popleft()
+        if port.output:
+            heapq.heappush(self._wakeups, (port.output[0][0], index))
+
+    def _handle_input(self, port: _Port, index: int, now: float):
+        try:
+            data = os.read(port.master_fd, 4096)
+        except (BlockingIOError, OSError):
+            return
+        port.input += data
+        while True:
+            match = re.search(rb"[\r\n]", port.input)
+            if match is None:
+                break
+            line = bytes(port.input[:match.start()]).decode(errors="ignore").strip()
+            del port.input[:match.end()]
+            if not line:
+                continue
+
+            responses = port.modem.handle_command(line, now)
+            if self.config.strict_baud:
+                client_baud = port.client_baudrate()
+                if client_baud is not None and client_baud != port.modem.baudrate:
+                    responses = [(delay, port.modem._garble(data) * 2) for delay, data in responses]
+            for delay, payload in responses:
+                self._schedule(port, index, delay, payload, now)
+
+    # ---------- main loop ----------
+    def run(self):
+        while not self._stop_event.is_set():
+            now = time.monotonic()
+            while self._wakeups and self._wakeups[0][0] <= now:
+                _, index = heapq.heappop(self._wakeups)
+                self._flush(self.ports[index], index, now)
+
+            timeout = 0.2
+            if self._wakeups:
+                timeout = max(0.0, min(timeout, self._wakeups[0][0] - time.monotonic()))
+            for key, _ in self._selector.select(timeout):
+                port = key.data
+                self._handle_input(port, port.modem.index, time.monotonic())
+
+    def start(self):
+        self._thread = threading.Thread(target=self.run, name="ModemSimulator", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+        self._selector.close()
+        for port in self.ports:
+            port.close()
+        for link in self._links:
+            try:
+                os.remove(link)
+            except OSError:
+                pass
+
+    def get_statistics(self) -> dict:
+        """Tổng hợp thống kê của tất cả modem"""
+        totals: Dict[str, int] = {}
+        for port in self.ports:
+            for key, value in port.modem.stats.items():
+                totals[key] = totals.get(key, 0) + value
+        totals["ports"] = len(self.ports)
+        return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Giả lập N modem GSM qua pty để load test")
+    parser.add_argument("--ports", type=int, default=32, help="Số modem giả lập")
+    parser.add_argument("--audio-dir", default=DEFAULT_AUDIO_DIR, help="Thư mục AMR dùng làm nội dung ghi âm")
+    parser.add_argument("--ports-file", default="sim_ports.txt", help="Ghi danh sách cổng (dùng với GSM_EXTRA_PORTS_FILE)")
+    parser.add_argument("--link-dir", help="Tạo symlink ttyGSM<N> trong thư mục này")
+    parser.add_argument("--write-phone-list", help="Ghi các số điện thoại có trong corpus ra file (để nạp vào GUI)")
+    parser.add_argument("--latency-ms", type=float, default=20.0)
+    parser.add_argument("--jitter-ms", type=float, default=10.0)
+    parser.add_argument("--answer-prob", type=float, default=0.2, help="Xác suất người nghe nhấc máy (+COLP)")
+    parser.add_argument("--answer-delay", type=float, nargs=2, default=[3.0, 12.0], metavar=("MIN", "MAX"))
+    parser.add_argument("--ussd-delay", type=float, default=1.5)
+    parser.add_argument("--reboot-delay", type=float, default=2.0)
+    parser.add_argument("--no-baud-pacing", action="store_true", help="Không giới hạn tốc độ theo baudrate")
+    parser.add_argument("--strict-baud", action="store_true", help="Trả rác nếu client mở sai baudrate")
+    parser.add_argument("--no-echo", action="store_true", help="Tắt echo lệnh (như ATE0)")
+    parser.add_argument("--fault-drop", type=float, default=0.0, help="Xác suất không trả lời 1 lệnh")
+    parser.add_argument("--fault-error", type=float, default=0.0, help="Xác suất trả ERROR")
+    parser.add_argument("--fault-garble", type=float, default=0.0, help="Xác suất làm hỏng phản hồi")
+    parser.add_argument("--fault-stall", type=float, default=0.0, help="Xác suất trả lời chậm thêm --stall-seconds")
+    parser.add_argument("--stall-seconds", type=float, default=3.0)
+    parser.add_argument("--dial-error", type=float, default=0.02, help="Xác suất ATD trả ERROR")
+    parser.add_argument("--stats-interval", type=float, default=30.0, help="In thống kê mỗi N giây (0 = tắt)")
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+
+    config = SimulatorConfig(
+        latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, answer_prob=args.answer_prob,
+        answer_delay=tuple(args.answer_delay), ussd_delay=args.ussd_delay, reboot_delay=args.reboot_delay,
+        baud_pacing=not args.no_baud_pacing, strict_baud=args.strict_baud, echo=not args.no_echo,
+        fault_drop=args.fault_drop, fault_error=args.fault_error, fault_garble=args.fault_garble,
+        fault_stall=args.fault_stall, stall_seconds=args.stall_seconds, dial_error_prob=args.dial_error,
+    )
+    corpus = AudioCorpus(args.audio_dir)
+    simulator = ModemSimulator(args.ports, config, corpus, seed=args.seed)
+
+    paths = simulator.create_links(args.link_dir) if args.link_dir else simulator.port_paths()
+    with open(args.ports_file, "w", encoding="utf-8") as f:
+        f.write("\n".join(paths) + "\n")
+    if args.write_phone_list:
+        with open(args.write_phone_list, "w", encoding="utf-8") as f:
+            f.write("\n".join(corpus.phone_numbers()) + "\n")
+
+    print(f"📡 Đang giả lập {len(paths)} modem ({len(corpus.files)} file AMR): {paths[0]} ... {paths[-1]}")
+    print(f"💾 Danh sách cổng: {args.ports_file}  →  export GSM_EXTRA_PORTS_FILE={os.path.abspath(args.ports_file)}")
+
+    stop_event = threading.Event()
+    signal.signal(signal.SIGINT, lambda *_: stop_event.set())
+    signal.signal(signal.SIGTERM, lambda *_: stop_event.set())
+
+    simulator.start()
+    try:
+        while not stop_event.wait(args.stats_interval or None):
+            logger.info(f"📊 {simulator.get_statistics()}")
+    finally:
+        simulator.stop()
+        print(f"🛑 Đã dừng simulator: {simulator.get_statistics()}")
+
+
+if __name__ == "__main__":
+    main()
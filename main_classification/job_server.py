@@ -0,0 +1,573 @@
+"""
+Job server - REST API (HTTP/JSON, chỉ nghe localhost) để đưa nhiều danh sách số vào hàng đợi và chạy liên tục trên bank modem
+
+- Mỗi job: danh sách số, độ ưu tiên, chính sách TTL theo nhãn (số đã có nhãn còn hạn thì dùng lại, không gọi lại)
+- Scheduler phát từng số cho cổng rảnh: "sequential" (job ưu tiên cao chạy hết rồi mới tới job sau)
+  hoặc "interleave" (các job chạy xen kẽ, tỷ lệ theo độ ưu tiên)
+- Tiến độ + kết quả từng phần tra được khi job đang chạy; job xong tự xuất Excel và tải về qua API
+
+API:
+    POST   /jobs                 {"phones": [...] hoặc "0901...\\n0902...", "name": "...", "priority": 1,
+                                  "label_ttl": {"be_blocked": 86400, "*": 0}}
+                                 (hoặc body text/plain + ?name=&priority=)
+    GET    /jobs                 danh sách job
+    GET    /jobs/<id>            tiến độ
+    GET    /jobs/<id>/results    kết quả đã có (từng phần)
+    GET    /jobs/<id>/export     tải file Excel (job chưa xong → xuất kết quả đã có)
+    DELETE /jobs/<id>            hủy job (các cuộc gọi đang dở vẫn chạy xong)
+    GET    /status               trạng thái các cổng + hàng đợi
+
+Usage:
+    python job_server.py --mode interleave --port 8765
+    curl -X POST --data-binary @list_sdt.txt -H "Content-Type: text/plain" "http://127.0.0.1:8765/jobs?name=ca_sang&priority=2"
+"""
+
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import re
+import signal
+import sqlite3
+import threading
+import time
+import uuid
+from collections import deque
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Deque, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+logger = logging.getLogger(__name__)
+
+# Cấu hình (override bằng biến môi trường)
+JOB_API_HOST = os.environ.get("GSM_JOB_API_HOST", "127.0.0.1")
+JOB_API_PORT = int(os.environ.get("GSM_JOB_API_PORT", "8765"))
+JOB_API_TOKEN = os.environ.get("GSM_JOB_API_TOKEN", "")  # Nếu đặt: yêu cầu header "Authorization: Bearer <token>"
+JOB_SCHEDULING = os.environ.get("GSM_JOB_SCHEDULING", "sequential")  # sequential | interleave
+JOB_EXPORT_DIR = os.environ.get("GSM_JOB_EXPORT_DIR", "job_exports")
+LABEL_HISTORY_PATH = os.environ.get("GSM_LABEL_HISTORY_PATH", os.path.join("model_cache", "label_history.sqlite3"))
+CALL_GAP_SECONDS = float(os.environ.get("GSM_CALL_GAP", "2.0"))  # Nghỉ giữa 2 cuộc gọi trên 1 cổng (như _process_phones)
+MAX_BODY_BYTES = 10 * 1024 * 1024
+
+SCHEDULING_MODES = ("sequential", "interleave")
+JOB_NAME_PATTERN = re.compile(r"[\w.-]{1,64}", re.ASCII)  # Tên job nằm trong tên file xuất + header Content-Disposition
+NOT_REUSABLE_LABELS = {"lỗi"}  # Không dùng lại kết quả lỗi
+
+
+class LabelHistory:
+    """Nhãn gần nhất của từng số (SQLite) để áp dụng TTL: số vừa được phân loại không cần gọi lại"""
+
+    def __init__(self, path: str = LABEL_HISTORY_PATH):
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS labels ("
+            " phone_number TEXT PRIMARY KEY, label TEXT NOT NULL, result TEXT NOT NULL, classified_at REAL NOT NULL)"
+        )
+        self._db.commit()
+
+    def lookup(self, phone_number: str, label_ttl: Dict[str, float]) -> Optional[Dict]:
+        """Kết quả cũ nếu nhãn của nó còn trong TTL (label_ttl[nhãn] hoặc label_ttl["*"], giây)"""
+        if not label_ttl:
+            return None
+        with self._lock:
+            row = self._db.execute("SELECT label, result, classified_at FROM labels WHERE phone_number = ?",
+                                   (phone_number,)).fetchone()
+        if row is None:
+            return None
+        label, result_json, classified_at = row
+        ttl = label_ttl.get(label, label_ttl.get("*", 0))
+        age = time.time() - classified_at
+        if ttl <= 0 or age > ttl:
+            return None
+        result = json.loads(result_json)
+        result["reused"] = True
+        result["reused_age_seconds"] = round(age)
+        return result
+
+    def record(self, result: Dict):
+        label = result.get("result")
+        if not label or label in NOT_REUSABLE_LABELS or result.get("reused"):
+            return
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO labels (phone_number, label, result, classified_at) VALUES (?, ?, ?, ?)",
+                (result["phone_number"], label, json.dumps(result, ensure_ascii=False), time.time()),
+            )
+            self._db.commit()
+
+
+class Job:
+    """1 danh sách số được đưa vào hàng đợi"""
+
+    def __init__(self, phones: List[str], name: str = "", priority: int = 1, label_ttl: Optional[Dict] = None):
+        if name and not JOB_NAME_PATTERN.fullmatch(name):
+            raise ValueError("Tên job chỉ được gồm chữ, số, '_', '.', '-' (tối đa 64 ký tự)")
+        self.id = uuid.uuid4().hex[:12]
+        self.name = name or self.id
+        self.priority = priority
+        self.label_ttl = {str(k): float(v) for k, v in (label_ttl or {}).items()}
+        self.phones = phones
+        self.pending: Deque[str] = deque(phones)
+        self.results: List[Dict] = []
+        self.status = "queued"  # queued, running, completed, cancelled
+        self.in_flight = 0
+        self.reused = 0
+        self.dispatched = 0  # Số cuộc gọi đã phát
+        self.pass_value = 0.0  # Virtual time của job (interleave): +1/priority mỗi cuộc gọi được phát
+        self.submitted_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.export_path: Optional[str] = None
+
+    @property
+    def active(self) -> bool:
+        return self.status in ("queued", "running")
+
+    def to_dict(self) -> Dict:
+        by_label: Dict[str, int] = {}
+        for result in self.results:
+            by_label[result.get("result")] = by_label.get(result.get("result"), 0) + 1
+
+        def iso(ts):
+            return datetime.fromtimestamp(ts).isoformat(timespec="seconds") if ts else None
+
+        return {
+            "id": self.id,
+            "name": self.name,
+            "priority": self.priority,
+            "label_ttl": self.label_ttl,
+            "status": self.status,
+            "total": len(self.phones),
+            "done": len(self.results),
+            "pending": len(self.pending),
+            "in_flight": self.in_flight,
+            "reused": self.reused,
+            "by_label": by_label,
+            "submitted_at": iso(self.submitted_at),
+            "started_at": iso(self.started_at),
+            "finished_at": iso(self.finished_at),
+            "export_ready": bool(self.export_path and os.path.exists(self.export_path)),
+        }
+
+
+class JobManager:
+    """
+    Hàng đợi job + 1 worker thread / cổng GSM lấy số tiếp theo từ scheduler
+
+    Thay cho GSMController.start_processing (chia cố định danh sách cho từng cổng):
+    cổng nào rảnh thì nhận số tiếp theo, nên job mới được chạy ngay khi có cổng rảnh
+    """
+
+    def __init__(self, controller, mode: str = JOB_SCHEDULING, history: Optional[LabelHistory] = None,
+                 export_dir: str = JOB_EXPORT_DIR, call_gap: float = CALL_GAP_SECONDS):
+        if mode not in SCHEDULING_MODES:
+            raise ValueError(f"Chế độ không hợp lệ: {mode} (chọn {', '.join(SCHEDULING_MODES)})")
+        self.controller = controller
+        self.mode = mode
+        self.history = history or LabelHistory()
+        self.export_dir = export_dir
+        self.call_gap = call_gap
+        self.jobs: Dict[str, Job] = {}
+        self._cond = threading.Condition()
+        self._virtual_time = 0.0  # pass_value của job vừa được phát số (= pass nhỏ nhất hiện tại)
+        self._stop_flag = False
+        self._workers: List[threading.Thread] = []
+
+    # ---------- jobs ----------
+    def submit(self, phones: List[str], name: str = "", priority: int = 1, label_ttl: Optional[Dict] = None) -> Job:
+        from controller import is_valid_phone_number
+
+        valid = [p for p in (phone.strip() for phone in phones) if is_valid_phone_number(p)]
+        if not valid:
+            raise ValueError("Danh sách không có số hợp lệ")
+        job = Job(list(dict.fromkeys(valid)), name=name, priority=max(1, int(priority)), label_ttl=label_ttl)
+        self._enqueue(job)
+        self.controller.log(f"📥 Job {job.name} ({job.id}): {len(job.phones)} số, ưu tiên {job.priority}")
+        return job
+
+    def _enqueue(self, job: Job):
+        with self._cond:
+            # Job mới bắt đầu từ virtual time hiện tại: không được "bù" các lượt đã phát trước khi nó tới
+            # (nếu bắt đầu từ 0 nó sẽ chiếm mọi cổng cho đến khi đuổi kịp các job cũ)
+            job.pass_value = self._virtual_time
+            self.jobs[job.id] = job
+            self._cond.notify_all()
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        with self._cond:
+            job = self.jobs.get(job_id)
+            if job is None or not job.active:
+                return job
+            job.pending.clear()
+            job.status = "cancelled"
+            if job.in_flight == 0:
+                job.finished_at = time.time()
+        self.controller.log(f"🚫 Đã hủy job {job.name} ({job.id})")
+        return job
+
+    def _pick_job(self) -> Optional[Job]:
+        """Chọn job cho cuộc gọi tiếp theo (gọi khi đang giữ lock)"""
+        candidates = [job for job in self.jobs.values() if job.active and job.pending]
+        if not candidates:
+            return None
+        if self.mode == "sequential":
+            return min(candidates, key=lambda job: (-job.priority, job.submitted_at))
+        # Stride scheduling: job có pass_value nhỏ nhất được chọn
+        return min(candidates, key=lambda job: (job.pass_value, job.submitted_at))
+
+    def _next_phone(self) -> Optional[Tuple[Job, str]]:
+        """Lấy số tiếp theo cần gọi (số có nhãn còn hạn TTL được dùng lại ngay). Block đến khi có việc"""
+        while True:
+            with self._cond:
+                job = None
+                while not self._stop_flag:
+                    job = self._pick_job()
+                    if job is not None:
+                        break
+                    self._cond.wait(timeout=1.0)
+                if job is None:
+                    return None
+                phone = job.pending.popleft()
+                if job.status == "queued":
+                    job.status = "running"
+                    job.started_at = time.time()
+                job.in_flight += 1  # Giữ job chưa xong trong lúc tra lịch sử nhãn
+
+            # Tra SQLite ngoài lock để các cổng khác không phải chờ
+            reused = self.history.lookup(phone, job.label_ttl)
+
+            with self._cond:
+                if reused is None and job.active and not self._stop_flag:
+                    self._virtual_time = job.pass_value
+                    job.pass_value += 1.0 / job.priority
+                    job.dispatched += 1
+                    return job, phone
+                job.in_flight -= 1
+                if reused is not None:
+                    job.results.append(reused)
+                    job.reused += 1
+                elif job.active:
+                    job.pending.appendleft(phone)  # Đang dừng: trả số về hàng đợi
+                finished = self._maybe_finish(job)
+            if finished:
+                # Số cuối của job được dùng lại → không có cuộc gọi nào kết thúc job để xuất file
+                self._start_export(job)
+
+    def _complete_call(self, job: Job, result: Dict):
+        with self._cond:
+            job.results.append(result)
+            job.in_flight -= 1
+            finished = self._maybe_finish(job)
+        self.history.record(result)
+        if finished:
+            self._start_export(job)
+
+    def _start_export(self, job: Job):
+        """Xuất Excel ở thread nền để cổng quay lại gọi số tiếp theo ngay"""
+        threading.Thread(target=self._export, args=(job,), name=f"JobExport-{job.id}", daemon=True).start()
+
+    def _maybe_finish(self, job: Job) -> bool:
+        """Đánh dấu job xong khi hết số và không còn cuộc gọi đang dở (gọi khi đang giữ lock)"""
+        if job.pending or job.in_flight:
+            return False
+        if job.status == "running":
+            job.status = "completed"
+            job.finished_at = time.time()
+            self.controller.log(f"✅ Job {job.name} ({job.id}) xong: {len(job.results)} kết quả, dùng lại {job.reused}")
+            return True
+        if job.status == "cancelled" and job.finished_at is None:
+            job.finished_at = time.time()
+        return False
+
+    def _export(self, job: Job, path: Optional[str] = None) -> Optional[str]:
+        """Xuất kết quả (đã có) của job ra Excel"""
+        from controller import categorize_results
+        from export_excel import export_results_to_excel
+
+        os.makedirs(self.export_dir, exist_ok=True)
+        path = path or os.path.join(self.export_dir, f"{job.name}_{job.id}.xlsx")
+        with self._cond:
+            results = list(job.results)
+        if not export_results_to_excel(categorize_results(results), path):
+            self.controller.log(f"❌ Không xuất được kết quả job {job.id}")
+            return None
+        if job.status == "completed":
+            job.export_path = path
+        return path
+
+    def export_now(self, job: Job) -> Optional[str]:
+        """File Excel của job: file đã xuất nếu job xong, ngược lại xuất kết quả hiện có ra file tạm"""
+        if job.export_path and os.path.exists(job.export_path):
+            return job.export_path
+        return self._export(job, os.path.join(self.export_dir, f"{job.name}_{job.id}_partial.xlsx"))
+
+    # ---------- workers ----------
+    def _worker_loop(self, instance):
+        instance.ready_since = time.time()
+        while not self._stop_flag:
+            work = self._next_phone()
+            if work is None:
+                break
+            job, phone = work
+
+            result = instance.make_call_and_classify(phone)
+            result["job_id"] = job.id
+            if instance.result_callback:
+                instance.result_callback(result, instance.port)
+            instance.call_count += 1
+            self._complete_call(job, result)
+            instance.log(f"📊 [{job.name}] {phone}: {result['result']}")
+
+            if instance.call_count % instance.max_calls_before_reset == 0:
+                instance.log(f"🔄 Đã gọi {instance.call_count} số, đang reset...")
+                instance._reset_and_continue()
+            time.sleep(self.call_gap)
+
+    def start(self):
+        """1 worker thread / GSM instance đã khởi tạo"""
+        self._stop_flag = False
+        self.controller.open_result_store()
+        for port, instance in self.controller.gsm_instances.items():
+            worker = threading.Thread(target=self._worker_loop, args=(instance,), name=f"JobWorker-{port}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+        self.controller.is_running = True
+        self.controller.log(f"🚀 Job scheduler ({self.mode}) chạy trên {len(self._workers)} cổng")
+
+    def stop(self, timeout: float = 90.0):
+        """Không phát số mới, chờ các cuộc gọi đang dở xong"""
+        with self._cond:
+            self._stop_flag = True
+            self._cond.notify_all()
+        deadline = time.time() + timeout
+        for worker in self._workers:
+            worker.join(timeout=max(0.0, deadline - time.time()))
+        self._workers = []
+        self.controller.is_running = False
+
+    def get_status(self) -> Dict:
+        with self._cond:
+            jobs = [job.to_dict() for job in self.jobs.values()]
+        ports = {port: {"status": inst.status, "call_count": inst.call_count, "balance": inst.balance,
+                        "signal": inst.signal_strength}
+                 for port, inst in self.controller.gsm_instances.items()}
+        return {
+            "mode": self.mode,
+            "ports": ports,
+            "queued_jobs": sum(1 for job in jobs if job["status"] == "queued"),
+            "running_jobs": sum(1 for job in jobs if job["status"] == "running"),
+            "pending_calls": sum(job["pending"] for job in jobs),
+        }
+
+
+def parse_phone_payload(body: bytes, content_type: str, query: Dict[str, List[str]]) -> Dict:
+    """Body của POST /jobs → tham số submit(). Lỗi → ValueError"""
+    if "json" in content_type:
+        try:
+            data = json.loads(body.decode("utf-8"))
+        except (UnicodeDecodeError, json.JSONDecodeError) as e:
+            raise ValueError(f"JSON không hợp lệ: {e}")
+        if not isinstance(data, dict):
+            raise ValueError("Body phải là 1 object")
+        phones = data.get("phones", [])
+        if isinstance(phones, str):
+            phones = phones.splitlines()
+        elif not isinstance(phones, list):
+            raise ValueError("phones phải là list hoặc chuỗi nhiều dòng")
+        params = {"phones": [str(p) for p in phones], "name": str(data.get("name", "")),
+                  "priority": data.get("priority", 1), "label_ttl": data.get("label_ttl")}
+    else:
+        params = {"phones": body.decode("utf-8", errors="ignore").splitlines(),
+                  "name": query.get("name", [""])[0], "priority": query.get("priority", ["1"])[0],
+                  "label_ttl": json.loads(query["label_ttl"][0]) if "label_ttl" in query else None}
+
+    try:
+        params["priority"] = int(params["priority"])
+    except (TypeError, ValueError):
+        raise ValueError("priority phải là số nguyên")
+    label_ttl = params["label_ttl"]
+    if label_ttl is not None:
+        if not isinstance(label_ttl, dict) or not all(
+                isinstance(ttl, (int, float)) and not isinstance(ttl, bool) for ttl in label_ttl.values()):
+            raise ValueError("label_ttl phải là object {nhãn: giây}")
+    return params
+
+
+class JobAPIServer:
+    """HTTP/JSON API trên JobManager (ThreadingHTTPServer, thread nền)"""
+
+    def __init__(self, manager: JobManager, host: str = JOB_API_HOST, port: int = JOB_API_PORT,
+                 token: str = JOB_API_TOKEN):
+        self.manager = manager
+        self.host = host
+        self.port = port
+        self.token = token
+        self._server: Optional[ThreadingHTTPServer] = None
+
+    def _make_handler(self):
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _send_json(self, status: int, payload):
+                body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _authorized(self) -> bool:
+                if not api.token or self.headers.get("Authorization") == f"Bearer {api.token}":
+                    return True
+                self._send_json(401, {"error": "unauthorized"})
+                return False
+
+            def _route(self) -> Tuple[List[str], Dict[str, List[str]]]:
+                parsed = urlparse(self.path)
+                return [part for part in parsed.path.split("/") if part], parse_qs(parsed.query)
+
+            def _job(self, job_id: str) -> Optional[Job]:
+                job = api.manager.jobs.get(job_id)
+                if job is None:
+                    self._send_json(404, {"error": f"không có job {job_id}"})
+                return job
+
+            def do_GET(self):
+                if not self._authorized():
+                    return
+                parts, _ = self._route()
+                if parts == ["status"]:
+                    self._send_json(200, api.manager.get_status())
+                elif parts == ["jobs"]:
+                    self._send_json(200, [job.to_dict() for job in list(api.manager.jobs.values())])
+                elif len(parts) == 2 and parts[0] == "jobs":
+                    job = self._job(parts[1])
+                    if job:
+                        self._send_json(200, job.to_dict())
+                elif len(parts) == 3 and parts[0] == "jobs" and parts[2] == "results":
+                    job = self._job(parts[1])
+                    if job:
+                        self._send_json(200, {"job": job.to_dict(), "results": list(job.results)})
+                elif len(parts) == 3 and parts[0] == "jobs" and parts[2] == "export":
+                    job = self._job(parts[1])
+                    if job:
+                        self._send_export(job)
+                else:
+                    self._send_json(404, {"error": "not found"})
+
+            def _send_export(self, job: Job):
+                path = api.manager.export_now(job)
+                if path is None:
+                    self._send_json(500, {"error": "không xuất được file"})
+                    return
+                with open(path, "rb") as f:
+                    body = f.read()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
+                self.send_header("Content-Disposition", f'attachment; filename="{os.path.basename(path)}"')
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                if not self._authorized():
+                    return
+                parts, query = self._route()
+                if parts != ["jobs"]:
+                    self._send_json(404, {"error": "not found"})
+                    return
+                length = int(self.headers.get("Content-Length") or 0)
+                if length > MAX_BODY_BYTES:
+                    self._send_json(413, {"error": "danh sách quá lớn"})
+                    return
+                try:
+                    params = parse_phone_payload(self.rfile.read(length), self.headers.get("Content-Type", ""), query)
+                    job = api.manager.submit(**params)
+                except ValueError as e:
+                    self._send_json(400, {"error": str(e)})
+                    return
+                self._send_json(201, job.to_dict())
+
+            def do_DELETE(self):
+                if not self._authorized():
+                    return
+                parts, _ = self._route()
+                if len(parts) != 2 or parts[0] != "jobs":
+                    self._send_json(404, {"error": "not found"})
+                    return
+                job = self._job(parts[1])
+                if job:
+                    api.manager.cancel(job.id)
+                    self._send_json(200, job.to_dict())
+
+            def log_message(self, format, *args):
+                logger.debug(format % args)
+
+        return Handler
+
+    def start(self):
+        self._server = ThreadingHTTPServer((self.host, self.port), self._make_handler())
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name="JobAPIServer", daemon=True).start()
+        logger.info(f"🌐 Job API: http://{self.host}:{self.port}/jobs")
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+
+def main():
+    # Cần cho STT worker processes (spawn) khi chạy từ exe PyInstaller
+    multiprocessing.freeze_support()
+
+    parser = argparse.ArgumentParser(description="REST API nhận job danh sách số và chạy trên bank modem")
+    parser.add_argument("--host", default=JOB_API_HOST)
+    parser.add_argument("--port", type=int, default=JOB_API_PORT)
+    parser.add_argument("--mode", choices=SCHEDULING_MODES, default=JOB_SCHEDULING)
+    parser.add_argument("--max-ports", type=int, default=32)
+    parser.add_argument("--shutdown-timeout", type=float, default=90.0)
+    args = parser.parse_args()
+
+    from controller import GSMController
+
+    controller = GSMController(max_ports=args.max_ports)
+    controller.start_keyword_rules_watcher()
+    controller.start_metrics_server()
+
+    model_thread = threading.Thread(target=controller.warm_up_models, name="ModelWarmUp", daemon=True)
+    model_thread.start()
+    if not controller.scan_gsm_ports():
+        logger.error("❌ Không tìm thấy cổng GSM nào")
+        raise SystemExit(2)
+    model_thread.join()
+
+    manager = JobManager(controller, mode=args.mode)
+    manager.start()
+    server = JobAPIServer(manager, host=args.host, port=args.port)
+    server.start()
+
+    stop_event = threading.Event()
+    for name in ("SIGINT", "SIGTERM", "SIGBREAK"):
+        signum = getattr(signal, name, None)
+        if signum is not None:
+            signal.signal(signum, lambda *_: stop_event.set())
+    while not stop_event.wait(1.0):
+        pass
+
+    logger.info("🛑 Đang dừng job server...")
+    server.stop()
+    manager.stop(timeout=args.shutdown_timeout)
+    controller.final_reset_all_instances()
+
+
+if __name__ == "__main__":
+    main()
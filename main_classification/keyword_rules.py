@@ -0,0 +1,189 @@
+"""
+Keyword rules - Đọc bộ từ khóa từ file JSON/YAML và tự reload khi file thay đổi
+Thêm cụm từ mới của nhà mạng chỉ cần sửa file, không phải sửa code / build lại exe
+
+Định dạng file (JSON; YAML cùng cấu trúc):
+    {
+        "rules": [
+            {"label": "leave_message", "keywords": ["để lại lời nhắn", "sau tiếng bíp"]},
+            {"label": "be_blocked", "keywords": ["tạm khóa"]}
+        ]
+    }
+
+Usage:
+    python keyword_rules.py --export keyword_rules.json   # xuất bộ từ khóa built-in ra file
+    python keyword_rules.py --check keyword_rules.json    # kiểm tra file trước khi dùng
+"""
+
+import argparse
+import json
+import logging
+import os
+import threading
+from typing import Optional, Tuple
+
+from string_detection import KeywordRules, get_keyword_rules, set_keyword_rules
+
+logger = logging.getLogger(__name__)
+
+# Cấu hình (override bằng biến môi trường)
+KEYWORD_RULES_PATH = os.environ.get("GSM_KEYWORD_RULES", "keyword_rules.json")
+KEYWORD_RULES_POLL_INTERVAL = float(os.environ.get("GSM_KEYWORD_RULES_POLL", "2.0"))
+
+
+def load_rules_file(path: str) -> KeywordRules:
+    """Đọc và biên dịch file rule (.json hoặc .yaml/.yml). Lỗi định dạng → ValueError"""
+    with open(path, "r", encoding="utf-8") as f:
+        content = f.read()
+
+    if path.lower().endswith((".yaml", ".yml")):
+        try:
+            import yaml
+        except ImportError:
+            raise ValueError("Cần cài PyYAML để đọc file rule .yaml (pip install pyyaml)")
+        try:
+            data = yaml.safe_load(content)
+        except yaml.YAMLError as e:
+            raise ValueError(f"File YAML không hợp lệ: {e}")
+    else:
+        try:
+            data = json.loads(content)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"File JSON không hợp lệ: {e}")
+
+    return KeywordRules.from_dict(data, source=os.path.abspath(path))
+
+
+def save_rules_file(path: str, rules: KeywordRules):
+    """Ghi bộ rule ra file JSON (ghi file tạm rồi rename để watcher không đọc phải file ghi dở)"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(rules.to_dict(), f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+class KeywordRulesWatcher:
+    """
+    Theo dõi file rule (poll mtime + size) và áp dụng bộ rule mới khi file thay đổi
+
+    - Poll thay vì watchdog: không thêm dependency, chạy giống nhau trên Windows/Linux
+    - File lỗi (JSON sai, thiếu nhãn...) → log cảnh báo và giữ nguyên bộ rule đang chạy
+    - Biên dịch xong mới swap (set_keyword_rules) → các thread phân loại không phải dừng
+    """
+
+    def __init__(self, path: str = KEYWORD_RULES_PATH, poll_interval: float = KEYWORD_RULES_POLL_INTERVAL):
+        self.path = path
+        self.poll_interval = poll_interval
+        self._signature: Optional[Tuple[float, int]] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop_event = threading.Event()
+        self._lock = threading.Lock()
+
+        # Statistics
+        self._reload_count = 0
+        self._error_count = 0
+        self._last_error: Optional[str] = None
+
+    def _file_signature(self) -> Optional[Tuple[float, int]]:
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return stat.st_mtime, stat.st_size
+
+    def check_now(self) -> bool:
+        """
+        Reload nếu file đã thay đổi kể từ lần đọc trước
+
+        Returns:
+            True nếu đã áp dụng bộ rule mới
+        """
+        with self._lock:
+            signature = self._file_signature()
+            if signature is None or signature == self._signature:
+                return False
+            self._signature = signature
+
+            try:
+                rules = load_rules_file(self.path)
+            except (OSError, ValueError) as e:
+                self._error_count += 1
+                self._last_error = str(e)
+                logger.warning(f"⚠️ Không áp dụng được file từ khóa {self.path}: {e} - giữ bộ từ khóa hiện tại")
+                return False
+
+            self._reload_count += 1
+            self._last_error = None
+
+        set_keyword_rules(rules)
+        return True
+
+    def _watch_loop(self):
+        while not self._stop_event.wait(self.poll_interval):
+            try:
+                self.check_now()
+            except Exception as e:
+                logger.error(f"❌ Lỗi khi theo dõi file từ khóa: {e}")
+
+    def start(self):
+        """Load file ngay (nếu có) rồi chạy thread theo dõi nền"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        if os.path.exists(self.path):
+            self.check_now()
+        else:
+            logger.info(f"ℹ️ Không có file {self.path} - dùng bộ từ khóa built-in")
+
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._watch_loop, name="KeywordRulesWatcher", daemon=True)
+        self._thread.start()
+        logger.info(f"👀 Đang theo dõi file từ khóa {self.path} (mỗi {self.poll_interval:g}s)")
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.poll_interval + 1)
+        self._thread = None
+
+    def get_statistics(self) -> dict:
+        """Lấy thống kê reload"""
+        rules = get_keyword_rules()
+        return {
+            "path": self.path,
+            "active_source": rules.source or "built-in",
+            "labels": len(rules.labels),
+            "phrases": sum(len(kws) for kws in rules.keyword_labels),
+            "reload_count": self._reload_count,
+            "error_count": self._error_count,
+            "last_error": self._last_error,
+        }
+
+
+# Singleton instance
+keyword_rules_watcher = KeywordRulesWatcher()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Quản lý file bộ từ khóa phân loại")
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument("--export", metavar="PATH", help="Xuất bộ từ khóa built-in ra file JSON")
+    group.add_argument("--check", metavar="PATH", help="Kiểm tra file rule và in tóm tắt")
+    args = parser.parse_args()
+
+    if args.export:
+        save_rules_file(args.export, get_keyword_rules())
+        print(f"💾 Đã xuất bộ từ khóa ra {args.export}")
+        return
+
+    try:
+        rules = load_rules_file(args.check)
+    except (OSError, ValueError) as e:
+        print(f"❌ {e}")
+        raise SystemExit(1)
+    print(f"✅ {args.check}: {len(rules.labels)} nhãn")
+    for name, kws in zip(rules.labels, rules.keyword_labels):
+        print(f"   {name}: {len(kws)} cụm từ")
+
+
+if __name__ == "__main__":
+    main()
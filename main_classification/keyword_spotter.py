@@ -0,0 +1,162 @@
+"""
+CTC keyword spotting - Chấm điểm trực tiếp từng cụm từ khóa trên log-probabilities của CTC
+Không cần decode ra text rồi tìm substring → chịu được transcript gần đúng (sai 1-2 ký tự)
+"""
+
+import os
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from string_detection import FUZZY_MIN_PHRASE_LENGTH, MAX_WAITING_TONE, KeywordRules, get_keyword_rules
+
+# Bật/tắt keyword spotting trong pipeline phân loại (override bằng GSM_KEYWORD_SPOTTER=0)
+USE_KEYWORD_SPOTTER = os.environ.get("GSM_KEYWORD_SPOTTER", "1") == "1"
+
+# Ngưỡng confidence (trung bình theo token) để coi là đã gặp cụm từ
+DEFAULT_THRESHOLD = 0.6
+# Cụm ngắn hơn FUZZY_MIN_PHRASE_LENGTH ký tự: vài token gần giống là đủ đạt 0.6 → cần khớp gần như chính xác
+SHORT_PHRASE_THRESHOLD = 0.9
+# Số frame emission tính 1 lần (giới hạn RAM của mảng [frames, phrases, states])
+SCORE_CHUNK_FRAMES = 128
+
+
+def _log_softmax(logits: np.ndarray) -> np.ndarray:
+    shifted = logits - logits.max(axis=-1, keepdims=True)
+    return shifted - np.log(np.exp(shifted).sum(axis=-1, keepdims=True))
+
+
+class CTCKeywordSpotter:
+    """
+    Keyword spotter cho các cụm trong keyword_labels
+
+    Với mỗi frame t, "regret" r[t, v] = log p(v|t) - max_v' log p(v'|t) (<= 0, bằng 0 trên greedy path).
+    Viterbi CTC cho từng cụm từ, được phép bắt đầu/kết thúc ở bất kỳ frame nào (phần ngoài cụm từ = filler
+    với chi phí 0), cho ra tổng regret tốt nhất của cụm từ so với greedy path trên cùng đoạn frame.
+    Confidence = exp(regret / số token): 1.0 nếu greedy transcript chứa đúng cụm từ, giảm dần khi lệch.
+
+    Tất cả cụm từ được pad thành 1 ma trận [phrases, states] nên mỗi frame chỉ là vài phép numpy;
+    emission được lấy theo từng khối SCORE_CHUNK_FRAMES frame nên RAM không tăng theo độ dài audio.
+    Cụm ngắn (< FUZZY_MIN_PHRASE_LENGTH ký tự) dùng ngưỡng SHORT_PHRASE_THRESHOLD.
+    Spotter gắn với 1 bộ rule (KeywordRules); khi rule được reload cần tạo spotter mới.
+    """
+
+    def __init__(self, tokenizer, threshold: float = DEFAULT_THRESHOLD, rules: Optional[KeywordRules] = None):
+        self.threshold = threshold
+        self.blank_id = tokenizer.pad_token_id
+        self.delimiter_id = getattr(tokenizer, "word_delimiter_token_id", None)  # "|" → dấu cách khi decode
+        self.rules = rules or get_keyword_rules()
+        self.labels = self.rules.labels
+        self.keyword_labels = self.rules.keyword_labels
+
+        self._phrases: List[str] = []
+        self._phrase_labels: List[int] = []
+        token_seqs: List[List[int]] = []
+        for label_index, phrases in enumerate(self.keyword_labels):
+            for phrase in phrases:
+                ids = [i for i in tokenizer(phrase).input_ids if i != tokenizer.unk_token_id]
+                if not ids:
+                    continue
+                self._phrases.append(phrase)
+                self._phrase_labels.append(label_index)
+                token_seqs.append(ids)
+
+        # Chuỗi mở rộng CTC không có blank đầu/cuối: t1 _ t2 _ ... _ tL (2L-1 states)
+        self._num_tokens = np.array([len(ids) for ids in token_seqs], dtype=np.float32)
+        self.max_phrase_tokens = max(len(ids) for ids in token_seqs)
+        max_states = 2 * max(len(ids) for ids in token_seqs) - 1
+        num_phrases = len(token_seqs)
+
+        self._ext = np.full((num_phrases, max_states), self.blank_id, dtype=np.int64)
+        self._valid = np.zeros((num_phrases, max_states), dtype=bool)
+        self._can_skip = np.zeros((num_phrases, max_states), dtype=bool)
+        self._final = np.zeros(num_phrases, dtype=np.int64)
+        for p, ids in enumerate(token_seqs):
+            n_states = 2 * len(ids) - 1
+            self._ext[p, 0:n_states:2] = ids
+            self._valid[p, :n_states] = True
+            self._final[p] = n_states - 1
+            for s in range(2, n_states, 2):
+                # Được nhảy qua blank giữa 2 token khác nhau
+                self._can_skip[p, s] = ids[s // 2] != ids[s // 2 - 1]
+
+        self._phrase_labels_arr = np.array(self._phrase_labels, dtype=np.int64)
+        self._thresholds = np.array([
+            threshold if len(phrase) >= FUZZY_MIN_PHRASE_LENGTH else max(threshold, SHORT_PHRASE_THRESHOLD)
+            for phrase in self._phrases
+        ], dtype=np.float32)
+
+    def score_phrases(self, logits: np.ndarray) -> np.ndarray:
+        """
+        Confidence của từng cụm từ trên 1 đoạn audio
+
+        Args:
+            logits: [frames, vocab] (logits hoặc log-probabilities)
+
+        Returns:
+            Mảng [num_phrases] confidence trong (0, 1]
+        """
+        log_probs = _log_softmax(np.asarray(logits, dtype=np.float32))
+        regret = log_probs - log_probs.max(axis=-1, keepdims=True)
+
+        num_phrases, num_states = self._ext.shape
+        neg_inf = np.full((num_phrases, 1), -np.inf, dtype=np.float32)
+        alpha = np.full((num_phrases, num_states), -np.inf, dtype=np.float32)
+        best = np.full(num_phrases, -np.inf, dtype=np.float32)
+        rows = np.arange(num_phrases)
+
+        for start in range(0, regret.shape[0], SCORE_CHUNK_FRAMES):
+            # [chunk, phrases, states]
+            emit = regret[start:start + SCORE_CHUNK_FRAMES, self._ext]
+            emit[:, ~self._valid] = -np.inf
+
+            for t in range(emit.shape[0]):
+                stay = alpha
+                step = np.concatenate([neg_inf, alpha[:, :-1]], axis=1)
+                skip = np.concatenate([neg_inf, neg_inf, alpha[:, :-2]], axis=1)
+                skip = np.where(self._can_skip, skip, -np.inf)
+                prev = np.maximum(np.maximum(stay, step), skip)
+                # Bắt đầu cụm từ ở frame t (filler trước đó có chi phí 0)
+                prev[:, 0] = np.maximum(prev[:, 0], 0.0)
+                alpha = prev + emit[t]
+                best = np.maximum(best, alpha[rows, self._final])
+
+        return np.exp(best / self._num_tokens)
+
+    def spot(self, logits: np.ndarray) -> Tuple[int, float, Optional[str]]:
+        """
+        Phân loại 1 đoạn audio theo logits, giữ thứ tự ưu tiên nhãn như keyword_in_text
+
+        Returns:
+            Tuple[label_index (trong self.labels), confidence, cụm từ khớp (None nếu không có)]
+        """
+        logits = np.asarray(logits, dtype=np.float32)
+
+        # Mute / waiting tone: dựa vào số ký tự của greedy path (không cần decode ra string),
+        # bỏ "|" ở 2 đầu như decode + strip() để khớp với keyword_in_text
+        ids = logits.argmax(axis=-1)
+        collapsed = ids[np.insert(ids[1:] != ids[:-1], 0, True)]
+        chars = collapsed[collapsed != self.blank_id]
+        words = np.flatnonzero(chars != self.delimiter_id)
+        num_chars = int(words[-1] - words[0] + 1) if len(words) else 0
+        if num_chars == 0:
+            return self.labels.index("mute"), 1.0, None
+        if num_chars <= MAX_WAITING_TONE:
+            return self.labels.index("waiting_tone"), 1.0, None
+
+        confidences = self.score_phrases(logits)
+        for label_index in range(len(self.keyword_labels)):
+            mask = self._phrase_labels_arr == label_index
+            if not mask.any():
+                continue
+            candidates = np.where(mask & (confidences >= self._thresholds), confidences, 0.0)
+            best = int(candidates.argmax())
+            if candidates[best] > 0.0:
+                return label_index, float(candidates[best]), self._phrases[best]
+
+        # Không khớp cụm nào: confidence = 1 - cụm gần nhất
+        return self.labels.index("ringback_tone"), float(1.0 - confidences.max()), None
+
+    def spot_batch(self, batch_logits: List[np.ndarray]) -> List[Tuple[int, float, Optional[str]]]:
+        """Phân loại nhiều đoạn audio (vd: reclassify cả batch transcript)"""
+        return [self.spot(logits) for logits in batch_logits]
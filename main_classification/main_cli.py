@@ -0,0 +1,250 @@
+"""
+Headless CLI - Chạy toàn bộ quy trình (quét cổng → nạp danh sách → gọi + phân loại → xuất Excel) không cần GUI
+Không import tkinter: chạy được qua SSH, cron, systemd / supervisor
+
+Config file (JSON, hoặc YAML nếu có PyYAML); tham số dòng lệnh ghi đè config:
+    {
+        "phone_list": "list_sdt.txt",
+        "output": "results/gsm_results_{timestamp}.xlsx",
+        "max_ports": 32,
+        "warm_up": true,
+        "metrics": true,
+        "shutdown_timeout": 90,
+        "progress_interval": 30,
+        "env": {"GSM_STT_BACKEND": "batch", "GSM_STT_MODEL_FORMAT": "int8"}
+    }
+"env" được áp dụng trước khi import controller (các module đọc biến GSM_* lúc import)
+
+Exit codes:
+    0 - hoàn thành và xuất file
+    1 - config / danh sách số không hợp lệ
+    2 - không tìm thấy cổng GSM
+    3 - không load được STT model
+    4 - xuất kết quả thất bại
+    5 - bị dừng bằng signal (kết quả đã gọi được vẫn được xuất)
+
+Usage:
+    python main_cli.py --config nightly.json
+    python main_cli.py --phones list_sdt.txt --output ket_qua.xlsx --max-ports 16
+"""
+
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import signal
+import sys
+import threading
+import time
+from datetime import datetime
+
+logger = logging.getLogger("main_cli")
+
+EXIT_OK = 0
+EXIT_CONFIG_ERROR = 1
+EXIT_NO_PORTS = 2
+EXIT_MODEL_ERROR = 3
+EXIT_EXPORT_FAILED = 4
+EXIT_INTERRUPTED = 5
+
+DEFAULT_CONFIG = {
+    "phone_list": None,
+    "output": "gsm_results_{timestamp}.xlsx",
+    "max_ports": 32,
+    "warm_up": True,
+    "metrics": True,
+    "shutdown_timeout": 90.0,  # Thời gian chờ các cổng gọi xong cuộc đang dở khi bị dừng
+    "progress_interval": 30.0,
+    "env": {},
+}
+
+
+def load_config(path: str) -> dict:
+    """Đọc config JSON/YAML. Lỗi định dạng → ValueError"""
+    with open(path, "r", encoding="utf-8") as f:
+        content = f.read()
+    if path.lower().endswith((".yaml", ".yml")):
+        try:
+            import yaml
+        except ImportError:
+            raise ValueError("Cần cài PyYAML để đọc config .yaml (pip install pyyaml)")
+        try:
+            data = yaml.safe_load(content)
+        except yaml.YAMLError as e:
+            raise ValueError(f"Config YAML không hợp lệ: {e}")
+    else:
+        try:
+            data = json.loads(content)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Config JSON không hợp lệ: {e}")
+
+    if not isinstance(data, dict):
+        raise ValueError("Config phải là 1 object")
+    unknown = set(data) - set(DEFAULT_CONFIG)
+    if unknown:
+        raise ValueError(f"Khóa không hỗ trợ trong config: {', '.join(sorted(unknown))}")
+    return data
+
+
+class HeadlessRunner:
+    """Điều khiển GSMController từ dòng lệnh, dừng an toàn khi nhận SIGINT/SIGTERM"""
+
+    def __init__(self, config: dict):
+        self.config = config
+        self.stop_event = threading.Event()
+        self._signal_count = 0
+        self.controller = None
+
+    def _handle_signal(self, signum, frame):
+        self._signal_count += 1
+        if self._signal_count == 1:
+            logger.warning(f"🛑 Nhận signal {signum} - đang dừng (gửi lần nữa để bỏ qua chờ cuộc gọi đang dở)")
+        else:
+            logger.warning(f"🛑 Nhận signal {signum} lần {self._signal_count} - dừng ngay")
+        self.stop_event.set()
+
+    def install_signal_handlers(self):
+        for name in ("SIGINT", "SIGTERM", "SIGBREAK", "SIGHUP"):
+            signum = getattr(signal, name, None)
+            if signum is not None:
+                signal.signal(signum, self._handle_signal)
+
+    def _output_path(self) -> str:
+        output = self.config["output"].replace("{timestamp}", datetime.now().strftime("%Y%m%d_%H%M%S"))
+        directory = os.path.dirname(output)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        return output
+
+    def _wait_for_completion(self) -> bool:
+        """Chờ các cổng xử lý xong. Returns: False nếu bị dừng bằng signal"""
+        interval = float(self.config["progress_interval"])
+        next_report = time.time() + interval
+        while not self.controller.is_processing_finished():
+            if self.stop_event.wait(1.0):
+                return False
+            if interval > 0 and time.time() >= next_report:
+                status = self.controller.get_processing_status()
+                calling = sum(1 for s in status["instances"].values() if s["status"] == "calling")
+                logger.info(f"📊 {status['total_calls']}/{len(self.controller.phone_list)} số đã gọi, "
+                            f"{calling} cổng đang gọi")
+                next_report = time.time() + interval
+        return True
+
+    def _drain_after_stop(self):
+        """Sau khi stop: chờ các cổng gọi xong cuộc đang dở (tối đa shutdown_timeout hoặc tới signal thứ 2)"""
+        deadline = time.time() + float(self.config["shutdown_timeout"])
+        signals_seen = self._signal_count
+        while not self.controller.is_processing_finished() and time.time() < deadline:
+            if self._signal_count > signals_seen:
+                break
+            time.sleep(0.5)
+
+    def run(self) -> int:
+        start = time.time()
+        phone_list = self.config["phone_list"]
+        if not phone_list or not os.path.exists(phone_list):
+            logger.error(f"❌ Không tìm thấy danh sách số: {phone_list}")
+            return EXIT_CONFIG_ERROR
+
+        # Import sau khi đã áp dụng env từ config
+        from controller import GSMController
+
+        self.controller = GSMController(max_ports=int(self.config["max_ports"]))
+        self.controller.start_keyword_rules_watcher()
+        if self.config["metrics"]:
+            self.controller.start_metrics_server()
+
+        if not self.controller.load_phone_list(phone_list) or not self.controller.phone_list:
+            logger.error("❌ Danh sách số rỗng hoặc không đọc được")
+            return EXIT_CONFIG_ERROR
+
+        # Load model song song với quét cổng (như GUI)
+        model_ok = {"value": True}
+        model_thread = None
+        if self.config["warm_up"]:
+            def warm_up():
+                model_ok["value"] = self.controller.warm_up_models()
+            model_thread = threading.Thread(target=warm_up, name="ModelWarmUp", daemon=True)
+            model_thread.start()
+
+        exit_code = EXIT_OK
+        try:
+            gsm_ports = self.controller.scan_gsm_ports()
+            if model_thread is not None:
+                model_thread.join()
+            if not gsm_ports:
+                logger.error("❌ Không tìm thấy cổng GSM nào")
+                return EXIT_NO_PORTS
+            if not model_ok["value"]:
+                return EXIT_MODEL_ERROR
+            if self.stop_event.is_set():
+                return EXIT_INTERRUPTED
+
+            logger.info(f"⏱️ Sẵn sàng sau {time.time() - start:.1f}s: {len(gsm_ports)} cổng, "
+                        f"{len(self.controller.phone_list)} số")
+            if not self.controller.start_processing():
+                return EXIT_CONFIG_ERROR
+
+            if not self._wait_for_completion():
+                exit_code = EXIT_INTERRUPTED
+                self.controller.stop_processing()
+                self._drain_after_stop()
+            self.controller.is_running = False
+
+            output = self._output_path()
+            if not self.controller.export_results(output):
+                return EXIT_EXPORT_FAILED
+            logger.info(f"✅ Đã xuất {output} sau {time.time() - start:.1f}s")
+            return exit_code
+        finally:
+            # Luôn reset module về baudrate mặc định trước khi thoát
+            if self.controller.gsm_instances:
+                self.controller.final_reset_all_instances()
+
+
+def main() -> int:
+    # Cần cho STT worker processes (spawn) khi chạy từ exe PyInstaller
+    multiprocessing.freeze_support()
+
+    parser = argparse.ArgumentParser(description="Chạy phân loại số điện thoại không cần GUI")
+    parser.add_argument("--config", help="File config JSON/YAML")
+    parser.add_argument("--phones", help="File danh sách số điện thoại")
+    parser.add_argument("--output", help="File Excel kết quả ({timestamp} được thay bằng thời gian chạy)")
+    parser.add_argument("--max-ports", type=int)
+    parser.add_argument("--no-warm-up", action="store_true", help="Không load model trước (load khi cần)")
+    parser.add_argument("--no-metrics", action="store_true", help="Không mở endpoint /metrics")
+    parser.add_argument("--shutdown-timeout", type=float)
+    args = parser.parse_args()
+
+    # Không gọi logging.basicConfig ở đây: controller cấu hình log ra console + logs/ lúc import
+    config = dict(DEFAULT_CONFIG)
+    if args.config:
+        try:
+            config.update(load_config(args.config))
+        except (OSError, ValueError) as e:
+            logger.error(f"❌ {e}")
+            return EXIT_CONFIG_ERROR
+    overrides = {
+        "phone_list": args.phones,
+        "output": args.output,
+        "max_ports": args.max_ports,
+        "shutdown_timeout": args.shutdown_timeout,
+    }
+    config.update({key: value for key, value in overrides.items() if value is not None})
+    if args.no_warm_up:
+        config["warm_up"] = False
+    if args.no_metrics:
+        config["metrics"] = False
+
+    for key, value in (config.get("env") or {}).items():
+        os.environ[str(key)] = str(value)
+
+    runner = HeadlessRunner(config)
+    runner.install_signal_handlers()
+    return runner.run()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -4,6 +4,7 @@ import threading
 import time
 import json
 import os
+import multiprocessing
 from controller import GSMController
 
 class AudioClassificationGUI:
@@ -137,6 +138,12 @@ class AudioClassificationGUI:
                                     style='Action.TButton',
                                     width=12)
         self.export_btn.grid(row=0, column=3, padx=(0, 3))
+
+        # Tiến độ xuất kết quả (chỉ hiện khi đang xuất)
+        self.export_progress = ttk.Progressbar(button_frame, mode='determinate', maximum=100)
+        self.export_progress.grid(row=1, column=0, columnspan=4, pady=(5, 0), sticky=(tk.W, tk.E))
+        self.export_progress.grid_remove()
+        self.export_task = None
         
         # Frame cho Treeview GSM
         tree_frame = ttk.LabelFrame(main_frame, text="Danh Sách GSM", padding="5")
@@ -184,6 +191,8 @@ class AudioClassificationGUI:
         # Khởi tạo
         self.controller = GSMController()
         self.controller.set_log_callback(self.add_log)
+        self.controller.start_keyword_rules_watcher()
+        self.controller.start_metrics_server()
         self.phone_file_path = None
 
         # Hiện loading dialog và khởi tạo hệ thống trong background
@@ -194,7 +203,7 @@ class AudioClassificationGUI:
         # Tạo loading dialog
         loading_dialog = tk.Toplevel(self.root)
         loading_dialog.title("Đang khởi tạo...")
-        loading_dialog.geometry("400x150")
+        loading_dialog.geometry("400x180")
         loading_dialog.resizable(False, False)
 
         # Center dialog
@@ -224,12 +233,32 @@ class AudioClassificationGUI:
                                 foreground='#666')
         status_label.pack(pady=5)
 
+        # Model status label (load STT model song song với quét cổng)
+        model_status_label = ttk.Label(frame,
+                                      text="Đang chờ load STT model...",
+                                      font=('Arial', 9),
+                                      foreground='#666')
+        model_status_label.pack(pady=2)
+
         def update_status(message):
             """Cập nhật status label"""
             status_label.config(text=message)
 
+        def update_model_status(message):
+            """Cập nhật model status label (gọi từ thread khác)"""
+            self.root.after(0, lambda: model_status_label.config(text=message))
+
+        def model_thread():
+            """Thread load + warm-up STT model"""
+            if self.controller.warm_up_models(update_model_status):
+                self.add_log("✅ STT model đã sẵn sàng!")
+
         def init_thread():
             """Thread khởi tạo hệ thống"""
+            # Load STT model song song với quét cổng GSM
+            model_loader = threading.Thread(target=model_thread, daemon=True)
+            model_loader.start()
+
             try:
                 # Quét các cổng GSM
                 self.root.after(0, lambda: update_status("🔍 Đang quét cổng COM..."))
@@ -255,6 +284,11 @@ class AudioClassificationGUI:
                 self.add_log(traceback.format_exc())
 
             finally:
+                # Đợi STT model load xong rồi mới đóng loading dialog
+                if model_loader.is_alive():
+                    self.root.after(0, lambda: update_status("⏳ Đang đợi STT model..."))
+                model_loader.join()
+
                 # Đóng loading dialog
                 self.root.after(100, loading_dialog.destroy)
 
@@ -359,8 +393,13 @@ class AudioClassificationGUI:
         self.add_log("🛑 Đã dừng xử lý")
     
     def export_results(self):
-        """Xuất kết quả ra file Excel"""
-        if not any(self.controller.results.values()):
+        """Xuất kết quả ra file Excel (thread nền); bấm lại khi đang xuất để hủy"""
+        if self.export_task is not None and self.export_task.is_running():
+            self.export_task.cancel()
+            self.export_btn.config(state='disabled')
+            return
+
+        if not self.controller.has_results():
             messagebox.showwarning("Cảnh báo", "Không có kết quả nào để xuất!")
             return
         
@@ -371,13 +410,40 @@ class AudioClassificationGUI:
             filetypes=[("Excel files", "*.xlsx"), ("All files", "*.*")]
         )
         
-        if file_path:
-            if self.controller.export_results(file_path):
-                self.add_log(f"✅ Đã xuất kết quả ra: {os.path.basename(file_path)}")
-                messagebox.showinfo("Thành công", f"Đã xuất kết quả ra file:\n{file_path}")
-            else:
-                self.add_log("❌ Không thể xuất kết quả")
-                messagebox.showerror("Lỗi", "Không thể xuất kết quả ra file Excel")
+        if not file_path:
+            return
+
+        # Callback chạy trên thread xuất → chuyển về Tk thread bằng root.after
+        def on_progress(done, total):
+            self.root.after(0, lambda: self._update_export_progress(done, total))
+
+        def on_done(task):
+            self.root.after(0, lambda: self._finish_export(task))
+
+        self.export_task = self.controller.export_results_async(file_path, on_progress, on_done)
+        if self.export_task is None:
+            messagebox.showerror("Lỗi", "Không thể xuất kết quả ra file Excel")
+            return
+        self.export_btn.config(text="Hủy Xuất")
+        self.export_progress.config(value=0, mode='determinate')
+        self.export_progress.grid()
+
+    def _update_export_progress(self, done: int, total: int):
+        if total:
+            self.export_progress.config(value=min(100, done * 100 / total))
+
+    def _finish_export(self, task):
+        """Kết thúc xuất file (Tk thread)"""
+        self.export_progress.grid_remove()
+        self.export_btn.config(text="Xuất Kết Quả", state='normal')
+        if task.status == "completed":
+            self.add_log(f"✅ Đã xuất kết quả ra: {os.path.basename(task.output_path)}")
+            messagebox.showinfo("Thành công", f"Đã xuất kết quả ra file:\n{task.output_path}")
+        elif task.status == "cancelled":
+            self.add_log("🚫 Đã hủy xuất kết quả")
+        else:
+            self.add_log("❌ Không thể xuất kết quả")
+            messagebox.showerror("Lỗi", "Không thể xuất kết quả ra file Excel")
     
     def add_log(self, message: str):
         """Thêm log vào text area"""
@@ -473,6 +539,9 @@ class AudioClassificationGUI:
         threading.Thread(target=shutdown_thread, daemon=True).start()
 
 def main():
+    # Cần cho STT worker processes (spawn) khi chạy từ exe PyInstaller
+    multiprocessing.freeze_support()
+
     root = tk.Tk()
     app = AudioClassificationGUI(root)
     
@@ -0,0 +1,280 @@
+"""
+Metrics - HTTP endpoint /metrics (định dạng text exposition của Prometheus) cho throughput và sức khỏe pool
+
+Số liệu:
+    - gsm_calls_total{port,label}              : số cuộc gọi theo nhãn và cổng (rate() → cuộc gọi / phút)
+    - gsm_calls_in_flight                      : số cổng đang gọi
+    - gsm_call_stage_seconds{stage}            : histogram thời gian từng giai đoạn (từ call trace)
+    - gsm_serial_bytes_total{port,direction}   : byte serial gửi/nhận (rate() → byte/s)
+    - gsm_model_*                              : pool size, slot bận, queue depth, thời gian chờ model
+    - gsm_stt_cache_*                          : hit/miss của STT cache
+    - gsm_sim_balance_vnd / gsm_sim_signal_rssi: số dư và sóng của từng SIM
+
+Hot path không khóa: byte serial là int của từng GSMInstance (mỗi cổng 1 thread ghi), số cuộc gọi
+và histogram chỉ cập nhật 1 lần / cuộc gọi; mọi số liệu khác được đọc lúc scrape
+
+Usage:
+    GSM_METRICS_PORT=9108 python main_gui.py
+    curl http://127.0.0.1:9108/metrics
+"""
+
+import logging
+import os
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from call_trace import STAGES, call_tracer
+from model_manager import model_manager
+from stt_cache import transcription_cache
+
+logger = logging.getLogger(__name__)
+
+# Cấu hình (override bằng biến môi trường)
+METRICS_ENABLED = os.environ.get("GSM_METRICS", "1") == "1"
+METRICS_HOST = os.environ.get("GSM_METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.environ.get("GSM_METRICS_PORT", "9108"))
+
+STAGE_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _value(value) -> str:
+    return str(value) if isinstance(value, int) else repr(float(value))
+
+
+def _labels(labels: Dict[str, object]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + "}"
+
+
+class Histogram:
+    """Histogram với bucket cố định (cộng dồn khi render như Prometheus)"""
+
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # Phần tử cuối: > bucket lớn nhất
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.total += value
+        self.count += 1
+
+
+class CallMetrics:
+    """Bộ đếm cuộc gọi + histogram giai đoạn, cập nhật từ call trace (1 lần / cuộc gọi)"""
+
+    def __init__(self, buckets: Sequence[float] = STAGE_BUCKETS):
+        self._lock = threading.Lock()
+        self._buckets = buckets
+        self.calls: Dict[Tuple[str, str], int] = {}
+        self.stages: Dict[str, Histogram] = {}
+        self.call_duration = Histogram(buckets)
+
+    def observe(self, trace: Dict):
+        """Listener của call_tracer"""
+        key = (str(trace.get("port")), str(trace.get("result")))
+        with self._lock:
+            self.calls[key] = self.calls.get(key, 0) + 1
+            for stage, seconds in trace.get("stages", {}).items():
+                histogram = self.stages.get(stage)
+                if histogram is None:
+                    histogram = self.stages[stage] = Histogram(self._buckets)
+                histogram.observe(seconds)
+            self.call_duration.observe(trace.get("total", 0.0))
+
+    def snapshot(self) -> Tuple[Dict[Tuple[str, str], int], Dict[str, Histogram], Histogram]:
+        """Bản sao nhất quán để render (không giữ lock lúc format text)"""
+        with self._lock:
+            stages = {}
+            for stage, histogram in self.stages.items():
+                copy = Histogram(histogram.buckets)
+                copy.counts, copy.total, copy.count = list(histogram.counts), histogram.total, histogram.count
+                stages[stage] = copy
+            duration = Histogram(self.call_duration.buckets)
+            duration.counts = list(self.call_duration.counts)
+            duration.total, duration.count = self.call_duration.total, self.call_duration.count
+            return dict(self.calls), stages, duration
+
+
+class _Exposition:
+    """Gom các dòng text exposition, mỗi metric 1 khối HELP/TYPE"""
+
+    def __init__(self):
+        self.lines: List[str] = []
+
+    def metric(self, name: str, metric_type: str, help_text: str, samples: List[Tuple[Dict, float]]):
+        self.lines.append(f"# HELP {name} {help_text}")
+        self.lines.append(f"# TYPE {name} {metric_type}")
+        for labels, value in samples:
+            self.lines.append(f"{name}{_labels(labels)} {_value(value)}")
+
+    def histogram(self, name: str, help_text: str, series: List[Tuple[Dict, Histogram]]):
+        self.lines.append(f"# HELP {name} {help_text}")
+        self.lines.append(f"# TYPE {name} histogram")
+        for labels, histogram in series:
+            cumulative = 0
+            for bound, count in zip(histogram.buckets, histogram.counts):
+                cumulative += count
+                self.lines.append(f"{name}_bucket{_labels({**labels, 'le': f'{bound:g}'})} {cumulative}")
+            self.lines.append(f"{name}_bucket{_labels({**labels, 'le': '+Inf'})} {histogram.count}")
+            self.lines.append(f"{name}_sum{_labels(labels)} {_value(histogram.total)}")
+            self.lines.append(f"{name}_count{_labels(labels)} {histogram.count}")
+
+    def render(self) -> str:
+        return "\n".join(self.lines) + "\n"
+
+
+def _number(text: str) -> Optional[float]:
+    match = re.search(r"-?\d+(?:\.\d+)?", str(text))
+    return float(match.group()) if match else None
+
+
+def render_metrics(controller=None, calls: Optional[CallMetrics] = None) -> str:
+    """Tạo nội dung /metrics từ controller, ModelPool, STT cache và bộ đếm cuộc gọi"""
+    calls = calls or call_metrics
+    out = _Exposition()
+
+    # Cuộc gọi
+    call_counts, stages, duration = calls.snapshot()
+    out.metric("gsm_calls_total", "counter", "Số cuộc gọi đã hoàn thành theo cổng và nhãn",
+               [({"port": port, "label": label}, count) for (port, label), count in sorted(call_counts.items())])
+    order = {stage: i for i, stage in enumerate(STAGES)}
+    out.histogram("gsm_call_stage_seconds", "Thời gian từng giai đoạn của cuộc gọi",
+                  [({"stage": stage}, stages[stage]) for stage in sorted(stages, key=lambda s: order.get(s, len(order)))])
+    out.histogram("gsm_call_duration_seconds", "Tổng thời gian 1 cuộc gọi (không gồm queue_wait)", [({}, duration)])
+
+    # Cổng GSM
+    if controller is not None:
+        instances = list(controller.gsm_instances.items())
+        out.metric("gsm_calls_in_flight", "gauge", "Số cổng đang gọi",
+                   [({}, sum(1 for _, inst in instances if inst.status == "calling"))])
+        out.metric("gsm_ports_connected", "gauge", "Số cổng đang kết nối",
+                   [({}, sum(1 for _, inst in instances if inst.is_connected))])
+        out.metric("gsm_queue_remaining", "gauge", "Số điện thoại còn chờ gọi theo cổng",
+                   [({"port": port}, max(0, len(inst.phone_queue) - inst.call_count)) for port, inst in instances])
+        serial_samples = []
+        for port, inst in instances:
+            serial_samples.append(({"port": port, "direction": "tx"}, inst.bytes_sent))
+            serial_samples.append(({"port": port, "direction": "rx"}, inst.bytes_received))
+        out.metric("gsm_serial_bytes_total", "counter", "Số byte serial đã gửi/nhận", serial_samples)
+
+        balances, signals = [], []
+        for port, inst in instances:
+            balance = _number(inst.balance) if "VND" in str(inst.balance) else None
+            if balance is not None:
+                balances.append(({"port": port, "operator": inst.network_operator}, balance))
+            signal = _number(inst.signal_strength) if "/" in str(inst.signal_strength) else None
+            if signal is not None:
+                signals.append(({"port": port, "operator": inst.network_operator}, signal))
+        out.metric("gsm_sim_balance_vnd", "gauge", "Số dư tài khoản SIM (VND)", balances)
+        out.metric("gsm_sim_signal_rssi", "gauge", "Cường độ sóng SIM (AT+CSQ, 0-31)", signals)
+        out.metric("gsm_processing_running", "gauge", "1 nếu đang xử lý danh sách",
+                   [({}, int(controller.is_running))])
+
+    # ModelPool
+    stats = model_manager.get_statistics()
+    labels = {"backend": stats["backend"], "format": stats["model_format"]}
+    out.metric("gsm_model_pool_size", "gauge", "Số slot trong ModelPool", [(labels, stats["pool_size"])])
+    out.metric("gsm_model_busy_slots", "gauge", "Số slot đang chạy inference", [(labels, stats["busy_models"])])
+    out.metric("gsm_model_requests_total", "counter", "Số lần lấy slot model", [(labels, stats["total_requests"])])
+    out.metric("gsm_model_wait_seconds_total", "counter", "Tổng thời gian chờ slot model",
+               [(labels, stats["total_wait_time"])])
+    batching = stats.get("batching")
+    if batching:
+        out.metric("gsm_model_queue_depth", "gauge", "Số request STT đang chờ trong batch queue",
+                   [({}, batching["queue_depth"])])
+        out.metric("gsm_model_max_queue_depth", "gauge", "Queue depth lớn nhất từ lúc chạy",
+                   [({}, batching["max_queue_depth"])])
+        out.metric("gsm_model_batch_avg_size", "gauge", "Kích thước batch trung bình", [({}, batching["avg_batch_size"])])
+        out.metric("gsm_model_batch_avg_queue_wait_seconds", "gauge", "Thời gian chờ trung bình trong batch queue",
+                   [({}, batching["avg_queue_wait"])])
+    streaming = stats.get("streaming")
+    if streaming:
+        out.metric("gsm_stt_streaming_processed_ratio", "gauge", "Tỷ lệ audio thực sự chạy model (streaming)",
+                   [({}, streaming["processed_ratio"])])
+
+    # STT cache
+    if transcription_cache is not None:
+        cache = transcription_cache.get_statistics()
+        out.metric("gsm_stt_cache_hits_total", "counter", "Số lần STT cache hit theo tầng",
+                   [({"tier": tier}, cache[f"{tier}_hits"]) for tier in ("memory", "disk", "perceptual")])
+        out.metric("gsm_stt_cache_misses_total", "counter", "Số lần STT cache miss", [({}, cache["misses"])])
+        out.metric("gsm_stt_cache_hit_ratio", "gauge", "Tỷ lệ cache hit", [({}, cache["hit_rate"])])
+        out.metric("gsm_stt_cache_entries", "gauge", "Số entry trong cache RAM", [({}, cache["memory_entries"])])
+
+    return out.render()
+
+
+class MetricsServer:
+    """HTTP server nền (ThreadingHTTPServer) phục vụ /metrics"""
+
+    def __init__(self, controller=None, host: str = METRICS_HOST, port: int = METRICS_PORT):
+        self.controller = controller
+        self.host = host
+        self.port = port
+        self._server: Optional[ThreadingHTTPServer] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                try:
+                    body = render_metrics(server.controller).encode("utf-8")
+                except Exception as e:
+                    logger.error(f"❌ Lỗi tạo metrics: {e}")
+                    self.send_error(500)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                logger.debug(format % args)
+
+        return Handler
+
+    def start(self) -> bool:
+        """Chạy server ở thread nền. Cổng bị chiếm → log cảnh báo, app vẫn chạy bình thường"""
+        if self._server is not None:
+            return True
+        try:
+            self._server = ThreadingHTTPServer((self.host, self.port), self._make_handler())
+        except OSError as e:
+            logger.warning(f"⚠️ Không mở được metrics endpoint {self.host}:{self.port}: {e}")
+            return False
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, name="MetricsServer", daemon=True)
+        self._thread.start()
+        logger.info(f"📈 Metrics: http://{self.host}:{self.port}/metrics")
+        return True
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+
+# Singleton instance (nhận số liệu từ mọi cuộc gọi)
+call_metrics = CallMetrics()
+call_tracer.add_listener(call_metrics.observe)
@@ -0,0 +1,226 @@
+"""
+Model backends - Các cách load model STT cho ModelPool / STT worker processes
+- fp32: Wav2Vec2ForCTC gốc từ HuggingFace
+- int8: dynamic quantization (Linear → int8) cho CPU, có cache weights trên đĩa
+- onnx: export sang ONNX (dynamic time axis) và chạy bằng onnxruntime CPUExecutionProvider
+"""
+
+import logging
+import os
+import re
+from types import SimpleNamespace
+from typing import Optional
+
+import torch
+from transformers import Wav2Vec2Config, Wav2Vec2ForCTC
+
+logger = logging.getLogger(__name__)
+
+MODEL_FORMATS = ("fp32", "int8", "onnx")
+
+# Số thread cho onnxruntime (mặc định: intra-op = số core / pool size vì các slot chạy session đồng thời,
+# inter-op = 1 vì graph tuần tự; 0 = tự tính)
+ONNX_INTRA_OP_THREADS = int(os.environ.get("GSM_ONNX_INTRA_OP_THREADS", "0"))
+ONNX_INTER_OP_THREADS = int(os.environ.get("GSM_ONNX_INTER_OP_THREADS", "1"))
+
+# Thư mục cache cho model đã chuyển đổi (quantized, ...)
+MODEL_CACHE_DIR = os.environ.get("GSM_MODEL_CACHE_DIR", "model_cache")
+
+
+def _cache_path(model_id: str, suffix: str, cache_dir: Optional[str] = None) -> str:
+    """Đường dẫn file cache cho model_id (kèm torch version vì format quantized phụ thuộc torch)"""
+    safe_id = re.sub(r"[^A-Za-z0-9._-]+", "_", model_id)
+    torch_version = torch.__version__.split("+")[0]
+    return os.path.join(cache_dir or MODEL_CACHE_DIR, f"{safe_id}.torch{torch_version}.{suffix}")
+
+
+def load_fp32_model(model_id: str, device: str) -> Wav2Vec2ForCTC:
+    """Load model fp32 gốc"""
+    model = Wav2Vec2ForCTC.from_pretrained(model_id).to(device)
+    model.eval()
+    return model
+
+
+def _quantize(model: Wav2Vec2ForCTC) -> torch.nn.Module:
+    """Dynamic int8 quantization cho các lớp Linear (attention + feed-forward + lm_head)"""
+    return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def load_int8_model(model_id: str, cache_dir: Optional[str] = None) -> torch.nn.Module:
+    """
+    Load model int8 (chỉ chạy trên CPU)
+
+    - Lần đầu: load fp32 → quantize → lưu state_dict vào cache
+    - Các lần sau: dựng kiến trúc từ config → quantize (chưa có weights) → load state_dict từ cache,
+      không cần đọc lại weights fp32
+    """
+    path = _cache_path(model_id, "int8.pt", cache_dir)
+    if os.path.exists(path):
+        try:
+            config = Wav2Vec2Config.from_pretrained(model_id)
+            model = _quantize(Wav2Vec2ForCTC(config).eval())
+            model.load_state_dict(torch.load(path, map_location="cpu"))
+            model.eval()
+            logger.info(f"📦 Loaded int8 model from cache: {path}")
+            return model
+        except Exception as e:
+            logger.warning(f"⚠️ Cache int8 không dùng được ({e}), đang quantize lại...")
+
+    model = _quantize(load_fp32_model(model_id, "cpu"))
+    model.eval()
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    torch.save(model.state_dict(), tmp_path)
+    os.replace(tmp_path, path)
+    logger.info(f"💾 Saved int8 model to cache: {path}")
+    return model
+
+
+class _LogitsOnly(torch.nn.Module):
+    """Wrapper chỉ trả về logits để export ONNX gọn (không có ModelOutput)"""
+
+    def __init__(self, model: Wav2Vec2ForCTC):
+        super().__init__()
+        self.model = model
+
+    def forward(self, input_values):
+        return self.model(input_values).logits
+
+
+def export_onnx(model_id: str, cache_dir: Optional[str] = None, opset: int = 14) -> str:
+    """
+    Export Wav2Vec2ForCTC sang ONNX (cache trên đĩa, chỉ export 1 lần)
+
+    Input "input_values" [batch, samples] và output "logits" [batch, frames, vocab]
+    đều có dynamic axes nên chạy được với mọi độ dài audio / batch size.
+
+    Returns:
+        Đường dẫn file .onnx
+    """
+    path = _cache_path(model_id, "onnx", cache_dir)
+    if os.path.exists(path):
+        return path
+
+    logger.info(f"📤 Exporting {model_id} to ONNX...")
+    model = load_fp32_model(model_id, "cpu")
+    dummy_input = torch.zeros(1, 16000, dtype=torch.float32)
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with torch.no_grad():
+        torch.onnx.export(
+            _LogitsOnly(model),
+            dummy_input,
+            tmp_path,
+            input_names=["input_values"],
+            output_names=["logits"],
+            dynamic_axes={
+                "input_values": {0: "batch", 1: "samples"},
+                "logits": {0: "batch", 1: "frames"},
+            },
+            opset_version=opset,
+            do_constant_folding=True,
+        )
+    os.replace(tmp_path, path)
+    logger.info(f"💾 Saved ONNX model to cache: {path}")
+    return path
+
+
+class OnnxWav2Vec2:
+    """
+    Chạy model ONNX với interface giống Wav2Vec2ForCTC: model(input_values).logits
+
+    InferenceSession thread-safe và các lần gọi run() dùng chung weights,
+    nên 1 instance có thể phục vụ đồng thời tất cả các cổng GSM.
+    """
+
+    def __init__(self, path: str, config: Wav2Vec2Config, intra_op_threads: int = ONNX_INTRA_OP_THREADS,
+                 inter_op_threads: int = ONNX_INTER_OP_THREADS, pool_size: int = 1):
+        try:
+            import onnxruntime as ort
+        except ImportError:
+            raise ValueError("Cần cài onnxruntime để chạy model ONNX (pip install onnxruntime)")
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = intra_op_threads or max(1, (os.cpu_count() or 1) // max(1, pool_size))
+        options.inter_op_num_threads = inter_op_threads
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+
+        self.path = path
+        self.config = config
+        self._session = ort.InferenceSession(path, sess_options=options, providers=["CPUExecutionProvider"])
+
+    def __call__(self, input_values):
+        if isinstance(input_values, torch.Tensor):
+            input_values = input_values.cpu().numpy()
+        logits = self._session.run(["logits"], {"input_values": input_values})[0]
+        return SimpleNamespace(logits=torch.from_numpy(logits))
+
+    def _get_feat_extract_output_lengths(self, input_lengths: torch.Tensor) -> torch.Tensor:
+        """Số frame logits tương ứng với số sample audio (giống Wav2Vec2ForCTC)"""
+        for kernel_size, stride in zip(self.config.conv_kernel, self.config.conv_stride):
+            input_lengths = torch.div(input_lengths - kernel_size, stride, rounding_mode="floor") + 1
+        return input_lengths
+
+    def eval(self):
+        return self
+
+
+def load_onnx_model(model_id: str, cache_dir: Optional[str] = None, pool_size: int = 1) -> OnnxWav2Vec2:
+    """Export (nếu chưa có cache) và mở InferenceSession (pool_size = số lần run() đồng thời)"""
+    path = export_onnx(model_id, cache_dir)
+    config = Wav2Vec2Config.from_pretrained(model_id)
+    return OnnxWav2Vec2(path, config, pool_size=pool_size)
+
+
+def load_stt_model(model_id: str, device: str, model_format: str = "fp32", pool_size: int = 1) -> torch.nn.Module:
+    """
+    Load model STT theo format
+
+    Args:
+        model_id: HuggingFace model id
+        device: "cuda" hoặc "cpu"
+        model_format: Một trong MODEL_FORMATS
+        pool_size: Số forward pass chạy đồng thời trên model (chia core cho session onnx)
+
+    Returns:
+        Model có thể gọi model(input_values).logits
+    """
+    if model_format == "fp32":
+        return load_fp32_model(model_id, device)
+
+    if model_format == "int8":
+        if device != "cpu":
+            logger.warning("⚠️ Model int8 chỉ hỗ trợ CPU, bỏ qua device " + device)
+        return load_int8_model(model_id)
+
+    if model_format == "onnx":
+        if device != "cpu":
+            logger.warning("⚠️ Model onnx chạy bằng CPUExecutionProvider, bỏ qua device " + device)
+        return load_onnx_model(model_id, pool_size=pool_size)
+
+    raise ValueError(f"Model format không hợp lệ: {model_format} (hỗ trợ: {', '.join(MODEL_FORMATS)})")
+
+
+def model_device(model_format: str, device: str) -> str:
+    """Device thực tế mà model của format này chạy trên"""
+    return "cpu" if model_format in ("int8", "onnx") else device
+
+
+def model_size_bytes(model: torch.nn.Module) -> int:
+    """Ước lượng RAM của weights (bao gồm packed params của lớp quantized)"""
+    if isinstance(model, OnnxWav2Vec2):
+        return os.path.getsize(model.path)
+
+    total = 0
+    for tensor in model.state_dict().values():
+        if isinstance(tensor, torch.Tensor):
+            total += tensor.numel() * tensor.element_size()
+        elif isinstance(tensor, tuple):
+            # Packed params của Linear quantized: (weight, bias)
+            for item in tensor:
+                if isinstance(item, torch.Tensor):
+                    total += item.numel() * item.element_size()
+    return total
@@ -1,26 +1,74 @@
 """
 ModelPool - Quản lý pool of STT models với thread-safe và load balancing
-Model Pooling (3-4 copies) → Balance memory vs performance → Tránh bottleneck
+1 bản weights dùng chung + N slots (semaphore) → RAM không tăng theo pool size → Tránh bottleneck
 """
 
+import os
 import threading
 import logging
+import numpy as np
 import torch
 from transformers import Wav2Vec2ForCTC, Wav2Vec2Processor
-from typing import Optional, Tuple, List
+from typing import Optional, Tuple, List, Dict, Callable
 import time
-from queue import Queue
+from queue import Queue, Empty
+from concurrent.futures import Future
+
+from model_backends import MODEL_FORMATS, load_stt_model, model_device
+from keyword_spotter import CTCKeywordSpotter
+from string_detection import get_keyword_rules
 
 logger = logging.getLogger(__name__)
 
+SAMPLE_RATE = 16000
+
+# Các chế độ chạy STT:
+# - "direct": mỗi request mượn 1 model và chạy batch size 1
+# - "batch": gom request từ mọi instance vào BatchInferenceServer
+# - "process": chạy STT trong worker processes riêng (ProcessModelPool) để tránh GIL
+STT_BACKENDS = ("direct", "batch", "process")
+
+# Cấu hình backend mặc định (override bằng biến môi trường GSM_STT_BACKEND)
+STT_BACKEND = os.environ.get("GSM_STT_BACKEND", "batch")
+STT_BACKEND_OPTIONS = {
+    "batch": {"max_batch_size": 8, "max_wait_ms": 5.0},  # Gom request từ 32 cổng
+}
+
+# Format weights của model (override bằng GSM_STT_MODEL_FORMAT), "int8"/"onnx" cho máy chỉ có CPU
+STT_MODEL_FORMAT = os.environ.get("GSM_STT_MODEL_FORMAT", "fp32")
+
+# Pool size ban đầu (override bằng GSM_POOL_SIZE; với backend "process" = số worker process)
+POOL_SIZE = int(os.environ.get("GSM_POOL_SIZE", "4"))
+
+# Tự điều chỉnh pool size (bật bằng GSM_POOL_AUTOSCALE=1; GSM_POOL_MIN_SIZE, GSM_POOL_MAX_SIZE)
+POOL_AUTOSCALE = os.environ.get("GSM_POOL_AUTOSCALE", "0") == "1"
+POOL_MIN_SIZE = int(os.environ.get("GSM_POOL_MIN_SIZE", "1"))
+POOL_MAX_SIZE = int(os.environ.get("GSM_POOL_MAX_SIZE", "0")) or None  # None = số CPU
+
+# Streaming STT: chạy theo từng cửa sổ và dừng sớm khi đã chắc chắn khớp từ khóa
+USE_STREAMING_STT = os.environ.get("GSM_STREAMING_STT", "1") == "1"
+STREAMING_CHUNK_SECONDS = 3.0  # Độ dài phần audio mới mỗi bước
+STREAMING_OVERLAP_SECONDS = 1.0  # Phần audio lặp lại với cửa sổ trước (context cho biên cửa sổ)
+STREAMING_MIN_CONFIDENCE = 0.85  # Confidence keyword spotting tối thiểu để dừng sớm
+STREAMING_FRAMES_PER_TOKEN = 6  # Số frame tối đa ước lượng cho 1 ký tự (độ dài phần đuôi được spot lại mỗi bước)
+FRAME_SAMPLES = 320  # Số sample / 1 frame logits của Wav2Vec2 (tích các conv stride)
+
+
+def greedy_ctc_decode(processor: Wav2Vec2Processor, logits: torch.Tensor) -> List[str]:
+    """Greedy CTC decode: argmax theo từng frame rồi gộp token lặp/blank"""
+    predicted_ids = torch.argmax(logits, dim=-1)
+    return processor.batch_decode(predicted_ids)
+
+
 class ModelPool:
     """
     Singleton class để quản lý pool of STT models
 
     Với 30 GSM instances:
-    - 1 model: Bottleneck nghiêm trọng
-    - 4 models: Cân bằng tốt (30/4 = 7.5 threads/model)
-    - Tiết kiệm: 86% RAM (4 vs 30 models)
+    - 1 slot: Bottleneck nghiêm trọng
+    - 4 slots: Cân bằng tốt (30/4 = 7.5 threads/slot)
+    - Weights chỉ load 1 lần, các slot dùng chung parameter tensors ở inference mode
+      → RAM không đổi khi tăng pool size, chỉ giới hạn số forward pass đồng thời
     """
 
     _instance = None
@@ -43,11 +91,13 @@ class ModelPool:
         self._pool_size = 4  # Default pool size
         self._device = "cuda" if torch.cuda.is_available() else "cpu"
         self._model_id = "nguyenvulebinh/wav2vec2-base-vietnamese-250h"
+        self._model_format = "fp32"
 
-        # Pool of models
+        # Shared model + slots
         self._processor: Optional[Wav2Vec2Processor] = None  # Shared processor (nhẹ)
-        self._model_pool: List[Wav2Vec2ForCTC] = []  # Pool of models
-        self._model_queue: Queue = Queue()  # Queue để quản lý available models
+        self._model: Optional[Wav2Vec2ForCTC] = None  # 1 bản weights dùng chung cho mọi slot
+        self._slot_cond = threading.Condition()  # Counting semaphore có thể đổi kích thước
+        self._busy_slots = 0
         self._pool_lock = threading.Lock()
         self._loading = False
         self._loaded = False
@@ -55,18 +105,119 @@ class ModelPool:
         # Statistics
         self._total_requests = 0
         self._total_wait_time = 0.0
+        self._streaming_requests = 0
+        self._streaming_early_exits = 0
+        self._streaming_audio_seconds = 0.0
+        self._streaming_processed_seconds = 0.0
+        self._thread_wait = threading.local()  # Thời gian chờ model của từng thread gọi (cho call trace)
+
+        # Chế độ chạy STT + micro-batching
+        self._backend = "direct"
+        self._batch_server: Optional["BatchInferenceServer"] = None
+        self._process_pool = None  # ProcessModelPool (lazy import)
+        self._keyword_spotter: Optional[CTCKeywordSpotter] = None
+        self._autoscaler: Optional["PoolAutoscaler"] = None
 
         logger.info(f"🤖 ModelPool initialized:")
-        logger.info(f"   - Pool size: {self._pool_size} models")
+        logger.info(f"   - Pool size: {self._pool_size} slots")
         logger.info(f"   - Device: {self._device}")
         logger.info(f"   - Model: {self._model_id}")
     
     def set_pool_size(self, pool_size: int):
-        """Set pool size (chỉ được gọi trước khi load models)"""
-        if self._model_pool:
-            raise RuntimeError("Không thể thay đổi pool_size sau khi đã load models")
-        self._pool_size = pool_size
+        """
+        Set pool size = số forward pass chạy đồng thời
+
+        Note:
+            - Weights dùng chung nên có thể đổi cả khi đã load (không tốn thêm RAM)
+            - Backend "process" vẫn cần set trước khi khởi động STT workers
+        """
+        if pool_size < 1:
+            raise ValueError("pool_size phải >= 1")
+        with self._slot_cond:
+            self._pool_size = pool_size
+            self._slot_cond.notify_all()
+        if self._batch_server is not None:
+            self._batch_server.ensure_workers(pool_size)
+        self._apply_thread_cap()
         logger.info(f"📊 Pool size set to: {pool_size}")
+
+    def _apply_thread_cap(self):
+        """
+        Chia đều core cho các slot: torch.set_num_threads = CPU / pool size (chỉ khi chạy trên CPU)
+        để tổng số thread của các forward pass đồng thời không vượt quá số core
+        """
+        if self._device == "cpu":
+            torch.set_num_threads(max(1, (os.cpu_count() or 1) // self._pool_size))
+
+    def set_model_format(self, model_format: str):
+        """Set format weights của model (chỉ được gọi trước khi load models)"""
+        if self._model is not None:
+            raise RuntimeError("Không thể thay đổi model_format sau khi đã load models")
+        if model_format not in MODEL_FORMATS:
+            raise ValueError(f"Model format không hợp lệ: {model_format} (hỗ trợ: {', '.join(MODEL_FORMATS)})")
+        if self._process_pool is not None and self._process_pool.is_loaded():
+            raise RuntimeError("Không thể thay đổi model_format sau khi đã khởi động STT workers")
+        self._model_format = model_format
+        self._device = model_device(model_format, self._device)
+        self._apply_thread_cap()
+        if self._process_pool is not None:
+            self._process_pool.set_model_format(model_format, self._device)
+        logger.info(f"📊 Model format set to: {model_format} ({self._device})")
+
+    def get_model_format(self) -> str:
+        """Lấy format weights của model"""
+        return self._model_format
+
+    def get_model_id(self) -> str:
+        """Lấy id (HuggingFace) của STT model"""
+        return self._model_id
+
+    def set_backend(self, backend: str, **options):
+        """
+        Chọn chế độ chạy STT cho transcribe()
+
+        Args:
+            backend: Một trong STT_BACKENDS
+            **options: Tham số cho backend (vd: max_batch_size, max_wait_ms cho "batch")
+
+        Note:
+            - Backend "process" dùng pool_size hiện tại làm số worker process
+        """
+        if backend not in STT_BACKENDS:
+            raise ValueError(f"Backend không hợp lệ: {backend} (hỗ trợ: {', '.join(STT_BACKENDS)})")
+
+        if backend == "batch":
+            if self._batch_server is None:
+                self._batch_server = BatchInferenceServer(self, **options)
+            else:
+                self._batch_server.configure(**options)
+        elif backend == "process" and self._process_pool is None:
+            from stt_process_pool import ProcessModelPool
+            self._process_pool = ProcessModelPool(self._model_id, self._device, self._pool_size, self._model_format)
+
+        self._backend = backend
+        logger.info(f"⚙️ STT backend set to: {backend}")
+
+    def get_backend(self) -> str:
+        """Lấy chế độ chạy STT hiện tại"""
+        return self._backend
+
+    def enable_autoscaling(self, **options):
+        """
+        Bật PoolAutoscaler: tự điều chỉnh pool size theo wait time, số CPU và RAM còn trống
+
+        Args:
+            **options: Tham số cho PoolAutoscaler (min_size, max_size, interval, ...)
+        """
+        if self._autoscaler is not None:
+            self._autoscaler.stop()
+        self._autoscaler = PoolAutoscaler(self, **options)
+        if self._loaded:
+            self._autoscaler.start()
+
+    def get_batch_server(self) -> Optional["BatchInferenceServer"]:
+        """Lấy BatchInferenceServer (None nếu chưa bật chế độ batch)"""
+        return self._batch_server
     
     def _load_pool(self):
         """Load pool of models (lazy loading, thread-safe)"""
@@ -85,24 +236,28 @@ class ModelPool:
             # Bắt đầu load pool
             self._loading = True
             try:
-                logger.info(f"🤖 Loading model pool ({self._pool_size} models)...")
+                logger.info(f"🤖 Loading model pool ({self._pool_size} slots, shared weights)...")
 
                 # Load processor (shared, chỉ 1 lần)
-                logger.info("📥 Loading processor...")
-                self._processor = Wav2Vec2Processor.from_pretrained(self._model_id)
-                logger.info("✅ Processor loaded")
-
-                # Load pool of models
-                for i in range(self._pool_size):
-                    logger.info(f"📥 Loading model {i+1}/{self._pool_size}...")
-                    model = Wav2Vec2ForCTC.from_pretrained(self._model_id).to(self._device)
-                    self._model_pool.append(model)
-                    self._model_queue.put(model)  # Add to available queue
-                    logger.info(f"✅ Model {i+1}/{self._pool_size} loaded")
+                if self._processor is None:
+                    logger.info("📥 Loading processor...")
+                    self._processor = Wav2Vec2Processor.from_pretrained(self._model_id)
+                    logger.info("✅ Processor loaded")
+
+                # Load weights 1 lần (from_pretrained đọc safetensors qua mmap),
+                # các slot chỉ là quyền chạy forward đồng thời trên cùng model
+                logger.info(f"📥 Loading shared {self._model_format} model...")
+                model = load_stt_model(self._model_id, self._device, self._model_format, pool_size=self._pool_size)
+                if isinstance(model, torch.nn.Module):
+                    model.requires_grad_(False)
+                self._model = model
+                logger.info("✅ Shared model loaded")
 
                 self._loaded = True
+                if self._autoscaler is not None:
+                    self._autoscaler.start()
                 logger.info(f"🎉 Model pool loaded successfully!")
-                logger.info(f"   - {self._pool_size} models on {self._device}")
+                logger.info(f"   - 1 {self._model_format} model x {self._pool_size} slots on {self._device}")
                 logger.info(f"   - Ready to serve {self._pool_size * 7} concurrent requests efficiently")
 
             except Exception as e:
@@ -126,29 +281,193 @@ class ModelPool:
         if not self._loaded:
             self._load_pool()
 
-        # Lấy model từ queue (blocking nếu không có model available)
+        # Chiếm 1 slot (blocking nếu tất cả slot đang bận)
         start_wait = time.time()
-        model = self._model_queue.get()  # Block until a model is available
+        with self._slot_cond:
+            while self._busy_slots >= self._pool_size:
+                self._slot_cond.wait()
+            self._busy_slots += 1
         wait_time = time.time() - start_wait
 
         # Update statistics
         self._total_requests += 1
         self._total_wait_time += wait_time
+        self.record_thread_wait(wait_time)
 
         if wait_time > 0.1:  # Log nếu phải đợi lâu
             logger.debug(f"⏳ Waited {wait_time:.3f}s for model (queue was full)")
 
-        return self._processor, model, self._device
+        return self._processor, self._model, self._device
+
+    def record_thread_wait(self, seconds: float):
+        """Cộng dồn thời gian chờ model của thread hiện tại"""
+        self._thread_wait.seconds = getattr(self._thread_wait, "seconds", 0.0) + seconds
+
+    def pop_thread_wait(self) -> float:
+        """Lấy và reset thời gian chờ model (slot, batch queue, worker process) mà thread hiện tại đã tích lũy"""
+        seconds = getattr(self._thread_wait, "seconds", 0.0)
+        self._thread_wait.seconds = 0.0
+        return seconds
 
     def release_model(self, model: Wav2Vec2ForCTC):
         """
-        Trả model về pool sau khi dùng xong
+        Trả slot về pool sau khi dùng xong
 
         Args:
-            model: Model cần trả về pool
+            model: Model đã lấy từ get_model()
+        """
+        with self._slot_cond:
+            self._busy_slots -= 1
+            self._slot_cond.notify()
+
+    def transcribe(self, speech: np.ndarray, return_logits: bool = False):
+        """
+        Speech-to-text cho 1 đoạn audio PCM 16kHz mono theo backend hiện tại
+
+        Args:
+            speech: Audio float32 đã resample về 16kHz
+            return_logits: Trả thêm CTC logits [frames, vocab] (cho keyword spotting)
+
+        Returns:
+            Text đã decode, hoặc Tuple[text, logits] nếu return_logits=True
+        """
+        if self._backend == "batch":
+            text, logits = self._batch_server.transcribe(speech, return_logits=True)
+        elif self._backend == "process":
+            start_wait = time.time()
+            worker = self._process_pool.get_model()
+            self.record_thread_wait(time.time() - start_wait)
+            try:
+                text, logits = worker.transcribe(speech, return_logits=return_logits)
+            finally:
+                self._process_pool.release_model(worker)
+        else:
+            processor, model, device = self.get_model()
+            try:
+                input_values = processor(speech, return_tensors="pt", sampling_rate=SAMPLE_RATE).input_values.to(device)
+                with torch.inference_mode():
+                    logits = model(input_values).logits
+                text = greedy_ctc_decode(processor, logits)[0]
+                logits = logits[0].cpu().numpy()
+            finally:
+                self.release_model(model)
+
+        return (text, logits) if return_logits else text
+
+    def transcribe_streaming(self, speech: np.ndarray,
+                             chunk_seconds: float = STREAMING_CHUNK_SECONDS,
+                             overlap_seconds: float = STREAMING_OVERLAP_SECONDS,
+                             min_confidence: float = STREAMING_MIN_CONFIDENCE) -> dict:
         """
-        self._model_queue.put(model)
+        Speech-to-text theo từng cửa sổ tăng dần, dừng sớm khi keyword spotting đã chắc chắn
+
+        Mỗi bước chạy model trên phần audio mới (kèm overlap_seconds audio trước đó làm context),
+        bỏ các frame thuộc phần overlap rồi nối logits. Sau mỗi bước chạy keyword spotting trên
+        các frame mới + phần đuôi đủ dài cho cụm từ khóa dài nhất (cụm kết thúc ở bước trước đã được
+        spot rồi); nếu khớp 1 nhãn từ khóa với confidence >= min_confidence thì dừng.
+
+        Returns:
+            Dict: text, logits, audio_seconds (độ dài audio), processed_seconds (audio đã thực sự chạy model),
+            early_exit (True nếu dừng sớm → text/logits chỉ là 1 phần audio)
+        """
+        spotter = self.get_keyword_spotter()
+        chunk = max(FRAME_SAMPLES, int(chunk_seconds * SAMPLE_RATE) // FRAME_SAMPLES * FRAME_SAMPLES)
+        overlap = int(overlap_seconds * SAMPLE_RATE) // FRAME_SAMPLES * FRAME_SAMPLES
+        tail_frames = spotter.max_phrase_tokens * STREAMING_FRAMES_PER_TOKEN
+
+        pieces: List[np.ndarray] = []
+        processed = 0
+        end = 0
+        early_exit = False
+        while end < len(speech):
+            start = max(0, end - overlap)
+            new_end = min(len(speech), end + chunk)
+            _, window_logits = self.transcribe(speech[start:new_end], return_logits=True)
+            processed += new_end - start
+
+            # Bỏ các frame của phần overlap (đã có trong cửa sổ trước)
+            new_frames = window_logits[(end - start) // FRAME_SAMPLES:]
+            pieces.append(new_frames)
+            end = new_end
+
+            if end < len(speech):
+                # Chỉ spot frame mới + đuôi của các bước trước (không chấm lại toàn bộ logits mỗi bước)
+                recent = [new_frames]
+                needed = tail_frames
+                for piece in reversed(pieces[:-1]):
+                    if needed <= 0:
+                        break
+                    recent.insert(0, piece[-needed:])
+                    needed -= len(piece)
+                label_index, confidence, _ = spotter.spot(np.concatenate(recent))
+                if label_index < len(spotter.keyword_labels) and confidence >= min_confidence:
+                    early_exit = True
+                    break
+
+        logits = np.concatenate(pieces) if pieces else np.zeros((0, 0), dtype=np.float32)
+        text = self._processor.decode(logits.argmax(axis=-1)) if len(logits) else ""
+
+        audio_seconds = len(speech) / SAMPLE_RATE
+        processed_seconds = processed / SAMPLE_RATE
+        self._streaming_requests += 1
+        self._streaming_early_exits += int(early_exit)
+        self._streaming_audio_seconds += audio_seconds
+        self._streaming_processed_seconds += processed_seconds
+
+        return {
+            "text": text,
+            "logits": logits,
+            "audio_seconds": audio_seconds,
+            "processed_seconds": processed_seconds,
+            "early_exit": early_exit,
+        }
+
+    def get_keyword_spotter(self) -> CTCKeywordSpotter:
+        """Lấy CTCKeywordSpotter (lazy, dùng tokenizer của processor; tạo lại khi bộ từ khóa được reload)"""
+        rules = get_keyword_rules()
+        spotter = self._keyword_spotter
+        if spotter is None or spotter.rules is not rules:
+            with self._pool_lock:
+                if self._processor is None:
+                    self._processor = Wav2Vec2Processor.from_pretrained(self._model_id)
+                spotter = self._keyword_spotter
+                if spotter is None or spotter.rules is not rules:
+                    spotter = CTCKeywordSpotter(self._processor.tokenizer, rules=rules)
+                    self._keyword_spotter = spotter
+        return spotter
     
+    def warm_up(self, progress_callback: Optional[Callable[[str], None]] = None) -> float:
+        """
+        Load model và chạy 1 lượt inference giả (im lặng 1 giây) theo backend hiện tại,
+        để cuộc gọi STT đầu tiên có độ trễ như lúc chạy ổn định
+
+        Args:
+            progress_callback: Hàm nhận message tiến trình (vd: cập nhật loading dialog)
+
+        Returns:
+            Thời gian warm-up (giây)
+        """
+        def report(message: str):
+            logger.info(message)
+            if progress_callback:
+                progress_callback(message)
+
+        start = time.time()
+        silence = np.zeros(SAMPLE_RATE, dtype=np.float32)
+
+        if self._backend == "process":
+            report(f"📥 Đang khởi động {self._pool_size} STT worker processes...")
+            self._process_pool.warm_up(silence)
+        else:
+            report(f"📥 Đang load STT model ({self._model_format}, {self._device})...")
+            self._load_pool()
+            report("🔥 Đang warm-up STT model...")
+            self.transcribe(silence)
+
+        elapsed = time.time() - start
+        report(f"✅ STT model sẵn sàng ({elapsed:.1f}s)")
+        return elapsed
+
     def is_loaded(self) -> bool:
         """Kiểm tra xem pool đã được load chưa"""
         return self._loaded
@@ -164,35 +483,48 @@ class ModelPool:
     def get_statistics(self) -> dict:
         """Lấy thống kê sử dụng pool"""
         avg_wait = self._total_wait_time / self._total_requests if self._total_requests > 0 else 0
-        return {
+        stats = {
             "pool_size": self._pool_size,
+            "backend": self._backend,
+            "model_format": self._model_format,
             "total_requests": self._total_requests,
             "total_wait_time": self._total_wait_time,
             "avg_wait_time": avg_wait,
-            "available_models": self._model_queue.qsize(),
-            "busy_models": self._pool_size - self._model_queue.qsize()
+            "available_models": max(0, self._pool_size - self._busy_slots),
+            "busy_models": self._busy_slots
         }
+        if self._batch_server is not None:
+            stats["batching"] = self._batch_server.get_statistics()
+        if self._autoscaler is not None:
+            stats["autoscaler"] = self._autoscaler.get_statistics()
+        if self._process_pool is not None:
+            stats["process_pool"] = self._process_pool.get_statistics()
+        if self._streaming_requests > 0:
+            stats["streaming"] = {
+                "total_requests": self._streaming_requests,
+                "early_exits": self._streaming_early_exits,
+                "audio_seconds": self._streaming_audio_seconds,
+                "processed_seconds": self._streaming_processed_seconds,
+                "processed_ratio": self._streaming_processed_seconds / self._streaming_audio_seconds
+                if self._streaming_audio_seconds > 0 else 0,
+            }
+        return stats
 
     def unload_pool(self):
         """Giải phóng toàn bộ pool khỏi memory (nếu cần)"""
         with self._pool_lock:
-            # Clear models
-            for model in self._model_pool:
-                del model
-            self._model_pool.clear()
-
-            # Clear queue
-            while not self._model_queue.empty():
-                try:
-                    self._model_queue.get_nowait()
-                except:
-                    break
+            # Clear shared model
+            self._model = None
 
             # Clear processor
             if self._processor is not None:
                 del self._processor
                 self._processor = None
 
+            # Dừng worker processes nếu đang dùng backend "process"
+            if self._process_pool is not None:
+                self._process_pool.shutdown()
+
             # Clear CUDA cache nếu đang dùng GPU
             if self._device == "cuda":
                 torch.cuda.empty_cache()
@@ -228,9 +560,370 @@ class ModelContext:
         return False
 
 
+class _BatchRequest:
+    """Một request STT đang chờ trong BatchInferenceServer"""
+
+    __slots__ = ("speech", "future", "enqueued_at", "started_at")
+
+    def __init__(self, speech: np.ndarray):
+        self.speech = speech
+        self.future: Future = Future()
+        self.enqueued_at = time.time()
+        self.started_at: Optional[float] = None  # Lúc batch chứa request bắt đầu chạy model
+
+
+class BatchInferenceServer:
+    """
+    Dynamic micro-batching cho STT
+
+    Thay vì mỗi GSM instance mượn nguyên 1 model để chạy batch size 1:
+    - Request từ mọi instance được đưa vào 1 queue chung
+    - Mỗi worker (1 worker / model trong pool) gom request trong tối đa max_wait_ms
+      hoặc đến khi đủ max_batch_size
+    - Audio được chia theo length bucket, pad về cùng độ dài bucket
+    - Chạy 1 forward pass cho cả batch + greedy CTC decode
+    - Trả kết quả qua Future riêng của từng request
+    """
+
+    DEFAULT_BUCKETS = (2.0, 4.0, 8.0, 16.0)  # giây
+
+    def __init__(self, pool: ModelPool, max_batch_size: int = 8, max_wait_ms: float = 5.0,
+                 bucket_seconds: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self._pool = pool
+        self._queue: Queue = Queue()
+        self._workers: List[threading.Thread] = []
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stop_flag = False
+        self.configure(max_batch_size=max_batch_size, max_wait_ms=max_wait_ms, bucket_seconds=bucket_seconds)
+
+        # Statistics
+        self._total_requests = 0
+        self._total_batches = 0
+        self._total_queue_wait = 0.0
+        self._total_inference_time = 0.0
+        self._max_queue_depth = 0
+
+    def configure(self, max_batch_size: Optional[int] = None, max_wait_ms: Optional[float] = None,
+                  bucket_seconds: Optional[Tuple[float, ...]] = None):
+        """Cập nhật các tham số batching (có hiệu lực từ batch tiếp theo)"""
+        if max_batch_size is not None:
+            if max_batch_size < 1:
+                raise ValueError("max_batch_size phải >= 1")
+            self.max_batch_size = max_batch_size
+        if max_wait_ms is not None:
+            self.max_wait_ms = max(0.0, float(max_wait_ms))
+        if bucket_seconds is not None:
+            self._bucket_lengths = sorted(int(sec * SAMPLE_RATE) for sec in bucket_seconds)
+
+    def submit(self, speech: np.ndarray) -> Future:
+        """Đưa 1 đoạn audio vào queue, trả về Future chứa Tuple[text, logits]"""
+        return self._enqueue(speech).future
+
+    def _enqueue(self, speech: np.ndarray) -> _BatchRequest:
+        self._ensure_started()
+        request = _BatchRequest(np.asarray(speech, dtype=np.float32))
+        self._queue.put(request)
+
+        depth = self._queue.qsize()
+        if depth > self._max_queue_depth:
+            self._max_queue_depth = depth
+        return request
+
+    def transcribe(self, speech: np.ndarray, timeout: Optional[float] = None, return_logits: bool = False):
+        """Submit và đợi kết quả (blocking). Trả về text, hoặc Tuple[text, logits] nếu return_logits=True"""
+        request = self._enqueue(speech)
+        text, logits = request.future.result(timeout=timeout)
+        if request.started_at is not None:
+            self._pool.record_thread_wait(request.started_at - request.enqueued_at)
+        return (text, logits) if return_logits else text
+
+    def _ensure_started(self):
+        """Khởi động worker threads (lazy, 1 worker / slot trong pool)"""
+        if self._workers:
+            return
+        with self._start_lock:
+            if self._workers:
+                return
+            self._stop_flag = False
+            self._add_workers(self._pool.get_pool_size())
+            logger.info(f"🚀 BatchInferenceServer started: {len(self._workers)} workers, "
+                        f"max_batch={self.max_batch_size}, max_wait={self.max_wait_ms}ms")
+
+    def _add_workers(self, count: int):
+        """Thêm worker threads cho đủ count (gọi khi đang giữ _start_lock)"""
+        for i in range(len(self._workers), count):
+            worker = threading.Thread(target=self._worker_loop, name=f"STTBatchWorker-{i}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def ensure_workers(self, count: int):
+        """
+        Đảm bảo có ít nhất count worker (khi pool được mở rộng)
+
+        Note:
+            - Khi pool thu nhỏ, worker thừa chỉ block ở get_model() nên không cần dừng
+        """
+        with self._start_lock:
+            if self._workers and count > len(self._workers):
+                self._add_workers(count)
+
+    def stop(self):
+        """Dừng worker threads (các request còn trong queue bị hủy)"""
+        self._stop_flag = True
+        for worker in self._workers:
+            worker.join(timeout=5)
+        self._workers = []
+
+        while True:
+            try:
+                request = self._queue.get_nowait()
+            except Empty:
+                break
+            request.future.cancel()
+
+    def _collect_batch(self) -> List[_BatchRequest]:
+        """Lấy request đầu tiên rồi gom thêm trong tối đa max_wait_ms"""
+        try:
+            first = self._queue.get(timeout=0.5)
+        except Empty:
+            return []
+
+        batch = [first]
+        deadline = time.time() + self.max_wait_ms / 1000.0
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.time()
+            try:
+                if remaining <= 0:
+                    batch.append(self._queue.get_nowait())
+                else:
+                    batch.append(self._queue.get(timeout=remaining))
+            except Empty:
+                break
+        return batch
+
+    def _bucket_length(self, num_samples: int) -> int:
+        """Độ dài pad cho 1 đoạn audio (bucket nhỏ nhất đủ chứa, hoặc làm tròn lên 1 giây)"""
+        for length in self._bucket_lengths:
+            if num_samples <= length:
+                return length
+        return -(-num_samples // SAMPLE_RATE) * SAMPLE_RATE
+
+    def _worker_loop(self):
+        """Vòng lặp của 1 worker: gom batch → chia bucket → chạy"""
+        while not self._stop_flag:
+            batch = self._collect_batch()
+            if not batch:
+                continue
+
+            batch = [r for r in batch if r.future.set_running_or_notify_cancel()]
+            buckets: Dict[int, List[_BatchRequest]] = {}
+            for request in batch:
+                buckets.setdefault(self._bucket_length(len(request.speech)), []).append(request)
+
+            for bucket_len, requests in buckets.items():
+                try:
+                    outputs = self._run_batch(requests, bucket_len)
+                    for request, output in zip(requests, outputs):
+                        request.future.set_result(output)
+                except Exception as e:
+                    logger.error(f"❌ Batch inference failed ({len(requests)} requests): {e}")
+                    for request in requests:
+                        request.future.set_exception(e)
+
+    def _run_batch(self, requests: List[_BatchRequest], bucket_len: int) -> List[Tuple[str, np.ndarray]]:
+        """Chạy 1 forward pass cho các request cùng bucket, trả về (text, logits) cho từng request"""
+        now = time.time()
+        queue_wait = sum(now - r.enqueued_at for r in requests)
+
+        processor, model, device = self._pool.get_model()
+        try:
+            start = time.time()
+            for request in requests:
+                request.started_at = start
+
+            # Normalize từng đoạn riêng rồi zero-pad về độ dài bucket
+            padded = np.zeros((len(requests), bucket_len), dtype=np.float32)
+            lengths = []
+            for row, request in enumerate(requests):
+                values = processor(request.speech, sampling_rate=SAMPLE_RATE).input_values[0]
+                padded[row, :len(values)] = values
+                lengths.append(len(values))
+
+            input_values = torch.from_numpy(padded).to(device)
+            with torch.inference_mode():
+                logits = model(input_values).logits
+
+            # Cắt bỏ các frame thuộc phần pad trước khi decode
+            frame_lengths = model._get_feat_extract_output_lengths(torch.tensor(lengths)).tolist()
+            logits = logits.cpu()
+            predicted_ids = torch.argmax(logits, dim=-1)
+            outputs = [
+                (processor.decode(predicted_ids[row, :int(n)]), logits[row, :int(n)].numpy())
+                for row, n in enumerate(frame_lengths)
+            ]
+
+            inference_time = time.time() - start
+        finally:
+            self._pool.release_model(model)
+
+        with self._stats_lock:
+            self._total_requests += len(requests)
+            self._total_batches += 1
+            self._total_queue_wait += queue_wait
+            self._total_inference_time += inference_time
+
+        return outputs
+
+    def get_statistics(self) -> dict:
+        """Lấy thống kê batching"""
+        with self._stats_lock:
+            batches = self._total_batches
+            requests = self._total_requests
+            return {
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait_ms,
+                "workers": len(self._workers),
+                "queue_depth": self._queue.qsize(),
+                "max_queue_depth": self._max_queue_depth,
+                "total_requests": requests,
+                "total_batches": batches,
+                "total_queue_wait": self._total_queue_wait,
+                "avg_batch_size": requests / batches if batches > 0 else 0,
+                "avg_queue_wait": self._total_queue_wait / requests if requests > 0 else 0,
+                "avg_batch_inference_time": self._total_inference_time / batches if batches > 0 else 0,
+            }
+
+
+class PoolAutoscaler:
+    """
+    Tự động điều chỉnh pool size giữa [min_size, max_size]
+
+    Mỗi interval giây:
+    - avg wait (trong khoảng vừa qua) > grow_wait, hoặc queue còn >= grow_depth request / slot, và còn đủ RAM → thêm 1 slot
+    - avg wait < shrink_wait, queue rỗng và có slot rảnh → bớt 1 slot
+    - avg wait: backend "batch" = thời gian request nằm trong queue của BatchInferenceServer
+      (batch worker giữ sẵn slot nên thời gian chờ slot luôn ~0); backend "direct" = thời gian chờ mượn slot
+    - max_size mặc định = số CPU (số thread / slot do ModelPool.set_pool_size chia lại)
+    """
+
+    SLOT_MEMORY_BYTES = 512 * 1024 * 1024  # RAM ước lượng cho activations của 1 forward pass (15s audio)
+
+    def __init__(self, pool: ModelPool, min_size: int = 1, max_size: Optional[int] = None,
+                 interval: float = 10.0, grow_wait: float = 0.5, shrink_wait: float = 0.05, grow_depth: float = 1.0):
+        self._pool = pool
+        self._cpu_count = os.cpu_count() or 1
+        self.min_size = max(1, min_size)
+        self.max_size = max(self.min_size, max_size or self._cpu_count)
+        self.interval = interval
+        self.grow_wait = grow_wait
+        self.shrink_wait = shrink_wait
+        self.grow_depth = grow_depth
+
+        self._thread: Optional[threading.Thread] = None
+        self._stop_event = threading.Event()
+        self._last_requests = 0
+        self._last_wait_time = 0.0
+        self._last_avg_wait = 0.0
+        self._last_queue_depth = 0
+        self._resize_count = 0
+
+    def start(self):
+        """Khởi động thread autoscaler (nếu chưa chạy)"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="PoolAutoscaler", daemon=True)
+        self._thread.start()
+        logger.info(f"📈 PoolAutoscaler started: size {self.min_size}-{self.max_size}, {self._cpu_count} CPUs")
+
+    def stop(self):
+        """Dừng thread autoscaler"""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval + 1)
+        self._thread = None
+
+    def _available_memory(self) -> Optional[int]:
+        """RAM còn trống (None nếu không đo được)"""
+        try:
+            import psutil
+            return psutil.virtual_memory().available
+        except ImportError:
+            pass
+        try:
+            return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+        except (ValueError, OSError, AttributeError):
+            return None
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                self.step()
+            except Exception as e:
+                logger.error(f"❌ PoolAutoscaler error: {e}")
+
+    def step(self) -> int:
+        """Đánh giá 1 lần và resize nếu cần. Trả về pool size mới"""
+        stats = self._pool.get_statistics()
+        batching = stats.get("batching") if stats["backend"] == "batch" else None
+        if batching is not None:
+            total_requests, total_wait = batching["total_requests"], batching["total_queue_wait"]
+            queue_depth = batching["queue_depth"]
+        else:
+            total_requests, total_wait = stats["total_requests"], stats["total_wait_time"]
+            queue_depth = 0
+        requests = total_requests - self._last_requests
+        wait_time = total_wait - self._last_wait_time
+        self._last_requests = total_requests
+        self._last_wait_time = total_wait
+        self._last_queue_depth = queue_depth
+
+        size = stats["pool_size"]
+        if requests <= 0 and queue_depth == 0:
+            return size
+
+        avg_wait = wait_time / requests if requests > 0 else 0.0
+        self._last_avg_wait = avg_wait
+        backlog = queue_depth >= self.grow_depth * size
+
+        new_size = size
+        if (avg_wait > self.grow_wait or backlog) and size < self.max_size:
+            available = self._available_memory()
+            if available is None or available > self.SLOT_MEMORY_BYTES:
+                new_size = size + 1
+            else:
+                logger.info(f"⚠️ Không tăng pool size: RAM còn {available // (1024 * 1024)}MB")
+        elif (avg_wait < self.shrink_wait and queue_depth == 0 and size > self.min_size
+              and stats["busy_models"] < size - 1):
+            new_size = size - 1
+
+        if new_size != size:
+            logger.info(f"📈 Autoscale pool: {size} → {new_size} (avg wait {avg_wait:.3f}s, queue {queue_depth})")
+            self._pool.set_pool_size(new_size)
+            self._resize_count += 1
+        return new_size
+
+    def get_statistics(self) -> dict:
+        """Lấy thống kê autoscaler"""
+        return {
+            "min_size": self.min_size,
+            "max_size": self.max_size,
+            "cpu_count": self._cpu_count,
+            "threads_per_slot": torch.get_num_threads(),
+            "last_avg_wait": self._last_avg_wait,
+            "last_queue_depth": self._last_queue_depth,
+            "resize_count": self._resize_count,
+        }
+
+
 # Singleton instance
 model_manager = ModelPool()
-model_manager.set_pool_size(4)  # 4 models cho 30 instances
+model_manager.set_pool_size(POOL_SIZE)  # Pool size ban đầu, PoolAutoscaler điều chỉnh khi chạy
+model_manager.set_model_format(STT_MODEL_FORMAT)
+model_manager.set_backend(STT_BACKEND, **STT_BACKEND_OPTIONS.get(STT_BACKEND, {}))
+if POOL_AUTOSCALE and STT_BACKEND != "process":
+    model_manager.enable_autoscaling(min_size=POOL_MIN_SIZE, max_size=POOL_MAX_SIZE)
 
 def get_model_context():
     """Helper function để lấy context manager"""
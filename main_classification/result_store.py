@@ -0,0 +1,341 @@
+"""
+Result store - Ghi kết quả ngay khi từng cuộc gọi xong (theo lô / row group) ra các sink dạng bảng
+
+- SQLite (luôn bật): kho chính, đọc được trong lúc đang chạy; file Excel được xuất từ đây khi cần
+- CSV / Parquet (tùy chọn, GSM_RESULT_SINKS="csv,parquet"): chỉ ghi nối tiếp cho hệ thống khác đọc.
+  Parquet cần pyarrow; mỗi lần flush là 1 row group, footer chỉ được ghi khi đóng store
+
+Mỗi lần bắt đầu xử lý tạo 1 bộ file results/run_<thời gian>.{sqlite3,csv,parquet}
+
+Usage:
+    sqlite3 results/run_20250101_080000.sqlite3 "SELECT result, COUNT(*) FROM results GROUP BY result"
+    python result_store.py results/run_20250101_080000.sqlite3          # thống kê theo nhãn
+"""
+
+import argparse
+import json
+import logging
+import os
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+# Cấu hình (override bằng biến môi trường)
+RESULT_STORE_ENABLED = os.environ.get("GSM_RESULT_STORE", "1") == "1"
+RESULT_DIR = os.environ.get("GSM_RESULT_DIR", "results")
+RESULT_SINKS = [s.strip() for s in os.environ.get("GSM_RESULT_SINKS", "csv").split(",") if s.strip()]
+ROW_GROUP_SIZE = int(os.environ.get("GSM_RESULT_ROW_GROUP", "200"))
+FLUSH_SECONDS = float(os.environ.get("GSM_RESULT_FLUSH_SECONDS", "5"))
+
+# Cột của CSV / Parquet (SQLite lưu thêm nguyên dict dạng JSON)
+COLUMNS = ["recorded_at", "port", "phone_number", "result", "reason", "transcribed_text",
+           "confidence", "audio_seconds", "processed_seconds"]
+FLOAT_COLUMNS = {"confidence", "audio_seconds", "processed_seconds"}
+READ_BATCH = 500
+
+
+class ResultSink(ABC):
+    """Sink nhận từng lô kết quả (rows có đủ COLUMNS + "data" là dict gốc)"""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    @abstractmethod
+    def write_rows(self, rows: List[Dict]):
+        """Ghi 1 lô kết quả"""
+
+    def close(self):
+        pass
+
+
+class CSVSink(ResultSink):
+    """CSV UTF-8, header ở dòng đầu, mỗi lô được nối vào cuối file"""
+
+    def write_rows(self, rows: List[Dict]):
+        import pandas as pd
+
+        frame = pd.DataFrame([{col: row.get(col) for col in COLUMNS} for row in rows], columns=COLUMNS)
+        frame.to_csv(self.path, mode="a", header=not os.path.exists(self.path), index=False, encoding="utf-8")
+
+
+class ParquetSink(ResultSink):
+    """Parquet, mỗi lô là 1 row group"""
+
+    def __init__(self, path: str):
+        super().__init__(path)
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ValueError("Cần cài pyarrow để ghi Parquet (pip install pyarrow)")
+        self._pa = pa
+        self._schema = pa.schema([(col, pa.float64() if col in FLOAT_COLUMNS else pa.string()) for col in COLUMNS])
+        self._writer = pq.ParquetWriter(path, self._schema)
+
+    def write_rows(self, rows: List[Dict]):
+        import pandas as pd
+
+        frame = pd.DataFrame([{col: row.get(col) for col in COLUMNS} for row in rows], columns=COLUMNS)
+        for col in COLUMNS:
+            if col in FLOAT_COLUMNS:
+                frame[col] = pd.to_numeric(frame[col], errors="coerce")
+            else:
+                frame[col] = frame[col].astype(object).where(frame[col].notna(), None)
+        self._writer.write_table(self._pa.Table.from_pandas(frame, schema=self._schema, preserve_index=False))
+
+    def close(self):
+        self._writer.close()
+
+
+class SQLiteSink(ResultSink):
+    """Kho chính: đọc / tra cứu / sửa nhãn được trong lúc đang ghi (WAL)"""
+
+    def __init__(self, path: str):
+        super().__init__(path)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            " seq INTEGER PRIMARY KEY AUTOINCREMENT, recorded_at TEXT, port TEXT, phone_number TEXT,"
+            " result TEXT, reason TEXT, transcribed_text TEXT, confidence REAL, audio_seconds REAL,"
+            " processed_seconds REAL, data TEXT NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS idx_results_phone ON results (phone_number)")
+        self._db.commit()
+
+    def write_rows(self, rows: List[Dict]):
+        values = [tuple(row.get(col) for col in COLUMNS) + (json.dumps(row["data"], ensure_ascii=False),)
+                  for row in rows]
+        with self._lock:
+            self._db.executemany(
+                f"INSERT INTO results ({', '.join(COLUMNS)}, data) VALUES ({', '.join('?' * (len(COLUMNS) + 1))})",
+                values,
+            )
+            self._db.commit()
+
+    def update(self, result: Dict):
+        """Ghi lại nhãn của 1 số (bản ghi mới nhất), vd: sau khi phân loại lại theo từ khóa mới"""
+        with self._lock:
+            self._db.execute(
+                "UPDATE results SET result = ?, confidence = ?, data = ? WHERE seq ="
+                " (SELECT MAX(seq) FROM results WHERE phone_number = ?)",
+                (result.get("result"), result.get("confidence"), json.dumps(result, ensure_ascii=False),
+                 result.get("phone_number")),
+            )
+            self._db.commit()
+
+    def _query(self, sql: str, params=()) -> Iterator[tuple]:
+        """Đọc bằng kết nối riêng (WAL) → không chặn luồng ghi trong lúc xuất file lớn"""
+        db = sqlite3.connect(self.path)
+        try:
+            cursor = db.execute(sql, params)
+            while True:
+                batch = cursor.fetchmany(READ_BATCH)
+                if not batch:
+                    break
+                yield from batch
+        finally:
+            db.close()
+
+    def iter_results(self) -> Iterator[Dict]:
+        for (data,) in self._query("SELECT data FROM results ORDER BY seq"):
+            yield json.loads(data)
+
+    def labels(self) -> List[str]:
+        return [label for (label,) in self._query("SELECT DISTINCT result FROM results")]
+
+    def phone_numbers(self) -> Set[str]:
+        return {phone for (phone,) in self._query("SELECT phone_number FROM results")}
+
+    def count_by_label(self) -> Dict[str, int]:
+        return dict(self._query("SELECT result, COUNT(*) FROM results GROUP BY result ORDER BY COUNT(*) DESC"))
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+class ResultSnapshot:
+    """
+    Ảnh chụp kho SQLite tại 1 thời điểm (1 read transaction trên kết nối riêng, WAL)
+
+    Kết quả ghi / sửa nhãn sau thời điểm chụp không hiện ra → xuất file nhất quán
+    mà không khóa luồng ghi. Các lần đọc phải tuần tự (1 kết nối)
+    """
+
+    def __init__(self, path: str):
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.isolation_level = None
+        self._db.execute("BEGIN")
+        self.count = self._db.execute("SELECT COUNT(*) FROM results").fetchone()[0]  # Bắt đầu snapshot
+
+    def _query(self, sql: str, params=()) -> Iterator[tuple]:
+        cursor = self._db.execute(sql, params)
+        while True:
+            batch = cursor.fetchmany(READ_BATCH)
+            if not batch:
+                break
+            yield from batch
+
+    def iter_results(self, labels: Optional[List[Optional[str]]] = None) -> Iterator[Dict]:
+        """Kết quả theo thứ tự ghi (labels: chỉ lấy các nhãn này, lọc bằng SQL thay vì decode cả bảng)"""
+        if labels is None:
+            query = self._query("SELECT data FROM results ORDER BY seq")
+        else:
+            named = [label for label in labels if label is not None]
+            conditions = [f"result IN ({', '.join('?' * len(named))})"] if named else []
+            if None in labels:
+                conditions.append("result IS NULL")
+            if not conditions:
+                return
+            query = self._query(f"SELECT data FROM results WHERE {' OR '.join(conditions)} ORDER BY seq", named)
+        for (data,) in query:
+            yield json.loads(data)
+
+    def labels(self) -> List[str]:
+        return [label for (label,) in self._query("SELECT DISTINCT result FROM results")]
+
+    def phone_numbers(self) -> Set[str]:
+        return {phone for (phone,) in self._query("SELECT phone_number FROM results")}
+
+    def close(self):
+        try:
+            self._db.execute("COMMIT")
+        finally:
+            self._db.close()
+
+
+SINK_TYPES = {"csv": (CSVSink, ".csv"), "parquet": (ParquetSink, ".parquet")}
+
+
+class ResultStore:
+    """
+    Gom kết quả theo lô (ROW_GROUP_SIZE hoặc FLUSH_SECONDS) rồi ghi ra mọi sink
+
+    append() chỉ thêm vào buffer → thread gọi điện không bị chặn bởi I/O
+    """
+
+    def __init__(self, directory: str = RESULT_DIR, run_name: Optional[str] = None, sinks: List[str] = None,
+                 row_group_size: int = ROW_GROUP_SIZE, flush_seconds: float = FLUSH_SECONDS):
+        os.makedirs(directory, exist_ok=True)
+        run_name = run_name or f"run_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+        self.base_path = os.path.join(directory, run_name)
+        self.row_group_size = max(1, row_group_size)
+        self.flush_seconds = flush_seconds
+
+        self.db = SQLiteSink(self.base_path + ".sqlite3")
+        self.sinks: List[ResultSink] = [self.db]
+        for name in (RESULT_SINKS if sinks is None else sinks):
+            if name not in SINK_TYPES:
+                logger.warning(f"⚠️ Sink không hỗ trợ: {name} (chọn {', '.join(SINK_TYPES)})")
+                continue
+            sink_class, extension = SINK_TYPES[name]
+            try:
+                self.sinks.append(sink_class(self.base_path + extension))
+            except ValueError as e:
+                logger.warning(f"⚠️ Bỏ qua sink {name}: {e}")
+
+        self._buffer: List[Dict] = []
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()  # Giữ thứ tự các lô khi flush từ nhiều thread
+        self._written = 0
+        self._closed = threading.Event()
+        self._flusher = threading.Thread(target=self._flush_loop, name="ResultStoreFlush", daemon=True)
+        self._flusher.start()
+
+    @property
+    def paths(self) -> List[str]:
+        return [sink.path for sink in self.sinks]
+
+    def append(self, result: Dict, port: str = ""):
+        """Thêm 1 kết quả (chụp lại dict tại thời điểm gọi)"""
+        data = dict(result)
+        row = {col: data.get(col) for col in COLUMNS}
+        row["recorded_at"] = datetime.now().isoformat(timespec="seconds")
+        row["port"] = port
+        row["data"] = data
+        with self._lock:
+            self._buffer.append(row)
+            full = len(self._buffer) >= self.row_group_size
+        if full:
+            self.flush()
+
+    def flush(self):
+        with self._write_lock:
+            with self._lock:
+                rows, self._buffer = self._buffer, []
+            if not rows:
+                return
+            for sink in self.sinks:
+                try:
+                    sink.write_rows(rows)
+                except Exception as e:
+                    # Lỗi ghi file không được làm hỏng cuộc gọi; SQLite vẫn giữ kết quả nếu sink phụ lỗi
+                    logger.error(f"❌ Lỗi ghi kết quả ra {sink.path}: {e}")
+            self._written += len(rows)
+
+    def _flush_loop(self):
+        while not self._closed.wait(self.flush_seconds):
+            self.flush()
+
+    def iter_results(self) -> Iterator[Dict]:
+        self.flush()
+        return self.db.iter_results()
+
+    def labels(self) -> List[str]:
+        self.flush()
+        return self.db.labels()
+
+    def phone_numbers(self) -> Set[str]:
+        self.flush()
+        return self.db.phone_numbers()
+
+    def update(self, result: Dict):
+        self.flush()
+        self.db.update(result)
+
+    def snapshot(self) -> ResultSnapshot:
+        """Ghi nốt buffer rồi chụp kho SQLite (nhớ close() sau khi đọc xong)"""
+        self.flush()
+        return ResultSnapshot(self.db.path)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._written + len(self._buffer)
+
+    def close(self):
+        if self._closed.is_set():
+            return
+        self._closed.set()
+        self.flush()
+        for sink in self.sinks:
+            try:
+                sink.close()
+            except Exception as e:
+                logger.error(f"❌ Lỗi đóng {sink.path}: {e}")
+
+    def get_statistics(self) -> dict:
+        return {"paths": self.paths, "written": self._written, "buffered": len(self._buffer)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Thống kê nhãn trong file kết quả SQLite")
+    parser.add_argument("path", help="File results/run_*.sqlite3")
+    args = parser.parse_args()
+
+    db = SQLiteSink(args.path)
+    counts = db.count_by_label()
+    total = sum(counts.values())
+    for label, count in counts.items():
+        print(f"{label:<20}{count:>8}{count / total * 100:>8.1f}%")
+    print(f"{'Tổng':<20}{total:>8}")
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,522 @@
+"""
+Serial capture - Ghi lại toàn bộ traffic TX/RX của từng cổng GSM ra file nhị phân và phát lại (replay) offline
+Dùng để tái hiện lỗi ngoài hiện trường (tải file chậm, mất +COLP...) và làm micro-benchmark đường parse AT / tải file
+
+Bật ghi (opt-in):
+    GSM_SERIAL_CAPTURE=1 python main_gui.py          # ghi vào captures/<port>_<time>.gcap
+
+Định dạng file .gcap:
+    MAGIC, sau đó các record: <kind:u8><delta_us:u32><length:u32><payload>
+    kind: META (json), OPEN (json baudrate), TX, RX, DISCARD (byte bị reset_input_buffer bỏ đi), CLOSE
+
+Usage:
+    python serial_capture.py captures/COM5_20251018_101500.gcap --info
+    python serial_capture.py captures/COM5_20251018_101500.gcap --dump | less
+    python serial_capture.py captures/COM5_20251018_101500.gcap --replay --virtual --repeat 20
+    python serial_capture.py captures/COM5_20251018_101500.gcap --replay --speed 4
+"""
+
+import argparse
+import atexit
+import json
+import logging
+import os
+import re
+import struct
+import tempfile
+import threading
+import time
+from collections import deque
+from contextlib import nullcontext
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Cấu hình (override bằng biến môi trường)
+SERIAL_CAPTURE_ENABLED = os.environ.get("GSM_SERIAL_CAPTURE", "0") == "1"
+SERIAL_CAPTURE_DIR = os.environ.get("GSM_SERIAL_CAPTURE_DIR", "captures")
+SERIAL_CAPTURE_MAX_MB = float(os.environ.get("GSM_SERIAL_CAPTURE_MAX_MB", "200"))  # Xoay file khi vượt quá
+
+MAGIC = b"GSMCAP\x01\n"
+RECORD_HEADER = struct.Struct("<BII")
+
+META, OPEN, TX, RX, DISCARD, CLOSE = range(6)
+KIND_NAMES = {META: "META", OPEN: "OPEN", TX: "TX", RX: "RX", DISCARD: "DISCARD", CLOSE: "CLOSE"}
+
+# Event sau khi đọc file: (kind, thời điểm tính từ đầu file (s), payload)
+CaptureEvent = Tuple[int, float, bytes]
+
+
+class CaptureWriter:
+    """Ghi record vào 1 file .gcap (thread-safe), dùng chung cho mọi lần kết nối lại của 1 cổng"""
+
+    def __init__(self, port: str, directory: str = SERIAL_CAPTURE_DIR, max_bytes: int = None):
+        self.port = port
+        self.directory = directory
+        self.max_bytes = max_bytes if max_bytes is not None else int(SERIAL_CAPTURE_MAX_MB * 1024 * 1024)
+        self._lock = threading.Lock()
+        self._file = None
+        self._last_ns = 0
+        self._written = 0
+        self.path = None
+        self._open_file()
+
+    def _open_file(self):
+        os.makedirs(self.directory, exist_ok=True)
+        safe_port = re.sub(r"[^\w.-]", "_", self.port)
+        self.path = os.path.join(self.directory, f"{safe_port}_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}.gcap")
+        self._file = open(self.path, "wb")
+        self._file.write(MAGIC)
+        self._last_ns = time.perf_counter_ns()
+        self._written = len(MAGIC)
+        meta = {"port": self.port, "started_at": datetime.now().isoformat(timespec="milliseconds")}
+        self._write_record(META, json.dumps(meta).encode())
+        logger.info(f"📼 Đang ghi traffic {self.port} → {self.path}")
+
+    def _write_record(self, kind: int, payload: bytes):
+        now_ns = time.perf_counter_ns()
+        delta_us = min((now_ns - self._last_ns) // 1000, 0xFFFFFFFF)
+        # Giữ phần lẻ < 1µs để tổng thời gian không bị trôi
+        self._last_ns += delta_us * 1000
+        self._file.write(RECORD_HEADER.pack(kind, delta_us, len(payload)))
+        self._file.write(payload)
+        self._written += RECORD_HEADER.size + len(payload)
+
+    def write(self, kind: int, payload: bytes = b""):
+        with self._lock:
+            if self._file is None:
+                return
+            if self._written > self.max_bytes and kind == OPEN:
+                # Chỉ xoay file ở ranh giới kết nối để mỗi file replay được độc lập
+                self._file.close()
+                self._open_file()
+            self._write_record(kind, payload)
+            if kind in (OPEN, CLOSE, DISCARD):
+                self._file.flush()
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+_writers: Dict[str, CaptureWriter] = {}
+_writers_lock = threading.Lock()
+
+
+def get_capture_writer(port: str) -> CaptureWriter:
+    """Lấy writer của cổng (tạo mới nếu chưa có)"""
+    with _writers_lock:
+        writer = _writers.get(port)
+        if writer is None:
+            writer = CaptureWriter(port)
+            _writers[port] = writer
+        return writer
+
+
+@atexit.register
+def close_all_captures():
+    with _writers_lock:
+        for writer in _writers.values():
+            writer.close()
+        _writers.clear()
+
+
+class CaptureSerial:
+    """
+    Bọc serial.Serial, ghi lại mọi byte ghi/đọc; các thuộc tính khác chuyển thẳng xuống serial thật
+
+    reset_input_buffer() đọc hết byte đang chờ trước khi xóa và ghi thành DISCARD
+    → thấy được các dòng unsolicited (vd: +COLP) bị code bỏ qua
+    """
+
+    def __init__(self, ser, port: str, writer: Optional[CaptureWriter] = None):
+        self._ser = ser
+        self._writer = writer or get_capture_writer(port)
+        self._writer.write(OPEN, json.dumps({"baudrate": ser.baudrate}).encode())
+
+    def write(self, data: bytes) -> int:
+        self._writer.write(TX, bytes(data))
+        return self._ser.write(data)
+
+    def read(self, size: int = 1) -> bytes:
+        data = self._ser.read(size)
+        if data:
+            self._writer.write(RX, data)
+        return data
+
+    def reset_input_buffer(self):
+        waiting = self._ser.in_waiting
+        if waiting:
+            data = self._ser.read(waiting)
+            if data:
+                self._writer.write(DISCARD, data)
+        self._ser.reset_input_buffer()
+
+    def close(self):
+        self._writer.write(CLOSE)
+        self._ser.close()
+
+    def __getattr__(self, name):
+        return getattr(self._ser, name)
+
+
+def wrap_serial(ser, port: str):
+    """Bọc serial nếu GSM_SERIAL_CAPTURE=1, ngược lại trả về nguyên serial"""
+    if not SERIAL_CAPTURE_ENABLED:
+        return ser
+    try:
+        return CaptureSerial(ser, port)
+    except OSError as e:
+        logger.warning(f"⚠️ Không ghi được traffic {port}: {e}")
+        return ser
+
+
+def read_capture(path: str) -> Tuple[dict, List[CaptureEvent]]:
+    """Đọc file .gcap → (meta, danh sách event). File bị cắt cụt (process bị kill) vẫn đọc được phần đầu"""
+    with open(path, "rb") as f:
+        content = f.read()
+    if not content.startswith(MAGIC):
+        raise ValueError(f"{path} không phải file capture")
+
+    meta: dict = {}
+    events: List[CaptureEvent] = []
+    offset = len(MAGIC)
+    elapsed_us = 0
+    while offset + RECORD_HEADER.size <= len(content):
+        kind, delta_us, length = RECORD_HEADER.unpack_from(content, offset)
+        offset += RECORD_HEADER.size
+        payload = content[offset:offset + length]
+        if len(payload) < length:
+            break
+        offset += length
+        elapsed_us += delta_us
+        if kind == META:
+            meta.update(json.loads(payload))
+        else:
+            events.append((kind, elapsed_us / 1e6, payload))
+    return meta, events
+
+
+# ==================== Replay ====================
+
+class VirtualClock:
+    """
+    Đồng hồ ảo thay cho module time khi replay: sleep() chỉ cộng thời gian, không chờ thật
+    → replay nhanh và tất định (kết quả không phụ thuộc tải máy)
+    """
+
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def time(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float):
+        self.now += max(0.0, seconds)
+
+    def __getattr__(self, name):
+        return getattr(time, name)
+
+
+class ReplaySerial:
+    """
+    Serial giả phát lại 1 file capture
+
+    - Mỗi lần code ghi (write) được ghép với TX tiếp theo trong file; các RX/DISCARD sau TX đó
+      được trả ra theo đúng độ trễ đã ghi (chia cho speed) tính từ lúc write
+    - TX khác với file ghi → lưu vào mismatches (strict=True thì raise)
+    """
+
+    def __init__(self, events: List[CaptureEvent], clock=time, speed: float = 1.0, strict: bool = False):
+        self._events = events
+        self._clock = clock
+        self.speed = speed
+        self.strict = strict
+        self._index = 0
+        self._pending: deque = deque()  # [due, bytes]
+        self._available = bytearray()
+        self.is_open = True
+        self.baudrate = next((json.loads(p)["baudrate"] for k, _, p in events if k == OPEN), 115200)
+        self.mismatches: List[Tuple[bytes, bytes]] = []
+        self.tx_bytes = 0
+        self.rx_bytes = 0
+
+        # RX trước TX đầu tiên (vd: URC sau khi mở cổng) có sẵn ngay
+        self._schedule_after(-1, self._events[0][1] if self._events else 0.0)
+
+    def _schedule_after(self, tx_index: int, tx_time: float):
+        now = self._clock.time()
+        i = tx_index + 1
+        while i < len(self._events) and self._events[i][0] != TX:
+            kind, event_time, payload = self._events[i]
+            if kind in (RX, DISCARD) and payload:
+                self._pending.append([now + max(0.0, event_time - tx_time) / self.speed, payload])
+            i += 1
+        self._index = i
+
+    def _release(self):
+        now = self._clock.time()
+        while self._pending and self._pending[0][0] <= now:
+            self._available += self._pending.popleft()[1]
+
+    def write(self, data: bytes) -> int:
+        data = bytes(data)
+        self.tx_bytes += len(data)
+        if self._index >= len(self._events):
+            self.mismatches.append((data, b""))
+            if self.strict:
+                raise RuntimeError(f"Replay hết dữ liệu nhưng code vẫn gửi {data!r}")
+            return len(data)
+
+        _, tx_time, expected = self._events[self._index]
+        if data != expected:
+            self.mismatches.append((data, expected))
+            if self.strict:
+                raise RuntimeError(f"TX khác bản ghi: gửi {data!r}, bản ghi {expected!r}")
+        self._schedule_after(self._index, tx_time)
+        return len(data)
+
+    @property
+    def in_waiting(self) -> int:
+        self._release()
+        return len(self._available)
+
+    def read(self, size: int = 1) -> bytes:
+        self._release()
+        data = bytes(self._available[:size])
+        del self._available[:size]
+        self.rx_bytes += len(data)
+        return data
+
+    def reset_input_buffer(self):
+        self._release()
+        self._available.clear()
+
+    def reset_output_buffer(self):
+        pass
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.is_open = False
+
+    @property
+    def finished(self) -> bool:
+        return self._index >= len(self._events) and not self._pending
+
+
+def command_script(events: List[CaptureEvent]) -> List[Tuple[str, float]]:
+    """
+    Danh sách lệnh AT đã gửi kèm wait_time ước lượng cho send_command
+
+    send_command: ghi lệnh → sleep(w) → đọc thêm w+2 giây → lệnh tiếp theo, nên khoảng cách
+    giữa 2 TX ≈ 2w + 2 → w ≈ (gap - 2) / 2
+    """
+    tx_events = [(t, p) for k, t, p in events if k == TX]
+    script = []
+    for i, (t, payload) in enumerate(tx_events):
+        gap = tx_events[i + 1][0] - t if i + 1 < len(tx_events) else 4.0
+        wait_time = max(0.1, round((gap - 2.0) / 2.0, 1))
+        script.append((payload.decode(errors="ignore").strip(), wait_time))
+    return script
+
+
+def _command_name(command: str) -> str:
+    match = re.match(r"(AT[+&]?[A-Z]*\??|ATD|ATH|AT)", command.upper())
+    return match.group(1) if match else command[:10]
+
+
+class _ClockPatch:
+    """Thay module time của gsm_instance bằng VirtualClock trong lúc replay"""
+
+    def __init__(self, module, clock):
+        self.module = module
+        self.clock = clock
+        self._original = None
+
+    def __enter__(self):
+        self._original = self.module.time
+        self.module.time = self.clock
+        return self.clock
+
+    def __exit__(self, *exc):
+        self.module.time = self._original
+
+
+def replay_capture(path: str, speed: float = 1.0, virtual: bool = False, wait_time: Optional[float] = None,
+                   strict: bool = False) -> dict:
+    """
+    Phát lại file capture qua đúng code của GSMInstance (send_command + _download_file_via_qfread)
+
+    Args:
+        speed: hệ số tăng tốc độ trễ đã ghi (1 = như thực tế)
+        virtual: dùng đồng hồ ảo (không sleep thật, tất định)
+        wait_time: override wait_time cho send_command (mặc định ước lượng từ file)
+
+    Returns:
+        Thống kê thời gian theo loại lệnh, tải file và số TX không khớp
+    """
+    import gsm_instance as gsm_module
+    from gsm_instance import GSMInstance
+
+    meta, events = read_capture(path)
+    clock = VirtualClock() if virtual else time
+    replay = ReplaySerial(events, clock=clock, speed=speed, strict=strict)
+
+    instance = GSMInstance(meta.get("port", "REPLAY"))
+    instance.serial_connection = replay
+    instance.is_connected = True
+
+    per_command: Dict[str, List[float]] = {}
+    downloads = []
+    script = command_script(events)
+    tmp_dir = tempfile.mkdtemp(prefix="gsm_replay_")
+
+    with _ClockPatch(gsm_module, clock) if virtual else nullcontext():
+        i = 0
+        while i < len(script):
+            command, recorded_wait = script[i]
+            name = _command_name(command)
+
+            if name == "AT+QFLST":
+                remote_name = re.search(r'"([^"]+)"', command)
+                remote_name = remote_name.group(1) if remote_name else "replay.amr"
+                local_path = os.path.join(tmp_dir, os.path.basename(remote_name))
+                wall_start, clock_start = time.perf_counter(), clock.time()
+                ok = instance._download_file_via_qfread(remote_name, local_path)
+                size = os.path.getsize(local_path) if os.path.exists(local_path) else 0
+                downloads.append({
+                    "file": remote_name,
+                    "ok": ok,
+                    "bytes": size,
+                    "wall_time": time.perf_counter() - wall_start,
+                    "replayed_time": clock.time() - clock_start,
+                })
+                # Bỏ qua các lệnh QF* mà hàm tải file đã tự gửi
+                i += 1
+                while i < len(script) and _command_name(script[i][0]) in ("AT+QFOPEN", "AT+QFREAD", "AT+QFCLOSE"):
+                    i += 1
+                continue
+
+            wall_start = time.perf_counter()
+            instance.send_command(command, wait_time=wait_time if wait_time is not None else recorded_wait)
+            per_command.setdefault(name, []).append(time.perf_counter() - wall_start)
+            i += 1
+
+    instance.logger.handlers.clear()
+    return {
+        "file": path,
+        "port": meta.get("port"),
+        "commands": {name: {"count": len(times), "wall_time": sum(times)} for name, times in per_command.items()},
+        "downloads": downloads,
+        "mismatches": len(replay.mismatches),
+        "first_mismatch": [m.decode(errors="replace") for m in replay.mismatches[0]] if replay.mismatches else None,
+        "tx_bytes": replay.tx_bytes,
+        "rx_bytes": replay.rx_bytes,
+    }
+
+
+# ==================== CLI ====================
+
+def summarize_capture(events: List[CaptureEvent]) -> dict:
+    """Tóm tắt file capture: thời lượng, số byte, histogram lệnh, tốc độ QFREAD thực tế"""
+    commands: Dict[str, int] = {}
+    rx_bytes = discard_bytes = tx_bytes = 0
+    qfread_bytes, qfread_time = 0, 0.0
+    discarded_urcs: Dict[str, int] = {}
+
+    for i, (kind, t, payload) in enumerate(events):
+        if kind == TX:
+            tx_bytes += len(payload)
+            name = _command_name(payload.decode(errors="ignore").strip())
+            commands[name] = commands.get(name, 0) + 1
+            if name == "AT+QFREAD":
+                end = next((e[1] for e in events[i + 1:] if e[0] == TX), t)
+                qfread_bytes += sum(len(e[2]) for e in events[i + 1:] if e[0] == RX and e[1] <= end)
+                qfread_time += end - t
+        elif kind == RX:
+            rx_bytes += len(payload)
+        elif kind == DISCARD:
+            discard_bytes += len(payload)
+            for urc in re.findall(rb"\+([A-Z]+):", payload):
+                key = urc.decode()
+                discarded_urcs[key] = discarded_urcs.get(key, 0) + 1
+
+    return {
+        "duration": events[-1][1] if events else 0.0,
+        "events": len(events),
+        "connections": sum(1 for e in events if e[0] == OPEN),
+        "tx_bytes": tx_bytes,
+        "rx_bytes": rx_bytes,
+        "discarded_bytes": discard_bytes,
+        "discarded_urcs": discarded_urcs,
+        "commands": commands,
+        "qfread_kbps": qfread_bytes / 1024 / qfread_time if qfread_time > 0 else None,
+    }
+
+
+def dump_capture(events: List[CaptureEvent], max_payload: int = 200):
+    """In timeline dạng text"""
+    for kind, t, payload in events:
+        text = payload.decode("utf-8", errors="replace").replace("\r", "\\r").replace("\n", "\\n")
+        if len(text) > max_payload:
+            text = f"{text[:max_payload]}... (+{len(payload) - max_payload} bytes)"
+        print(f"{t:12.6f}  {KIND_NAMES.get(kind, kind):<7}  {text}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Xem / phát lại file capture traffic serial")
+    parser.add_argument("path", help="File .gcap")
+    mode = parser.add_mutually_exclusive_group(required=True)
+    mode.add_argument("--info", action="store_true", help="Tóm tắt file capture")
+    mode.add_argument("--dump", action="store_true", help="In toàn bộ timeline")
+    mode.add_argument("--replay", action="store_true", help="Phát lại qua code GSMInstance")
+    parser.add_argument("--speed", type=float, default=1.0, help="Hệ số tăng tốc khi replay")
+    parser.add_argument("--virtual", action="store_true", help="Dùng đồng hồ ảo (không sleep thật, tất định)")
+    parser.add_argument("--wait", type=float, help="Override wait_time của send_command")
+    parser.add_argument("--repeat", type=int, default=1, help="Số lần replay (micro-benchmark)")
+    parser.add_argument("--strict", action="store_true", help="Dừng ngay khi TX khác bản ghi")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    meta, events = read_capture(args.path)
+
+    if args.info:
+        print(f"📼 {args.path} ({meta.get('port')}, bắt đầu {meta.get('started_at')})")
+        print(json.dumps(summarize_capture(events), ensure_ascii=False, indent=2))
+        return
+    if args.dump:
+        dump_capture(events)
+        return
+
+    runs = []
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        report = replay_capture(args.path, speed=args.speed, virtual=args.virtual, wait_time=args.wait,
+                                strict=args.strict)
+        report["total_wall_time"] = time.perf_counter() - start
+        runs.append(report)
+
+    report = runs[-1]
+    print(f"🔁 Replay {args.path}: {report['tx_bytes']} bytes TX, {report['rx_bytes']} bytes RX, "
+          f"{report['mismatches']} TX không khớp")
+    for name, stats in sorted(report["commands"].items()):
+        print(f"   {name:<12} x{stats['count']:<5} {stats['wall_time'] * 1000:10.1f} ms")
+    for download in report["downloads"]:
+        speed_kbps = download["bytes"] / 1024 / download["wall_time"] if download["wall_time"] > 0 else 0
+        print(f"   📥 {download['file']}: {download['bytes']} bytes, {download['wall_time'] * 1000:.1f} ms "
+              f"({speed_kbps:.0f} KB/s, thời gian replay {download['replayed_time']:.2f}s)")
+    if report["first_mismatch"]:
+        sent, expected = report["first_mismatch"]
+        print(f"   ⚠️ TX đầu tiên không khớp: gửi {sent!r}, bản ghi {expected!r}")
+
+    walls = sorted(r["total_wall_time"] for r in runs)
+    print(f"⏱️ {len(runs)} lần: min {walls[0] * 1000:.1f} ms, median {walls[len(walls) // 2] * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -4,6 +4,7 @@ import subprocess
 from pathlib import Path
 import time
 
+import numpy as np
 import torch
 import librosa
 import soundfile as sf
@@ -25,6 +26,14 @@ def convert_to_wav(in_file, out_file):
     print(f"[INFO] Converted {in_file} -> {out_file}")
 
 
+def load_audio_pcm(in_file):
+    """Decode file audio (.amr/.wav/...) thẳng ra PCM float32 16kHz mono (không qua file wav tạm)"""
+    audio = AudioSegment.from_file(in_file)
+    audio = audio.set_frame_rate(16000).set_channels(1).set_sample_width(2)
+    samples = np.array(audio.get_array_of_samples(), dtype=np.float32)
+    return samples / 32768.0
+
+
 # --------------------  Wav2Vec2 --------------------
 def transcribe_wav2vec2(wav_file):
     print("\n[Running Wav2Vec2]...")
@@ -1,3 +1,12 @@
+import logging
+import os
+import threading
+import time
+import unicodedata
+from typing import Callable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
 labels = [
     "leave_message",
     "be_blocked",
@@ -51,24 +60,440 @@ keyword_labels = [
 
 MAX_WAITING_TONE = 8
 
+# Nhãn đặc biệt không có từ khóa, luôn nằm sau các nhãn từ khóa trong `labels`
+SPECIAL_LABELS = ["ringback_tone", "waiting_tone", "mute"]
+
+# Fuzzy matching khi không khớp chính xác (override bằng GSM_FUZZY_MATCH=0 / GSM_FUZZY_MAX_ERROR_RATE)
+USE_FUZZY_MATCHING = os.environ.get("GSM_FUZZY_MATCH", "1") == "1"
+FUZZY_MAX_ERROR_RATE = float(os.environ.get("GSM_FUZZY_MAX_ERROR_RATE", "0.1"))
+# Cụm từ ngắn hơn chỉ khớp chính xác: "không đúng" bỏ dấu = "không dùng", "khóa" = "khoa"
+FUZZY_MIN_PHRASE_LENGTH = 12
+
+
+class KeywordMatcher:
+    """
+    Aho–Corasick automaton cho toàn bộ keyword_labels
+
+    - Build 1 lần, quét text 1 lượt O(len(text)) bất kể số lượng từ khóa
+    - Giữ nguyên thứ tự ưu tiên như vòng lặp cũ: nhãn có index nhỏ nhất có từ khóa xuất hiện sẽ thắng
+    """
+
+    def __init__(self, label_names, label_keywords):
+        self.labels = list(label_names)
+        self._mute = self.labels.index("mute")
+        self._waiting_tone = self.labels.index("waiting_tone")
+        self._ringback_tone = self.labels.index("ringback_tone")
+
+        # goto[state][char] -> state, out[state] = index nhãn nhỏ nhất kết thúc tại state (kể cả qua fail link)
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [None]
+
+        for label_index, keywords in enumerate(label_keywords):
+            for keyword in keywords:
+                state = 0
+                for ch in keyword.lower():
+                    nxt = self._goto[state].get(ch)
+                    if nxt is None:
+                        nxt = len(self._goto)
+                        self._goto[state][ch] = nxt
+                        self._goto.append({})
+                        self._fail.append(0)
+                        self._out.append(None)
+                    state = nxt
+                if self._out[state] is None or label_index < self._out[state]:
+                    self._out[state] = label_index
+
+        # BFS để dựng fail links, đồng thời gộp transitions của fail state vào từng state
+        # → DFA đầy đủ: mỗi ký tự chỉ cần 1 lần tra dict, không phải đi lùi theo fail link khi quét
+        self._delta = [dict(self._goto[0])] + [None] * (len(self._goto) - 1)
+        queue = list(self._goto[0].values())
+        for state in queue:
+            self._delta[state] = {**self._delta[self._fail[state]], **self._goto[state]} if state else self._delta[0]
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fail = self._fail[state]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[nxt] = self._goto[fail].get(ch, 0)
+                inherited = self._out[self._fail[nxt]]
+                if inherited is not None and (self._out[nxt] is None or inherited < self._out[nxt]):
+                    self._out[nxt] = inherited
+
+    def find_label(self, text: str):
+        """Index nhãn ưu tiên cao nhất có từ khóa trong text (None nếu không có)"""
+        delta, out = self._delta, self._out
+        best = None
+        state = 0
+        for ch in text:
+            state = delta[state].get(ch, 0)
+            label_index = out[state]
+            if label_index is not None and (best is None or label_index < best):
+                best = label_index
+                if best == 0:
+                    break
+        return best
+
+    def classify(self, input_text: str) -> int:
+        """Giống keyword_in_text: mute / waiting_tone / nhãn từ khóa / ringback_tone"""
+        input_text = input_text.lower()
+        if input_text.strip() == "":
+            return self._mute
+
+        if len(input_text) <= MAX_WAITING_TONE:
+            return self._waiting_tone
+
+        label_index = self.find_label(input_text)
+        return self._ringback_tone if label_index is None else label_index
+
+    def classify_many(self, texts) -> list:
+        """Phân loại hàng loạt transcript"""
+        classify = self.classify
+        return [classify(text) for text in texts]
+
+
+def fold_diacritics(text: str) -> str:
+    """
+    Lowercase + bỏ dấu tiếng Việt, giữ nguyên độ dài (1 ký tự NFC → 1 ký tự)
+    để vị trí khớp trên chuỗi đã bỏ dấu dùng được trực tiếp trên chuỗi gốc
+    """
+    folded = []
+    for ch in unicodedata.normalize("NFC", text.lower()):
+        if ch == "đ":
+            folded.append("d")
+        else:
+            folded.append(unicodedata.normalize("NFD", ch)[0])
+    return "".join(folded)
+
+
+class FuzzyKeywordMatcher:
+    """
+    Tìm gần đúng các cụm trong keyword_labels (edit distance có giới hạn), chịu được thiếu/sai dấu
+
+    - Mỗi cụm từ được biên dịch thành bảng bitmask Peq[char]; quét text bằng thuật toán
+      bit-parallel của Myers: mỗi ký tự chỉ vài phép toán bit trên 1 số nguyên (O(len(text)) mỗi cụm)
+    - Cụm dài L được phép sai tối đa max(1, int(L * max_error_rate)) ký tự; cụm ngắn hơn min_phrase_length bị bỏ qua
+    - Chọn cụm có distance / L nhỏ nhất; hòa thì theo thứ tự ưu tiên nhãn, rồi cụm dài hơn
+    """
+
+    def __init__(self, label_names, label_keywords, max_error_rate: float = FUZZY_MAX_ERROR_RATE,
+                 min_phrase_length: int = FUZZY_MIN_PHRASE_LENGTH, exact_matcher: Optional[KeywordMatcher] = None):
+        self.labels = list(label_names)
+        self.max_error_rate = max_error_rate
+        self._exact = exact_matcher or KeywordMatcher(label_names, label_keywords)
+        self._label_keywords = [[kw.lower() for kw in kws] for kws in label_keywords]
+
+        # (label_index, phrase, độ dài, số lỗi cho phép, Peq)
+        self._patterns = []
+        for label_index, keywords in enumerate(label_keywords):
+            for keyword in keywords:
+                folded = fold_diacritics(keyword)
+                if len(folded) < min_phrase_length:
+                    continue
+                max_errors = max(1, int(len(folded) * max_error_rate))
+                peq = {}
+                for i, ch in enumerate(folded):
+                    peq[ch] = peq.get(ch, 0) | (1 << i)
+                self._patterns.append((label_index, keyword, len(folded), max_errors, peq))
+
+    @staticmethod
+    def _search(peq: dict, length: int, text: str) -> Tuple[int, int]:
+        """
+        Myers bit-parallel: edit distance nhỏ nhất giữa pattern và 1 substring bất kỳ của text
+
+        Returns:
+            Tuple[distance, vị trí kết thúc (exclusive)] của lần khớp tốt nhất đầu tiên
+        """
+        mask = (1 << length) - 1
+        high = 1 << (length - 1)
+        pv, mv = mask, 0
+        score = length
+        best, best_end = length, 0
+        for j, ch in enumerate(text):
+            eq = peq.get(ch, 0)
+            xv = eq | mv
+            xh = (((eq & pv) + pv) ^ pv) | eq
+            ph = mv | (~(xh | pv) & mask)
+            mh = pv & xh
+            if ph & high:
+                score += 1
+            elif mh & high:
+                score -= 1
+            # Không dịch 1 vào ph: text được phép bắt đầu khớp ở bất kỳ vị trí nào
+            ph = (ph << 1) & mask
+            mh = (mh << 1) & mask
+            pv = mh | (~(xv | ph) & mask)
+            mv = ph & xv
+            if score < best:
+                best, best_end = score, j + 1
+                if best == 0:
+                    break
+        return best, best_end
+
+    @staticmethod
+    def _match_start(pattern: str, text: str, end: int, distance: int) -> int:
+        """Tìm vị trí bắt đầu của đoạn text[start:end] có edit distance = distance (đoạn ngắn nhất)"""
+        window_start = max(0, end - len(pattern) - distance)
+        window = text[window_start:end][::-1]
+        reversed_pattern = pattern[::-1]
+        # DP: cột i = số ký tự window đã dùng (tính từ end lùi về), pattern phải khớp hết
+        previous = list(range(len(reversed_pattern) + 1))
+        best_start = window_start
+        for i, ch in enumerate(window, 1):
+            current = [i]
+            for j, pc in enumerate(reversed_pattern, 1):
+                current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ch != pc)))
+            previous = current
+            if previous[-1] <= distance:
+                best_start = end - i
+                break
+        return best_start
+
+    def find(self, text: str) -> Optional[Tuple[int, str, Tuple[int, int], int]]:
+        """
+        Cụm từ khớp gần đúng tốt nhất trong text
+
+        Returns:
+            Tuple[label_index, cụm từ, (start, end) trên text đã lowercase/NFC, distance] hoặc None
+        """
+        folded = fold_diacritics(text)
+        best = None
+        best_key = None
+        for label_index, phrase, length, max_errors, peq in self._patterns:
+            distance, end = self._search(peq, length, folded)
+            if distance > max_errors:
+                continue
+            key = (distance / length, label_index, -length)
+            if best_key is None or key < best_key:
+                best_key = key
+                best = (label_index, phrase, end, distance)
+
+        if best is None:
+            return None
+        label_index, phrase, end, distance = best
+        start = self._match_start(fold_diacritics(phrase), folded, end, distance)
+        return label_index, phrase, (start, end), distance
+
+    def classify(self, input_text: str) -> Tuple[int, Optional[Tuple[int, int]], Optional[int]]:
+        """
+        Giống keyword_in_text nhưng có fallback gần đúng
+
+        Returns:
+            Tuple[label_index, (start, end) của cụm khớp hoặc None, distance (0 = khớp chính xác, None = không khớp)]
+
+        Note:
+            - Khớp chỉ sau khi bỏ dấu (distance trên text bỏ dấu = 0) trả về distance = số ký tự sai dấu,
+              để không bị coi là khớp chính xác
+        """
+        label_index = self._exact.classify(input_text)
+        if label_index < len(self._label_keywords):
+            # Khớp chính xác: lấy span của cụm đầu tiên của nhãn có trong text
+            lowered = input_text.lower()
+            for keyword in self._label_keywords[label_index]:
+                start = lowered.find(keyword)
+                if start >= 0:
+                    return label_index, (start, start + len(keyword)), 0
+        if label_index != self._exact._ringback_tone:
+            return label_index, None, None
+
+        match = self.find(input_text)
+        if match is None:
+            return label_index, None, None
+        label_index, phrase, span, distance = match
+        if distance == 0:
+            matched = unicodedata.normalize("NFC", input_text.lower())[span[0]:span[1]]
+            distance = sum(a != b for a, b in zip(matched, unicodedata.normalize("NFC", phrase.lower())))
+        return label_index, span, distance
+
+
+class KeywordRules:
+    """
+    1 bộ từ khóa đã biên dịch (labels + keyword_labels + matchers), không thay đổi sau khi tạo
+
+    Reload rule = tạo KeywordRules mới rồi set_keyword_rules() thay nguyên khối (1 phép gán),
+    nên các thread đang phân loại không phải dừng và không bao giờ thấy bộ rule "nửa cũ nửa mới".
+    Mỗi lần phân loại chỉ đọc get_keyword_rules() 1 lần để index nhãn và tên nhãn luôn khớp nhau.
+    """
+
+    def __init__(self, label_names, label_keywords, source: Optional[str] = None):
+        label_names = list(label_names)
+        label_keywords = [[str(kw).lower().strip() for kw in kws if str(kw).strip()] for kws in label_keywords]
+
+        missing = [name for name in SPECIAL_LABELS if name not in label_names]
+        if missing:
+            raise ValueError(f"Thiếu nhãn đặc biệt: {', '.join(missing)}")
+        if len(set(label_names)) != len(label_names):
+            raise ValueError("Tên nhãn bị trùng")
+        if len(label_keywords) > len(label_names) or any(
+                name in SPECIAL_LABELS for name in label_names[:len(label_keywords)]):
+            raise ValueError("Nhãn đặc biệt (ringback_tone, waiting_tone, mute) không được có từ khóa")
+
+        self.labels = label_names
+        self.keyword_labels = label_keywords
+        self.source = source
+        self.loaded_at = time.time()
+        self.matcher = KeywordMatcher(label_names, label_keywords)
+        self.fuzzy_matcher = FuzzyKeywordMatcher(label_names, label_keywords, exact_matcher=self.matcher)
+
+    @classmethod
+    def from_dict(cls, data: dict, source: Optional[str] = None) -> "KeywordRules":
+        """
+        Dựng từ dict (nội dung file JSON/YAML):
+            {"rules": [{"label": "leave_message", "keywords": ["để lại lời nhắn", ...]}, ...]}
+        Thứ tự "rules" = thứ tự ưu tiên nhãn; các nhãn đặc biệt tự động được thêm vào cuối
+        """
+        rules = data.get("rules") if isinstance(data, dict) else None
+        if not isinstance(rules, list) or not rules:
+            raise ValueError("File rule phải có danh sách 'rules' không rỗng")
+
+        label_names = []
+        label_keywords = []
+        for rule in rules:
+            if not isinstance(rule, dict) or not rule.get("label") or not isinstance(rule.get("keywords"), list):
+                raise ValueError(f"Rule không hợp lệ: {rule!r}")
+            label_names.append(str(rule["label"]))
+            label_keywords.append(rule["keywords"])
+        return cls(label_names + SPECIAL_LABELS, label_keywords, source=source)
+
+    def same_rules(self, other: Optional["KeywordRules"]) -> bool:
+        """True nếu other có cùng nhãn và cùng từ khóa (theo đúng thứ tự ưu tiên)"""
+        return (other is not None and self.labels == other.labels
+                and self.keyword_labels == other.keyword_labels)
+
+    def to_dict(self) -> dict:
+        """Ngược lại với from_dict (dùng để xuất file rule mẫu)"""
+        return {
+            "rules": [
+                {"label": name, "keywords": list(kws)}
+                for name, kws in zip(self.labels, self.keyword_labels)
+            ]
+        }
+
+    def classify(self, input_text: str, fuzzy: bool = USE_FUZZY_MATCHING) -> Tuple[str, Optional[Tuple[int, int]], Optional[int]]:
+        """
+        Phân loại transcript theo bộ rule này
+
+        Returns:
+            Tuple[tên nhãn, (start, end) của cụm khớp hoặc None, distance hoặc None]
+        """
+        if fuzzy:
+            label_index, span, distance = self.fuzzy_matcher.classify(input_text)
+            return self.labels[label_index], span, distance
+        return self.labels[self.matcher.classify(input_text)], None, None
+
+
+_rules = KeywordRules(labels, keyword_labels)
+_rules_listeners: List[Callable[[KeywordRules], None]] = []
+_rules_lock = threading.Lock()
+
+
+def get_keyword_rules() -> KeywordRules:
+    """Bộ rule đang dùng (snapshot, an toàn để dùng suốt 1 lần phân loại)"""
+    return _rules
+
+
+def set_keyword_rules(rules: KeywordRules):
+    """
+    Thay bộ rule đang dùng (atomic) và báo cho các listener (vd: reclassify kết quả đã thu thập).
+    Bộ rule có cùng nhãn/từ khóa với bộ đang dùng thì bỏ qua
+
+    `labels` / `keyword_labels` của module được cập nhật tại chỗ để code cũ đọc 2 list này thấy rule mới
+    """
+    global _rules
+    with _rules_lock:
+        if rules.same_rules(_rules):
+            # File rule được lưu lại nhưng nội dung không đổi → giữ bộ rule cũ (spotter không phải dựng lại,
+            # không phân loại lại kết quả)
+            logger.info(f"ℹ️ Bộ từ khóa không thay đổi ({rules.source or 'built-in'}), bỏ qua")
+            return
+        _rules = rules
+        labels[:] = rules.labels
+        keyword_labels[:] = rules.keyword_labels
+        listeners = list(_rules_listeners)
+
+    logger.info(f"🔁 Đã áp dụng bộ từ khóa mới: {len(rules.labels)} nhãn, "
+                f"{sum(len(kws) for kws in rules.keyword_labels)} cụm từ ({rules.source or 'built-in'})")
+    for listener in listeners:
+        try:
+            listener(rules)
+        except Exception as e:
+            logger.error(f"❌ Lỗi khi xử lý reload bộ từ khóa: {e}")
+
+
+def add_rules_listener(callback: Callable[[KeywordRules], None]):
+    """Đăng ký callback(rules) được gọi sau mỗi lần set_keyword_rules()"""
+    with _rules_lock:
+        if callback not in _rules_listeners:
+            _rules_listeners.append(callback)
+
+
+def remove_rules_listener(callback: Callable[[KeywordRules], None]):
+    with _rules_lock:
+        if callback in _rules_listeners:
+            _rules_listeners.remove(callback)
+
+
+def classify_text(input_text: str, fuzzy: bool = USE_FUZZY_MATCHING) -> Tuple[str, Optional[Tuple[int, int]], Optional[int]]:
+    """Phân loại theo bộ rule hiện tại, trả về tên nhãn (không bị lệch index khi rule được reload giữa chừng)"""
+    return get_keyword_rules().classify(input_text, fuzzy=fuzzy)
+
+
+def match_confidence(span: Optional[Tuple[int, int]], distance: Optional[int]) -> Optional[float]:
+    """Confidence của lần khớp gần đúng = 1 - tỷ lệ ký tự sai trên đoạn khớp (None nếu khớp chính xác / không khớp)"""
+    if not distance:
+        return None
+    return 1.0 - distance / max(1, span[1] - span[0])
+
+
+def relabel_result(result: dict, rules: Optional[KeywordRules] = None) -> bool:
+    """
+    Phân loại lại 1 kết quả đã có transcript theo bộ rule (vd: sau khi reload từ khóa), sửa tại chỗ
+
+    Mọi kết quả đều được phân loại lại theo text, kể cả nhãn do CTC keyword spotter gán (logits không được lưu,
+    transcript thì luôn có); nhãn và nguồn nhãn lúc gọi được giữ trong previous_result / previous_label_source.
+    Kết quả có trường "matched" (vd: output của bulk_reclassify) được cập nhật cụm khớp mới
+
+    Returns:
+        True nếu nhãn thay đổi
+    """
+    text = result.get("transcribed_text")
+    if not text:
+        return False
+    new_label, span, distance = (rules or get_keyword_rules()).classify(text)
+    if new_label == result.get("result"):
+        return False
+    result.setdefault("previous_result", result.get("result"))
+    result.setdefault("previous_label_source", result.get("label_source"))
+    result["result"] = new_label
+    result["label_source"] = "text"
+    result["confidence"] = match_confidence(span, distance)
+    if "matched" in result:
+        result["matched"] = text[span[0]:span[1]] if span else None
+    return True
+
 
 def keyword_in_text(input_text: str) -> int:
-    input_text = input_text.lower()
-    if input_text.strip() == "":
-        # return index of "mute"
-        return labels.index("mute")
+    return _rules.matcher.classify(input_text)
+
+
+def fuzzy_keyword_in_text(input_text: str) -> Tuple[int, Optional[Tuple[int, int]], Optional[int]]:
+    """
+    Phân loại với fallback gần đúng (sai vài ký tự / thiếu dấu) khi không khớp chính xác
+
+    Returns:
+        Tuple[label_index, (start, end) của cụm khớp hoặc None, distance hoặc None]
+    """
+    return _rules.fuzzy_matcher.classify(input_text)
+
 
-    if len(input_text) <= MAX_WAITING_TONE:
-        # define keyword if needed
-        return labels.index("waiting_tone")
+def find_fuzzy_keyword(input_text: str) -> Optional[Tuple[int, str, Tuple[int, int], int]]:
+    """Cụm từ khớp gần đúng tốt nhất: (label_index, cụm từ, span, distance) hoặc None"""
+    return _rules.fuzzy_matcher.find(input_text)
 
-    for i, kws in enumerate(keyword_labels):
-        for kw in kws:
-            if kw in input_text:
-                return i
 
-    # ringback tone
-    return labels.index("ringback_tone")
+def classify_many(texts) -> list:
+    """Phân loại hàng loạt transcript, trả về list index nhãn"""
+    return _rules.matcher.classify_many(texts)
 
 
 if __name__ == "__main__":
@@ -77,9 +502,13 @@ if __name__ == "__main__":
         "đang tạm khóa khuyên quý khách vui lòng tải lại tàu tích hợp lâm thu hoạch cho biết hết câu của quý ông",
         "xin quý khách vui lòng để lại lời nhắn sau tiếng bíp",
         "đá asdasdkas ada sasjd adasd ấd",
+        "so may quy khach vua goi khong dung",
+        "thuê bao quý khách vừa gọi tạm thời không liên lạc đươc",
     ]
 
     for text in test_texts:
         print(f"Input: {text}")
         print(f"Output: {keyword_in_text(text)} - {labels[keyword_in_text(text)]}")
+        label_index, span, distance = fuzzy_keyword_in_text(text)
+        print(f"Fuzzy: {label_index} - {labels[label_index]} span={span} distance={distance}")
         print()
@@ -0,0 +1,240 @@
+"""
+TranscriptionCache - Cache kết quả STT theo hash nội dung audio
+Lời nhắc của nhà mạng lặp lại gần như y hệt → lần sau chỉ cần tra cache thay vì chạy Wav2Vec2
+- Tầng 1: LRU trong RAM
+- Tầng 2: SQLite trên đĩa (giữ qua các lần chạy), dọn theo dung lượng và tuổi
+- Key gồm hash audio + namespace (model_id, model_format, chế độ STT) → đổi model không đọc nhầm transcript cũ
+"""
+
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Cấu hình (override bằng biến môi trường)
+STT_CACHE_ENABLED = os.environ.get("GSM_STT_CACHE", "1") == "1"
+STT_CACHE_PATH = os.environ.get("GSM_STT_CACHE_PATH", os.path.join("model_cache", "stt_cache.sqlite3"))
+STT_CACHE_PERCEPTUAL = os.environ.get("GSM_STT_CACHE_PERCEPTUAL", "0") == "1"
+
+SILENCE_THRESHOLD = 0.01  # Biên độ dưới ngưỡng này ở 2 đầu audio bị cắt trước khi hash
+ENVELOPE_FRAME = 1600  # 100ms @ 16kHz cho perceptual hash
+ENVELOPE_STEP_DB = 3.0  # Độ phân giải lượng tử hóa năng lượng (dB)
+
+
+def _trim_silence(speech: np.ndarray) -> np.ndarray:
+    """Cắt im lặng 2 đầu (cùng 1 lời nhắc có thể bắt đầu lệch nhau vài trăm ms)"""
+    loud = np.flatnonzero(np.abs(speech) > SILENCE_THRESHOLD)
+    if len(loud) == 0:
+        return speech[:0]
+    return speech[loud[0]:loud[-1] + 1]
+
+
+def content_hash(speech: np.ndarray) -> str:
+    """Hash chính xác của PCM đã chuẩn hóa (cắt im lặng, chuẩn hóa biên độ, lượng tử int16)"""
+    trimmed = _trim_silence(np.asarray(speech, dtype=np.float32))
+    peak = float(np.abs(trimmed).max()) if len(trimmed) else 0.0
+    if peak > 0:
+        trimmed = trimmed / peak
+    pcm = np.round(trimmed * 32767).astype("<i2")
+    return "x:" + hashlib.sha256(pcm.tobytes()).hexdigest()
+
+
+def perceptual_hash(speech: np.ndarray) -> str:
+    """Hash của đường bao năng lượng đã lượng tử (chịu được khác biệt nhỏ về mẫu / biên độ)"""
+    trimmed = _trim_silence(np.asarray(speech, dtype=np.float32))
+    num_frames = len(trimmed) // ENVELOPE_FRAME
+    if num_frames == 0:
+        return "p:empty"
+    frames = trimmed[:num_frames * ENVELOPE_FRAME].reshape(num_frames, ENVELOPE_FRAME)
+    energy_db = 10 * np.log10((frames ** 2).mean(axis=1) + 1e-10)
+    levels = np.clip(np.round((energy_db - energy_db.max()) / ENVELOPE_STEP_DB), -15, 0).astype(np.int8)
+    return "p:" + hashlib.sha1(levels.tobytes()).hexdigest()
+
+
+def cache_namespace(model_id: str, model_format: str, mode: str) -> str:
+    """Namespace của key cache: cùng audio nhưng khác model / format / chế độ STT cho transcript và logits khác nhau"""
+    return f"{model_id}|{model_format}|{mode}"
+
+
+def _pack_logits(logits: Optional[np.ndarray]) -> Optional[bytes]:
+    if logits is None:
+        return None
+    logits = np.asarray(logits, dtype=np.float16)
+    header = np.array(logits.shape, dtype="<i4").tobytes()
+    return zlib.compress(header + logits.tobytes(), 1)
+
+
+def _unpack_logits(blob: Optional[bytes]) -> Optional[np.ndarray]:
+    if blob is None:
+        return None
+    raw = zlib.decompress(blob)
+    shape = tuple(np.frombuffer(raw[:8], dtype="<i4"))
+    return np.frombuffer(raw[8:], dtype=np.float16).reshape(shape).astype(np.float32)
+
+
+class TranscriptionCache:
+    """
+    Cache (text, logits) theo hash nội dung audio
+
+    Usage:
+        namespace = cache_namespace(model_id, model_format, "full")
+        cached = transcription_cache.get(speech, namespace)
+        if cached is None:
+            text, logits = ...  # chạy STT
+            transcription_cache.put(speech, text, logits, namespace)
+    """
+
+    def __init__(self, path: Optional[str] = STT_CACHE_PATH, max_memory_entries: int = 512,
+                 max_disk_bytes: int = 512 * 1024 * 1024, max_age_days: float = 30.0,
+                 use_perceptual: bool = STT_CACHE_PERCEPTUAL):
+        self.path = path
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_bytes = max_disk_bytes
+        self.max_age_seconds = max_age_days * 86400
+        self.use_perceptual = use_perceptual
+
+        self._memory: "OrderedDict[str, Tuple[str, Optional[np.ndarray]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        self._puts_since_prune = 0
+
+        # Statistics
+        self._memory_hits = 0
+        self._disk_hits = 0
+        self._perceptual_hits = 0
+        self._misses = 0
+
+        if path:
+            try:
+                self._open_db(path)
+            except Exception as e:
+                logger.warning(f"⚠️ Không mở được STT cache {path}: {e} - chỉ dùng cache trong RAM")
+                self._db = None
+
+    def _open_db(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS transcripts ("
+            " key TEXT PRIMARY KEY, text TEXT NOT NULL, logits BLOB,"
+            " size INTEGER NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS idx_transcripts_accessed ON transcripts(accessed)")
+        self._db.commit()
+
+    def _keys(self, speech: np.ndarray, namespace: str):
+        keys = [content_hash(speech)]
+        if self.use_perceptual:
+            keys.append(perceptual_hash(speech))
+        return [f"{key}@{namespace}" for key in keys]
+
+    def get(self, speech: np.ndarray, namespace: str = "") -> Optional[Tuple[str, Optional[np.ndarray]]]:
+        """Tra cache trong namespace (xem cache_namespace). Trả về (text, logits) hoặc None nếu miss"""
+        keys = self._keys(speech, namespace)
+        with self._lock:
+            for key in keys:
+                entry = self._memory.get(key)
+                if entry is not None:
+                    self._memory.move_to_end(key)
+                    self._count_hit(key, disk=False)
+                    return entry
+
+            if self._db is not None:
+                for key in keys:
+                    row = self._db.execute("SELECT text, logits FROM transcripts WHERE key = ?", (key,)).fetchone()
+                    if row is not None:
+                        self._db.execute("UPDATE transcripts SET accessed = ? WHERE key = ?", (time.time(), key))
+                        self._db.commit()
+                        entry = (row[0], _unpack_logits(row[1]))
+                        self._remember(key, entry)
+                        self._count_hit(key, disk=True)
+                        return entry
+
+            self._misses += 1
+            return None
+
+    def put(self, speech: np.ndarray, text: str, logits: Optional[np.ndarray] = None, namespace: str = ""):
+        """Lưu kết quả STT (của toàn bộ đoạn audio, không lưu transcript dừng sớm) cho đoạn audio"""
+        entry = (text, None if logits is None else np.asarray(logits, dtype=np.float32))
+        blob = _pack_logits(logits)
+        now = time.time()
+        with self._lock:
+            for key in self._keys(speech, namespace):
+                self._remember(key, entry)
+                if self._db is not None:
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO transcripts (key, text, logits, size, created, accessed)"
+                        " VALUES (?, ?, ?, ?, ?, ?)",
+                        (key, text, blob, len(text.encode("utf-8")) + (len(blob) if blob else 0), now, now)
+                    )
+            if self._db is not None:
+                self._db.commit()
+                self._puts_since_prune += 1
+                if self._puts_since_prune >= 100:
+                    self._prune()
+
+    def _remember(self, key: str, entry: Tuple[str, Optional[np.ndarray]]):
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+    def _count_hit(self, key: str, disk: bool):
+        if key.startswith("p:"):
+            self._perceptual_hits += 1
+        elif disk:
+            self._disk_hits += 1
+        else:
+            self._memory_hits += 1
+
+    def _prune(self):
+        """Xóa entry quá tuổi, rồi xóa entry ít dùng nhất cho đến khi dưới max_disk_bytes"""
+        self._puts_since_prune = 0
+        self._db.execute("DELETE FROM transcripts WHERE accessed < ?", (time.time() - self.max_age_seconds,))
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM transcripts").fetchone()[0]
+        if total > self.max_disk_bytes:
+            excess = total - self.max_disk_bytes
+            removed = 0
+            for key, size in self._db.execute("SELECT key, size FROM transcripts ORDER BY accessed").fetchall():
+                if removed >= excess:
+                    break
+                self._db.execute("DELETE FROM transcripts WHERE key = ?", (key,))
+                removed += size
+        self._db.commit()
+
+    def clear(self):
+        """Xóa toàn bộ cache (RAM + đĩa)"""
+        with self._lock:
+            self._memory.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM transcripts")
+                self._db.commit()
+
+    def get_statistics(self) -> dict:
+        """Lấy thống kê hit rate"""
+        hits = self._memory_hits + self._disk_hits + self._perceptual_hits
+        lookups = hits + self._misses
+        return {
+            "memory_entries": len(self._memory),
+            "memory_hits": self._memory_hits,
+            "disk_hits": self._disk_hits,
+            "perceptual_hits": self._perceptual_hits,
+            "misses": self._misses,
+            "hit_rate": hits / lookups if lookups > 0 else 0,
+        }
+
+
+# Singleton instance
+transcription_cache = TranscriptionCache() if STT_CACHE_ENABLED else None
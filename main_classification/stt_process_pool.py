@@ -0,0 +1,293 @@
+"""
+ProcessModelPool - Chạy STT trong các process riêng để tránh tranh chấp GIL
+Mỗi worker process load model 1 lần, nhận PCM qua multiprocessing.shared_memory
+"""
+
+import logging
+import multiprocessing as mp
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import shared_memory
+from queue import Queue
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_RATE = 16000
+DEFAULT_BUFFER_SECONDS = 30  # Buffer shared memory ban đầu cho mỗi worker
+
+
+def _worker_main(model_id: str, device: str, model_format: str, conn, pool_size: int = 1):
+    """
+    Entry point của worker process (phải ở top-level để dùng được với spawn trên Windows)
+
+    Protocol qua Pipe:
+        → ("transcribe", shm_name, num_samples, return_logits)
+        ← ("ok", text, logits | None) hoặc ("error", message, None)
+        → ("stop",)
+    """
+    import torch
+    from transformers import Wav2Vec2Processor
+    from model_backends import load_stt_model
+
+    processor = Wav2Vec2Processor.from_pretrained(model_id)
+    model = load_stt_model(model_id, device, model_format, pool_size=pool_size)
+    conn.send(("ready", None, None))
+
+    attached: Optional[shared_memory.SharedMemory] = None
+    try:
+        while True:
+            try:
+                message = conn.recv()
+            except EOFError:
+                break
+
+            if message[0] == "stop":
+                break
+
+            _, shm_name, num_samples, return_logits = message
+            try:
+                # Attach lại nếu parent đã cấp buffer mới (audio dài hơn buffer cũ)
+                if attached is None or attached.name != shm_name:
+                    if attached is not None:
+                        attached.close()
+                    attached = shared_memory.SharedMemory(name=shm_name)
+
+                speech = np.ndarray((num_samples,), dtype=np.float32, buffer=attached.buf).copy()
+                input_values = processor(speech, return_tensors="pt", sampling_rate=SAMPLE_RATE).input_values.to(device)
+
+                with torch.no_grad():
+                    logits = model(input_values).logits
+
+                predicted_ids = torch.argmax(logits, dim=-1)
+                text = processor.batch_decode(predicted_ids)[0]
+                conn.send(("ok", text, logits[0].cpu().numpy() if return_logits else None))
+            except Exception as e:
+                conn.send(("error", str(e), None))
+    finally:
+        if attached is not None:
+            attached.close()
+
+
+class STTWorker:
+    """Handle phía parent cho 1 worker process (process + pipe + shared memory buffer)"""
+
+    def __init__(self, index: int, model_id: str, device: str, model_format: str, ctx, pool_size: int = 1):
+        self.index = index
+        self._pool_size = pool_size  # Số worker process chạy đồng thời (chia core cho session onnx)
+        self._model_id = model_id
+        self._device = device
+        self._model_format = model_format
+        self._ctx = ctx
+        self._process = None
+        self._conn = None
+        self._shm: Optional[shared_memory.SharedMemory] = None
+
+    def start(self, timeout: float = 300.0):
+        """Khởi động process và đợi model load xong"""
+        parent_conn, child_conn = self._ctx.Pipe()
+        self._process = self._ctx.Process(
+            target=_worker_main,
+            args=(self._model_id, self._device, self._model_format, child_conn, self._pool_size),
+            name=f"STTWorker-{self.index}",
+            daemon=True
+        )
+        self._process.start()
+        child_conn.close()
+        self._conn = parent_conn
+
+        if not self._conn.poll(timeout):
+            raise RuntimeError(f"STT worker {self.index} không load được model sau {timeout}s")
+        status, _, _ = self._conn.recv()
+        if status != "ready":
+            raise RuntimeError(f"STT worker {self.index} khởi động thất bại")
+
+    def _ensure_buffer(self, num_samples: int):
+        """Cấp (hoặc mở rộng) shared memory đủ chứa num_samples float32"""
+        needed = num_samples * 4
+        if self._shm is not None and self._shm.size >= needed:
+            return
+        if self._shm is not None:
+            self._shm.close()
+            self._shm.unlink()
+        size = max(needed, DEFAULT_BUFFER_SECONDS * SAMPLE_RATE * 4)
+        self._shm = shared_memory.SharedMemory(create=True, size=size)
+
+    def transcribe(self, speech: np.ndarray, return_logits: bool = False) -> Tuple[str, Optional[np.ndarray]]:
+        """
+        Gửi PCM sang worker qua shared memory và đợi kết quả
+
+        Returns:
+            Tuple[text, logits (hoặc None)]
+        """
+        if self._process is None or not self._process.is_alive():
+            logger.warning(f"⚠️ STT worker {self.index} không còn chạy, đang khởi động lại...")
+            self.close()
+            self.start()
+
+        speech = np.ascontiguousarray(speech, dtype=np.float32)
+        self._ensure_buffer(len(speech))
+        np.ndarray((len(speech),), dtype=np.float32, buffer=self._shm.buf)[:] = speech
+
+        self._conn.send(("transcribe", self._shm.name, len(speech), return_logits))
+        status, payload, logits = self._conn.recv()
+        if status != "ok":
+            raise RuntimeError(f"STT worker {self.index}: {payload}")
+        return payload, logits
+
+    def close(self):
+        """Dừng process và giải phóng shared memory"""
+        if self._conn is not None:
+            try:
+                self._conn.send(("stop",))
+            except Exception:
+                pass
+        if self._process is not None:
+            self._process.join(timeout=5)
+            if self._process.is_alive():
+                self._process.terminate()
+        if self._conn is not None:
+            self._conn.close()
+        if self._shm is not None:
+            self._shm.close()
+            self._shm.unlink()
+        self._process = None
+        self._conn = None
+        self._shm = None
+
+
+class ProcessModelPool:
+    """
+    Pool of STT worker processes với API giống ModelPool (get_model/release_model)
+
+    - Inference, feature extraction và decode chạy ngoài interpreter chính
+    - Các thread serial-polling và Tk main loop không bị GIL chặn trong lúc STT
+    """
+
+    def __init__(self, model_id: str, device: str = "cpu", pool_size: int = 4, model_format: str = "fp32"):
+        self._model_id = model_id
+        self._device = device
+        self._pool_size = pool_size
+        self._model_format = model_format
+        self._workers: List[STTWorker] = []
+        self._worker_queue: Queue = Queue()
+        self._pool_lock = threading.Lock()
+        self._loaded = False
+
+        # Statistics
+        self._total_requests = 0
+        self._total_wait_time = 0.0
+
+    def set_model_format(self, model_format: str, device: str):
+        """Set format weights cho các worker (chỉ được gọi trước khi khởi động workers)"""
+        if self._loaded:
+            raise RuntimeError("Không thể thay đổi model_format sau khi đã khởi động STT workers")
+        self._model_format = model_format
+        self._device = device
+
+    def _load_pool(self):
+        """Khởi động worker processes (lazy, thread-safe)"""
+        with self._pool_lock:
+            if self._loaded:
+                return
+
+            logger.info(f"🤖 Starting {self._pool_size} STT worker processes...")
+            # spawn: an toàn với torch và giống hành vi trên Windows
+            ctx = mp.get_context("spawn")
+            try:
+                for i in range(self._pool_size):
+                    worker = STTWorker(i, self._model_id, self._device, self._model_format, ctx, self._pool_size)
+                    worker.start()
+                    self._workers.append(worker)
+                    self._worker_queue.put(worker)
+                    logger.info(f"✅ STT worker {i+1}/{self._pool_size} ready")
+            except Exception as e:
+                logger.error(f"❌ Failed to start STT workers: {e}")
+                self.shutdown()
+                raise
+
+            self._loaded = True
+
+    def get_model(self) -> STTWorker:
+        """Lấy worker từ pool (blocking nếu tất cả đang bận). Phải gọi release_model() sau khi dùng"""
+        if not self._loaded:
+            self._load_pool()
+
+        start_wait = time.time()
+        worker = self._worker_queue.get()
+        wait_time = time.time() - start_wait
+
+        self._total_requests += 1
+        self._total_wait_time += wait_time
+        return worker
+
+    def release_model(self, worker: STTWorker):
+        """Trả worker về pool"""
+        self._worker_queue.put(worker)
+
+    def transcribe(self, speech: np.ndarray, return_logits: bool = False) -> Tuple[str, Optional[np.ndarray]]:
+        """Mượn 1 worker, chạy STT và trả worker về pool"""
+        worker = self.get_model()
+        try:
+            return worker.transcribe(speech, return_logits=return_logits)
+        finally:
+            self.release_model(worker)
+
+    def warm_up(self, speech: np.ndarray):
+        """
+        Khởi động workers và chạy 1 lượt inference trên từng worker (song song)
+
+        Mượn worker qua hàng đợi như request thường (không gửi thẳng vào pipe của worker đang bận),
+        mượn đủ cả pool để mỗi worker chạy đúng 1 lượt. Worker nào lỗi → RuntimeError
+        """
+        if not self._loaded:
+            self._load_pool()
+
+        workers = [self._worker_queue.get() for _ in range(len(self._workers))]
+        errors = []
+        try:
+            with ThreadPoolExecutor(max_workers=len(workers), thread_name_prefix="STTWarmUp") as executor:
+                futures = [(worker, executor.submit(worker.transcribe, speech)) for worker in workers]
+                for worker, future in futures:
+                    try:
+                        future.result()
+                    except Exception as e:
+                        errors.append(f"worker {worker.index}: {e}")
+        finally:
+            for worker in workers:
+                self.release_model(worker)
+
+        if errors:
+            raise RuntimeError(f"Warm-up STT worker thất bại ({'; '.join(errors)})")
+
+    def is_loaded(self) -> bool:
+        """Kiểm tra xem các worker đã được khởi động chưa"""
+        return self._loaded
+
+    def get_statistics(self) -> dict:
+        """Lấy thống kê sử dụng pool"""
+        avg_wait = self._total_wait_time / self._total_requests if self._total_requests > 0 else 0
+        return {
+            "pool_size": self._pool_size,
+            "total_requests": self._total_requests,
+            "total_wait_time": self._total_wait_time,
+            "avg_wait_time": avg_wait,
+            "available_workers": self._worker_queue.qsize(),
+            "busy_workers": len(self._workers) - self._worker_queue.qsize()
+        }
+
+    def shutdown(self):
+        """Dừng tất cả worker processes"""
+        for worker in self._workers:
+            try:
+                worker.close()
+            except Exception as e:
+                logger.error(f"❌ Lỗi khi dừng STT worker {worker.index}: {e}")
+        self._workers.clear()
+        while not self._worker_queue.empty():
+            self._worker_queue.get_nowait()
+        self._loaded = False
+        logger.info("🗑️ STT worker processes stopped")
@@ -0,0 +1,77 @@
+"""
+Test scheduler của job_server (không cần modem / model)
+
+Usage:
+    python -m unittest test_job_server
+"""
+
+import unittest
+
+from job_server import Job, JobManager, LabelHistory, parse_phone_payload
+
+
+class _FakeController:
+    gsm_instances = {}
+
+    def log(self, message):
+        pass
+
+
+def _phones(prefix: str, count: int):
+    return [f"09{prefix}{i:07d}" for i in range(count)]
+
+
+class InterleaveSchedulingTest(unittest.TestCase):
+    def setUp(self):
+        self.manager = JobManager(_FakeController(), mode="interleave", history=LabelHistory(":memory:"))
+
+    def _dispatch(self, count: int):
+        return [self.manager._next_phone()[0].name for _ in range(count)]
+
+    def test_late_job_does_not_starve_running_job(self):
+        self.manager._enqueue(Job(_phones("1", 100), name="first"))
+        self._dispatch(40)
+
+        self.manager._enqueue(Job(_phones("2", 100), name="second"))
+        names = self._dispatch(20)
+
+        # Job đến sau chia đều cổng với job đang chạy, không chiếm hết 40 lượt để "đuổi kịp"
+        self.assertEqual(names.count("first"), 10)
+        self.assertEqual(names.count("second"), 10)
+
+    def test_priority_ratio(self):
+        self.manager._enqueue(Job(_phones("1", 100), name="low", priority=1))
+        self.manager._enqueue(Job(_phones("2", 100), name="high", priority=3))
+        names = self._dispatch(40)
+        self.assertEqual(names.count("high"), 30)
+        self.assertEqual(names.count("low"), 10)
+
+
+class JobNameTest(unittest.TestCase):
+    def test_rejects_unsafe_names(self):
+        for name in ("../x", "a/b", "a\\b", 'a"b', "a\r\nX-Header: 1", "tên"):
+            with self.assertRaises(ValueError):
+                Job(["0900000000"], name=name)
+
+    def test_accepts_plain_names(self):
+        self.assertEqual(Job(["0900000000"], name="ca_sang-2.v1").name, "ca_sang-2.v1")
+        job = Job(["0900000000"])
+        self.assertEqual(job.name, job.id)
+
+
+class PayloadTest(unittest.TestCase):
+    def test_rejects_bad_types(self):
+        for body in (b'{"phones": 5}', b'{"phones": {"a": 1}}', b'{"label_ttl": {"be_blocked": null}}',
+                     b'{"label_ttl": {"be_blocked": "1d"}}', b'{"label_ttl": [1]}'):
+            with self.assertRaises(ValueError):
+                parse_phone_payload(body, "application/json", {})
+
+    def test_accepts_list_and_text(self):
+        params = parse_phone_payload(b'{"phones": "0900000000\\n0900000001", "label_ttl": {"*": 60}}',
+                                     "application/json", {})
+        self.assertEqual(params["phones"], ["0900000000", "0900000001"])
+        self.assertEqual(params["label_ttl"], {"*": 60})
+
+
+if __name__ == "__main__":
+    unittest.main()